@@ -1,15 +1,15 @@
 import abc
 import math
-import struct
 import threading
 import time
-from collections import deque
 import typing as t
 import airpixel.client
 
-import alsaaudio as alsa
 import numpy
 
+from audioviz import sources
+from audioviz.sources import SAMPLE_FORMAT, SAMPLE_SCALE
+
 MS_IN_SECOND = 1000
 SECONDS_IN_MINUTE = 60
 
@@ -43,6 +43,58 @@ class LoopingThread(threading.Thread, abc.ABC):
         self._is_running = False
 
 
+class RingBuffer:
+    """Preallocated float32 ring of the most recent samples.
+
+    Every sample is stored twice, ``length`` apart, so that any window of up to
+    ``length`` samples ending at the write position is one contiguous slice.
+    """
+
+    def __init__(self, length: int, data: t.Optional[numpy.ndarray] = None) -> None:
+        self.length = length
+        if data is None:
+            data = numpy.zeros(2 * length, dtype=numpy.float32)
+        self._data = data
+        self.written = 0
+
+    def clear(self) -> None:
+        self._data.fill(0)
+
+    def _store(self, start: int, samples: numpy.ndarray) -> None:
+        stop = start + len(samples)
+        self._data[start:stop] = samples
+        self._data[start + self.length : stop + self.length] = samples
+
+    def write(self, samples: numpy.ndarray) -> None:
+        skipped = max(len(samples) - self.length, 0)
+        written = self.written + skipped
+        samples = samples[skipped:]
+        position = written % self.length
+        head = min(len(samples), self.length - position)
+        self._store(position, samples[:head])
+        self._store(0, samples[head:])
+        self.written = written + len(samples)
+
+    def view(self, num_samples: int) -> numpy.ndarray:
+        if not 0 <= num_samples <= self.length:
+            raise ValueError(
+                f"Cannot view {num_samples} samples of a {self.length} sample ring"
+            )
+        end = self.written % self.length + self.length
+        return self._data[end - num_samples : end]
+
+    def read(self, num_samples: int, out: t.Optional[numpy.ndarray] = None):
+        if out is None:
+            return self.view(num_samples).copy()
+        numpy.copyto(out, self.view(num_samples))
+        return out
+
+
+def decode_s32_le(raw_data: bytes) -> numpy.ndarray:
+    samples = numpy.frombuffer(raw_data, dtype=SAMPLE_FORMAT)
+    return numpy.multiply(samples, SAMPLE_SCALE, dtype=numpy.float32)
+
+
 class AudioInput(LoopingThread):
     number_channels = 1
 
@@ -53,50 +105,78 @@ class AudioInput(LoopingThread):
         sample_rate = 22050,
         period_size = 1024,
         buffer_size = MS_IN_SECOND * 1,
+        source=None,
     ) -> None:
         super().__init__(name="audio-capture-thread")
+        if source is None:
+            source = sources.AlsaSource(
+                device, cardindex=cardindex, sample_rate=sample_rate, period_size=period_size
+            )
+        sample_rate = source.sample_rate
+        period_size = source.period_size
         self.sample_rate = sample_rate
+        self.period_size = period_size
         self.period = sample_rate / period_size * MS_IN_SECOND
         self.sample_delta = 1 / sample_rate
 
         self.buffer_length = buffer_size * sample_rate // MS_IN_SECOND
         self._buffer_lock = threading.Lock()
+        self._buffer = self._make_buffer()
+        self._new_samples = threading.Condition(self._buffer_lock)
+        self._capture_time = None
 
-        self._clear_buffer()
+        self._mic = source
 
-        self._mic = alsa.PCM(alsa.PCM_CAPTURE, alsa.PCM_NORMAL, device, cardindex=cardindex)
-        self._mic.setperiodsize(period_size)
-        self._mic.setrate(sample_rate)
-        self._mic.setformat(alsa.PCM_FORMAT_S32_LE)
-        self._mic.setchannels(self.number_channels)
+    def _make_buffer(self) -> RingBuffer:
+        return RingBuffer(self.buffer_length)
 
     def _clear_buffer(self) -> None:
-        self._buffer_lock.acquire()
-        self._buffer = deque(
-            (0.0 for _ in range(self.buffer_length)), maxlen=self.buffer_length
-        )
-        self._buffer_lock.release()
+        with self._buffer_lock:
+            self._buffer.clear()
 
-    def loop(self) -> None:
-        length, raw_data = self._mic.read()
+    def tear_down(self) -> None:
+        self._mic.close()
 
+    def loop(self) -> None:
         try:
-            data = [value / (2 ** (8 * 4 - 1)) for value, in struct.iter_unpack("<l", raw_data)]
-        except struct.error as error:
-            self._clear_buffer()
+            length, raw_data = self._mic.read()
+        except EOFError:
+            self.stop()
             return
 
-        self._buffer_lock.acquire()
-        self._buffer.extend(data)
-        self._buffer_lock.release()
-
-    def get_samples(self, num_samples):
-        self._buffer_lock.acquire()
-        buffer_copy = [
-            sample for _, sample in zip(range(num_samples), reversed(self._buffer))
-        ]
-        self._buffer_lock.release()
-        return buffer_copy
+        if len(raw_data) % SAMPLE_FORMAT.itemsize:
+            self._clear_buffer()
+            return
+        data = decode_s32_le(raw_data)
+
+        with self._new_samples:
+            self._buffer.write(data)
+            self._capture_time = time.monotonic()
+            self._new_samples.notify_all()
+
+    @property
+    def samples_written(self) -> int:
+        return self._buffer.written
+
+    @property
+    def capture_time(self) -> t.Optional[float]:
+        return self._capture_time
+
+    def wait_for_samples(self, position: int, timeout: t.Optional[float] = None) -> int:
+        with self._new_samples:
+            self._new_samples.wait_for(
+                lambda: self._buffer.written >= position, timeout=timeout
+            )
+            return self._buffer.written
+
+    def get_samples(self, num_samples, out=None):
+        with self._buffer_lock:
+            return self._buffer.read(num_samples, out=out)
+
+    def get_samples_since(self, position: int) -> t.Tuple[numpy.ndarray, int]:
+        with self._buffer_lock:
+            num_samples = min(self._buffer.written - position, self.buffer_length)
+            return self._buffer.read(num_samples), self._buffer.written
 
     def get_data(self, length = 0):
         num_samples = self.seconds_to_samples(length)
@@ -0,0 +1,454 @@
+import argparse
+import multiprocessing
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+from airpixel import client as air_client
+
+from audioviz import (
+    audio_tools,
+    config,
+    encoding,
+    graph,
+    nodes,
+    rendering,
+    sources,
+    stages,
+    star,
+)
+from audioviz.instrumentation import INSTRUMENTATION
+
+
+PERIOD_SIZE = 1024
+WINDOW_SIZE_SEC = 0.05
+REPEAT = 5
+
+
+def _best_of(function, number):
+    return min(timeit.repeat(function, number=number, repeat=REPEAT)) / number
+
+
+def _random_period(period_size):
+    return np.random.randint(
+        -(2 ** 31), 2 ** 31 - 1, size=period_size, dtype=audio_tools.SAMPLE_FORMAT
+    ).tobytes()
+
+
+def _deque_path(sample_rate, raw_data):
+    buffer_length = sample_rate
+    window = int(WINDOW_SIZE_SEC * sample_rate)
+    buffer = deque((0.0 for _ in range(buffer_length)), maxlen=buffer_length)
+
+    def write():
+        buffer.extend(
+            value / (2 ** (8 * 4 - 1)) for value, in struct.iter_unpack("<l", raw_data)
+        )
+
+    def read():
+        return np.array(
+            [sample for _, sample in zip(range(window), reversed(buffer))]
+        )
+
+    return write, read
+
+
+def _ring_path(sample_rate, raw_data):
+    window = int(WINDOW_SIZE_SEC * sample_rate)
+    buffer = audio_tools.RingBuffer(sample_rate)
+    out = np.empty(window, dtype=np.float32)
+
+    def write():
+        buffer.write(audio_tools.decode_s32_le(raw_data))
+
+    def read():
+        return buffer.read(window, out=out)
+
+    return write, read
+
+
+def ring_buffer(args):
+    print(f"{'rate':>6} {'path':>6} {'write/period':>14} {'read/window':>14}")
+    for sample_rate in (22050, 48000):
+        raw_data = _random_period(PERIOD_SIZE)
+        for name, make_path in (("deque", _deque_path), ("ring", _ring_path)):
+            write, read = make_path(sample_rate, raw_data)
+            write_time = _best_of(write, args.number)
+            read_time = _best_of(read, args.number)
+            print(
+                f"{sample_rate:>6} {name:>6} "
+                f"{write_time * 1e6:>11.1f} us {read_time * 1e6:>11.1f} us"
+            )
+
+
+def _node_time(node, data, number):
+    def run():
+        node.run(data)
+        node._output_buffer.clear()
+
+    return _best_of(run, number)
+
+
+def octave_transform(args):
+    sample_rate = 22050
+    sample_delta = 1 / sample_rate
+    octaves = dict(start_octave=6, samples_per_octave=6, num_octaves=7)
+    multirate = nodes.MultirateOctaveTransform(
+        "multirate", sample_delta=sample_delta, **octaves
+    )
+    num_stages = len(multirate._histories)
+    long_window = multirate._samples * 2 ** (num_stages - 1)
+    hamming = nodes.Hamming("hamming", samples=long_window)
+    fft = nodes.FastFourierTransform(
+        "fft", samples=long_window, sample_delta=sample_delta
+    )
+    subsampler = nodes.OctaveSubsampler(
+        "sampled", frequencies=fft.fourier_frequencies, **octaves
+    )
+
+    period = np.random.uniform(-1, 1, PERIOD_SIZE)
+    window = np.random.uniform(-1, 1, long_window)
+    spectrum = np.absolute(np.fft.rfft(window))
+    single_fft = sum(
+        _node_time(node, data, args.number)
+        for node, data in ((hamming, window), (fft, window), (subsampler, spectrum))
+    )
+    print(f"single {long_window}-sample fft: {single_fft * 1e6:>9.1f} us/frame")
+    print(
+        f"multirate {num_stages} x {multirate._samples}-sample ffts: "
+        f"{_node_time(multirate, period, args.number) * 1e6:>9.1f} us/frame"
+    )
+
+
+def _analysis_chain(sample_rate):
+    samples = int(WINDOW_SIZE_SEC * sample_rate)
+    fft = nodes.FastFourierTransform(
+        "fft", samples=samples, sample_delta=1 / sample_rate
+    )
+    chain = (
+        nodes.Hamming("hamming", samples=samples)
+        | fft
+        | nodes.SpectralProjector(
+            "sampled",
+            start_frequency=65,
+            stop_frequency=1046,
+            samples=18,
+            frequencies=fft.fourier_frequencies,
+        )
+        | nodes.Normalizer("normalized")
+        | nodes.Square("square")
+        | nodes.Mirror("mirrored")
+        | nodes.Roll("rolled", shift=16)
+    )
+    return chain, samples
+
+
+def _run_chain(chain, data):
+    return _run_nodes(graph.walk(chain), data)
+
+
+def _run_nodes(members, data):
+    for node in members:
+        node._run(data)
+        data = node._output_buffer.pop().data
+    return data
+
+
+def _peak_temporaries(function):
+    tracemalloc.start()
+    function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - current
+
+
+def _node_temporaries(chain, data, number):
+    """Median bytes each node allocates and frees again while running a frame."""
+    temporaries = {}
+    for node in graph.walk(chain):
+        sizes = [_peak_temporaries(lambda: node._run(data)) for _ in range(number)]
+        data = node._output_buffer.pop().data
+        node._output_buffer.clear()
+        temporaries[node.name] = np.median(sizes)
+    return temporaries
+
+
+def allocations(args):
+    sample_rate = 22050
+    for mode in ("default", "in-place"):
+        chain, samples = _analysis_chain(sample_rate)
+        window = np.random.uniform(-1, 1, samples).astype(np.float32)
+        if mode == "in-place":
+            graph.preallocate(chain, shape=window.shape, dtype=window.dtype)
+        _run_chain(chain, window)
+        graph.reset_output_counts(chain)
+
+        frame_time = _best_of(lambda: _run_chain(chain, window), args.number)
+        fresh_outputs = graph.fresh_outputs_per_frame(chain)
+        temporaries = [
+            _peak_temporaries(lambda: _run_chain(chain, window))
+            for _ in range(args.number)
+        ]
+        print(
+            f"{mode:>9}: {frame_time * 1e6:>7.1f} us/frame, "
+            f"{fresh_outputs:.1f} fresh node outputs/frame, "
+            f"{np.median(temporaries) / 1024:.1f} KiB peak temporaries/frame"
+        )
+    # What is left in place is numpy's own scratch space, such as pocketfft's
+    # work buffer and the iterators of the Normalizer's peak reductions, and
+    # the small Python objects every call creates
+    for name, size in _node_temporaries(chain, window, args.number).items():
+        if size:
+            print(f"{'':>11}{name}: {size / 1024:.2f} KiB")
+
+
+def encoder(args):
+    client = air_client.AirClient("127.0.0.1", 9, air_client.ColorMethodGRB)
+    print(f"{'pixels':>7} {'pixel list':>14} {'grb encoder':>14}")
+    for num_pixels in (288, 4 * 288, 16 * 288):
+        rgb = np.random.uniform(0, 1, (num_pixels, 3))
+        grb_encoder = encoding.GRBEncoder(num_pixels)
+
+        def pixel_list():
+            client.show_frame([air_client.Pixel(r, g, b) for r, g, b in rgb])
+
+        def grb_bytes():
+            grb_encoder.send(client, rgb)
+
+        pixel_list_rate = 1 / _best_of(pixel_list, args.number)
+        encoder_rate = 1 / _best_of(grb_bytes, args.number)
+        print(
+            f"{num_pixels:>7} {pixel_list_rate:>10.0f} fps {encoder_rate:>10.0f} fps"
+        )
+
+
+def _star_config(change_threshold=None):
+    pipeline_config = config.PipelineConfig.load(star.PIPELINE_CONFIG)
+    if pipeline_config.nodes[-1].type != "Star":
+        sys.exit(f"{star.PIPELINE_CONFIG} must end in a Star node")
+    pipeline_config.nodes[-1].params["change_threshold"] = change_threshold
+    return pipeline_config
+
+
+def pipeline(args):
+    pipeline_config = _star_config(args.threshold)
+    source_options = dict(
+        period_size=PERIOD_SIZE, realtime=False, sample_rate=args.sample_rate
+    )
+    if args.source in sources.SYNTHETIC_SOURCES:
+        source_options["sample_rate"] = (
+            args.sample_rate or pipeline_config.constants["sample_rate"]
+        )
+    audio_input = audio_tools.AudioInput(
+        source=sources.open_source(args.source, **source_options)
+    )
+    *members, ring = graph.walk(
+        config.build(pipeline_config, audio_input, ip_address="127.0.0.1", port=9)
+    )
+    renderer = ring.renderer
+
+    if args.profile:
+        INSTRUMENTATION.enable(report_interval=0)
+
+    periods = int(args.seconds * audio_input.sample_rate / audio_input.period_size)
+    start = timeit.default_timer()
+    for _ in range(periods):
+        audio_input.loop()
+        renderer.render(_run_nodes(members, None))
+        if INSTRUMENTATION.enabled:
+            INSTRUMENTATION.frame_sent()
+    elapsed = timeit.default_timer() - start
+
+    audio_seconds = periods * audio_input.period_size / audio_input.sample_rate
+    print(
+        f"{args.source}: {periods / elapsed:.0f} frames/s, "
+        f"{elapsed / periods * 1e6:.1f} us/frame, "
+        f"{audio_seconds / elapsed:.1f}x real time"
+    )
+    change_filter = renderer.change_filter
+    if change_filter is not None:
+        total = change_filter.bytes_sent + change_filter.bytes_saved
+        print(
+            f"  sent {change_filter.frames_sent} frames, "
+            f"suppressed {change_filter.frames_suppressed}, "
+            f"saved {change_filter.bytes_saved} of {total} bytes "
+            f"({change_filter.bytes_saved / max(total, 1):.0%})"
+        )
+    if args.profile:
+        for name, percentiles in INSTRUMENTATION.summary().items():
+            print(f"  {name:>40}: " + " ".join(f"{value * 1e6:8.1f}" for value in percentiles))
+
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from audioviz import audio_tools, config, sources
+imported = time.perf_counter()
+audio_input = audio_tools.AudioInput(source=sources.SineSweepSource(realtime=False))
+config.build(
+    config.PipelineConfig.load({config_file!r}),
+    audio_input,
+    ip_address="127.0.0.1",
+    port=9,
+)
+print(imported - start, time.perf_counter() - imported, "scipy" in sys.modules)
+"""
+
+
+def _startup_run(cache_dir, config_file):
+    script = STARTUP_SCRIPT.format(config_file=config_file)
+    env = dict(os.environ, AUDIOVIZ_CACHE=cache_dir)
+    start = timeit.default_timer()
+    output = subprocess.run(
+        [sys.executable, "-c", script], env=env, check=True, capture_output=True
+    ).stdout.split()
+    total = timeit.default_timer() - start
+    return total, float(output[0]), float(output[1]), output[2] == b"True"
+
+
+def startup(args):
+    print(f"{'cache':>5} {'process':>10} {'imports':>10} {'build':>10} {'scipy':>6}")
+    runs = {"off": [], "cold": [], "warm": []}
+    with tempfile.TemporaryDirectory() as warm_dir:
+        _startup_run(warm_dir, star.PIPELINE_CONFIG)
+        for _ in range(REPEAT):
+            runs["off"].append(_startup_run("", star.PIPELINE_CONFIG))
+            with tempfile.TemporaryDirectory() as cold_dir:
+                runs["cold"].append(_startup_run(cold_dir, star.PIPELINE_CONFIG))
+            runs["warm"].append(_startup_run(warm_dir, star.PIPELINE_CONFIG))
+    for label, results in runs.items():
+        total, imports, build, scipy = min(results)
+        print(
+            f"{label:>5} {total * 1e3:>7.1f} ms {imports * 1e3:>7.1f} ms "
+            f"{build * 1e3:>7.1f} ms {'yes' if scipy else 'no':>6}"
+        )
+
+
+class _LatencyProbe(nodes.PlottableNode):
+    def setup(self, latencies, count, renderer, monitor_client=None):
+        super().setup(monitor_client)
+        self._latencies = latencies
+        self._count = count
+        self._renderer = renderer
+        self._sender = rendering.UDPBatchSender()
+
+    def run(self, data):
+        self._sender.send([(self._renderer.render(data), self._renderer.address)])
+        capture_time = INSTRUMENTATION.capture_time
+        if capture_time is not None:
+            self._latencies[self._count.value % len(self._latencies)] = (
+                time.monotonic() - capture_time
+            )
+        self._count.value += 1
+
+
+STAGE_LAYOUTS = {
+    "1 stage": ([], False),
+    "3 threads": (["sampled", "probe"], False),
+    "3 processes": (["sampled", "probe"], True),
+}
+
+
+def _staged_chain(audio_input, latencies, count):
+    *members, ring = graph.walk(
+        config.build(_star_config(), audio_input, ip_address="127.0.0.1", port=9)
+    )
+    probe = _LatencyProbe(
+        "probe", latencies=latencies, count=count, renderer=ring.renderer
+    )
+    ring.release()
+    staged = members[0]
+    for node in members[1:] + [probe]:
+        staged = staged | node
+    return staged
+
+
+def pipeline_stages(args):
+    INSTRUMENTATION.enable(report_interval=0)
+    context = multiprocessing.get_context("fork")
+    print(f"{'layout':>12} {'frames/s':>9} {'p50':>9} {'p95':>9} {'dropped':>8}")
+    for layout, (boundaries, processes) in STAGE_LAYOUTS.items():
+        audio_input = audio_tools.AudioInput(
+            source=sources.SineSweepSource(period_size=args.period_size, realtime=False)
+        )
+        latencies = np.frombuffer(context.RawArray("d", 4096))
+        count = context.RawValue("q", 0)
+        staged = stages.split(
+            _staged_chain(audio_input, latencies, count), boundaries, processes=processes
+        )
+        audio_input.start()
+        for stage in staged:
+            stage.start()
+        time.sleep(1)
+        start_count, start = count.value, timeit.default_timer()
+        time.sleep(args.seconds)
+        frames, elapsed = count.value - start_count, timeit.default_timer() - start
+        for stage in staged:
+            stage.stop()
+        for stage in staged:
+            stage.join(1)
+        audio_input.stop()
+        recorded = latencies[: min(count.value, len(latencies))]
+        p50, p95 = np.percentile(recorded, (50, 95)) if len(recorded) else (0, 0)
+        dropped = sum(
+            node._queue.dropped
+            for stage in staged
+            for node in graph.walk(stage.graph)
+            if isinstance(node, stages.QueueSink)
+        )
+        print(
+            f"{layout:>12} {frames / elapsed:>9.0f} {p50 * 1e3:>6.2f} ms "
+            f"{p95 * 1e3:>6.2f} ms {dropped:>8}"
+        )
+
+
+BENCHMARKS = {
+    "allocations": allocations,
+    "encoder": encoder,
+    "pipeline": pipeline,
+    "pipeline-stages": pipeline_stages,
+    "octave-transform": octave_transform,
+    "ring-buffer": ring_buffer,
+    "startup": startup,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m audioviz.benchmark")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument(
+        "--source",
+        default="sweep",
+        help="synthetic source (sweep, pink, drums) or a WAV/raw S32_LE file",
+    )
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument(
+        "--sample-rate", type=int, default=None, help="needed for raw recordings"
+    )
+    parser.add_argument(
+        "--period-size", type=int, default=PERIOD_SIZE, help="for pipeline-stages"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        default=None,
+        help="suppress frames within this many levels of the last one sent",
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="report per-node p50/p95/p99 in us"
+    )
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
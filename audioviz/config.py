@@ -0,0 +1,314 @@
+import dataclasses
+import inspect
+import logging
+import os
+import threading
+import typing as t
+
+import yaml
+from pyPiper import Node, NodeGraph
+
+from audioviz import audio_tools, graph, nodes, stages
+from audioviz.governor import GOVERNOR
+
+
+log = logging.getLogger(__name__)
+
+REFERENCE = "$"
+
+
+class ConfigError(Exception):
+    pass
+
+
+@dataclasses.dataclass
+class NodeConfig:
+    type: str
+    name: str
+    params: t.Dict[str, t.Any]
+    monitor: bool = True
+
+    @classmethod
+    def from_dict(cls, dict_: t.Dict[str, t.Any]) -> "NodeConfig":
+        params = dict(dict_)
+        try:
+            type_ = params.pop("type")
+            name = params.pop("name")
+        except KeyError as error:
+            raise ConfigError(f"Node {dict_} is missing {error}") from error
+        return cls(type_, name, params, bool(params.pop("monitor", True)))
+
+
+@dataclasses.dataclass
+class PipelineConfig:
+    constants: t.Dict[str, t.Any]
+    nodes: t.List[NodeConfig]
+    stages: t.List[str] = dataclasses.field(default_factory=list)
+    processes: bool = False
+
+    @classmethod
+    def from_dict(cls, dict_: t.Dict[str, t.Any]) -> "PipelineConfig":
+        node_configs = [NodeConfig.from_dict(node) for node in dict_.get("pipeline") or []]
+        if not node_configs:
+            raise ConfigError("The pipeline has no nodes")
+        names = [node.name for node in node_configs]
+        duplicates = {name for name in names if names.count(name) > 1}
+        if duplicates:
+            raise ConfigError(f"Duplicate node names: {sorted(duplicates)}")
+        stage_config = dict_.get("stages") or {}
+        boundaries = list(stage_config.get("boundaries") or [])
+        unknown = set(boundaries) - set(names[1:])
+        if unknown:
+            raise ConfigError(f"Unknown stage boundaries: {sorted(unknown)}")
+        return cls(
+            dict(dict_.get("constants") or {}),
+            node_configs,
+            boundaries,
+            bool(stage_config.get("processes", False)),
+        )
+
+    @classmethod
+    def load(cls, file_name: str) -> "PipelineConfig":
+        with open(file_name) as file_:
+            return cls.from_dict(yaml.safe_load(file_) or {})
+
+
+def derived_constants(constants, audio_input):
+    window_size_sec = constants.get("window_size_sec")
+    hop_size_sec = constants.get("hop_size_sec")
+    derived = dict(
+        constants,
+        sample_rate=audio_input.sample_rate,
+        sample_delta=audio_input.sample_delta,
+        period_size=audio_input.period_size,
+        hop_samples=(
+            audio_input.period_size
+            if hop_size_sec is None
+            else audio_input.seconds_to_samples(hop_size_sec)
+        ),
+    )
+    derived["frame_rate"] = audio_input.sample_rate / derived["hop_samples"]
+    if window_size_sec is not None:
+        derived["window_samples"] = audio_input.seconds_to_samples(window_size_sec)
+    return derived
+
+
+def _resolve(value, constants, built):
+    if isinstance(value, list):
+        return [_resolve(item, constants, built) for item in value]
+    if isinstance(value, dict):
+        return {key: _resolve(item, constants, built) for key, item in value.items()}
+    if not isinstance(value, str) or not value.startswith(REFERENCE):
+        return value
+    reference = value[len(REFERENCE) :]
+    name, _, attribute = reference.partition(".")
+    if not attribute:
+        if name in constants:
+            return constants[name]
+        if name in built:
+            return built[name]
+        raise ConfigError(f"Unknown constant {value!r}")
+    if name not in built:
+        raise ConfigError(f"{value!r} does not refer to an earlier node")
+    try:
+        return getattr(built[name], attribute)
+    except AttributeError as error:
+        raise ConfigError(f"Node {name!r} has no attribute {attribute!r}") from error
+
+
+def _node_class(type_):
+    node_class = getattr(nodes, type_, None)
+    if not (isinstance(node_class, type) and issubclass(node_class, Node)):
+        raise ConfigError(f"Unknown node type {type_!r}")
+    return node_class
+
+
+def _make_node(node_config, constants, built, audio_input, monitor_client, clock):
+    node_class = _node_class(node_config.type)
+    params = _resolve(node_config.params, constants, built)
+    accepted = inspect.signature(node_class.setup).parameters
+    if "audio_input" in accepted:
+        params.setdefault("audio_input", audio_input)
+    if "clock" in accepted and clock is not None:
+        params.setdefault("clock", clock)
+    if "monitor_client" in accepted and node_config.monitor:
+        params.setdefault("monitor_client", monitor_client)
+    try:
+        inspect.signature(node_class.setup).bind(None, **params)
+    except TypeError as error:
+        raise ConfigError(f"Node {node_config.name!r}: {error}") from error
+    try:
+        return node_class(node_config.name, **params)
+    except (ValueError, TypeError) as error:
+        raise ConfigError(f"Node {node_config.name!r}: {error}") from error
+
+
+def build_chain(
+    pipeline_config, audio_input, monitor_client=None, clock=None, **extra_constants
+):
+    """Builds and validates the configured node chain.
+
+    All tables are computed while the nodes are set up, so any error surfaces
+    here rather than in the middle of a run. ``clock`` replaces the wall clock
+    of nodes that take one.
+    """
+    constants = dict(
+        derived_constants(pipeline_config.constants, audio_input), **extra_constants
+    )
+    built = {}
+    chain = None
+    for node_config in pipeline_config.nodes:
+        node = _make_node(
+            node_config, constants, built, audio_input, monitor_client, clock
+        )
+        built[node.name] = node
+        chain = NodeGraph(node) if chain is None else chain | node
+    try:
+        graph.validate(chain)
+    except ValueError as error:
+        raise ConfigError(str(error)) from error
+    return chain
+
+
+def build(pipeline_config, audio_input, monitor_client=None, **extra_constants):
+    chain = build_chain(pipeline_config, audio_input, monitor_client, **extra_constants)
+    fused = graph.fuse(chain)
+    graph.preallocate(fused)
+    return fused
+
+
+def build_stages(pipeline_config, audio_input, monitor_client=None, **extra_constants):
+    if GOVERNOR.enabled and pipeline_config.processes and pipeline_config.stages:
+        # Steps applied in this process would never reach the forked copies
+        raise ConfigError("The governor cannot run with stages in processes")
+    chain = build_chain(pipeline_config, audio_input, monitor_client, **extra_constants)
+    try:
+        return stages.split(
+            chain, pipeline_config.stages, processes=pipeline_config.processes
+        )
+    except ValueError as error:
+        raise ConfigError(str(error)) from error
+
+
+class ConfigWatcher(audio_tools.LoopingThread):
+    """Calls ``on_change`` when the file changes or a rebuild is requested."""
+
+    def __init__(self, file_name, on_change, interval=1):
+        super().__init__(name="config-watcher-thread")
+        self._file_name = file_name
+        self._on_change = on_change
+        self._interval = interval
+        self._modified = os.stat(file_name).st_mtime
+        self._requested = threading.Event()
+
+    def request(self) -> None:
+        self._requested.set()
+
+    def loop(self) -> None:
+        if self._requested.wait(self._interval):
+            self._requested.clear()
+            self._on_change()
+            return
+        try:
+            modified = os.stat(self._file_name).st_mtime
+        except OSError:
+            return
+        if modified != self._modified:
+            self._modified = modified
+            self._on_change()
+
+
+class Runner:
+    """Runs the configured pipeline stages and swaps them when the file changes.
+
+    The audio input keeps capturing across swaps; only the node graph is
+    rebuilt. A config that fails to build is logged and the running graph is
+    kept. The old stages must exit before the new ones start; one that is
+    still running after ``STOP_TIMEOUT_SEC`` stops the runner.
+    """
+
+    STOP_TIMEOUT_SEC = 5
+
+    def __init__(self, file_name, audio_input, monitor_client=None, **extra_constants):
+        self._file_name = file_name
+        self._audio_input = audio_input
+        self._monitor_client = monitor_client
+        self._extra_constants = extra_constants
+        self._next_stages = None
+        self._swap = threading.Event()
+        self._stopped = False
+        self._window_scale = 1
+        self._watcher = None
+        self.window_size_sec = None
+
+    def build(self):
+        pipeline_config = PipelineConfig.load(self._file_name)
+        self.window_size_sec = pipeline_config.constants.get("window_size_sec")
+        if self.window_size_sec is not None:
+            pipeline_config.constants["window_size_sec"] = (
+                self.window_size_sec * self._window_scale
+            )
+        rate = pipeline_config.constants.get("sample_rate")
+        if rate is not None and rate != self._audio_input.sample_rate:
+            log.warning(
+                "Capture keeps running at %s Hz, ignoring sample_rate %s",
+                self._audio_input.sample_rate,
+                rate,
+            )
+        return build_stages(
+            pipeline_config,
+            self._audio_input,
+            self._monitor_client,
+            **self._extra_constants,
+        )
+
+    def reload(self):
+        try:
+            self._next_stages = self.build()
+        except (ConfigError, OSError, yaml.YAMLError) as error:
+            log.error("Keeping the current pipeline, %s is invalid: %s", self._file_name, error)
+            return
+        log.info("Swapping to the pipeline in %s", self._file_name)
+        self._swap.set()
+
+    def scale_window(self, scale):
+        """Rebuilds with a scaled window on the watcher thread, not the caller's."""
+        if scale == self._window_scale:
+            return
+        self._window_scale = scale
+        self._watcher.request()
+
+    def stop(self):
+        self._stopped = True
+        self._swap.set()
+
+    def _retire(self, current):
+        for stage in current:
+            stage.stop()
+        for stage in current:
+            if not stage.join(self.STOP_TIMEOUT_SEC):
+                raise RuntimeError(
+                    f"A pipeline stage is still running {self.STOP_TIMEOUT_SEC} s "
+                    "after being stopped"
+                )
+        for stage in current:
+            stage.release()
+
+    def run(self):
+        # The watcher exists before the first build, so rebuild requests made as
+        # soon as the stages are up are not lost
+        watcher = self._watcher = ConfigWatcher(self._file_name, self.reload)
+        self._next_stages = self.build()
+        watcher.start()
+        try:
+            while not self._stopped:
+                current = self._next_stages
+                self._swap.clear()
+                if GOVERNOR.enabled:
+                    GOVERNOR.attach(*(stage.graph for stage in current), runner=self)
+                for stage in current:
+                    stage.start()
+                self._swap.wait()
+                self._retire(current)
+        finally:
+            watcher.stop()
@@ -0,0 +1,161 @@
+import struct
+import time
+import typing as t
+
+import numpy as np
+
+from airpixel import client as air_client, gamma_table
+
+
+CHANNEL_ORDER = (1, 0, 2)
+
+
+def power_gamma_table(gamma: float) -> np.ndarray:
+    return np.round((np.arange(256) / 255) ** gamma * 255).astype("uint8")
+
+
+def grb_levels(rgb: np.ndarray, gamma: t.Optional[np.ndarray] = None) -> np.ndarray:
+    """Gamma corrected GRB bytes of RGB values in ``[0, 1]``, any leading shape.
+
+    ``gamma`` is a 256 entry table, airpixel's by default.
+    """
+    levels = np.clip(rgb[..., CHANNEL_ORDER] * 255, 0, 255).astype("uint8")
+    return np.take(gamma_table.GAMMA_TABLE if gamma is None else gamma, levels)
+
+
+class GRBEncoder:
+    CHANNEL_ORDER = CHANNEL_ORDER
+
+    def __init__(self, num_pixels: int) -> None:
+        self.num_pixels = num_pixels
+        header_size = air_client.UDPConstants.FRAME_NUMBER_BYTES
+        self._message = bytearray(header_size + num_pixels * 3)
+        self._pixels = np.frombuffer(
+            self._message, dtype="uint8", offset=header_size
+        ).reshape((num_pixels, 3))
+        self._scaled = np.empty((num_pixels, 3))
+        self._levels = np.empty((num_pixels, 3), dtype="uint8")
+
+    @property
+    def pixels(self) -> np.ndarray:
+        return self._pixels
+
+    def _encode_frame_number(self, frame_number: int) -> None:
+        header_size = air_client.UDPConstants.FRAME_NUMBER_BYTES
+        self._message[:header_size] = frame_number.to_bytes(
+            header_size, byteorder=air_client.UDPConstants.ENCODING_BYTEORDER
+        )
+
+    def encode(self, frame_number: int, rgb: np.ndarray) -> bytearray:
+        rgb = rgb.reshape((self.num_pixels, 3))
+        for target, source in enumerate(self.CHANNEL_ORDER):
+            np.multiply(rgb[:, source], 255, out=self._scaled[:, target])
+        np.clip(self._scaled, 0, 255, out=self._scaled)
+        np.copyto(self._levels, self._scaled, casting="unsafe")
+        np.take(gamma_table.GAMMA_TABLE, self._levels, out=self._pixels)
+        self._encode_frame_number(frame_number)
+        return self._message
+
+    def send(self, client: air_client.AirClient, rgb: np.ndarray) -> None:
+        client.send_bytes(self.encode(client.frame_number, rgb))
+        client.frame_number += 1
+
+    def encode_block(self, rgb: np.ndarray) -> np.ndarray:
+        """Gamma corrected GRB pixels for a block of frames of RGB values."""
+        return grb_levels(rgb)
+
+    def encode_pixels(self, frame_number: int, pixels: np.ndarray) -> bytearray:
+        np.copyto(self._pixels, pixels.reshape((self.num_pixels, 3)))
+        return self.encode_header(frame_number)
+
+    def encode_header(self, frame_number: int) -> bytearray:
+        """The message around ``pixels``, after writing them in place."""
+        self._encode_frame_number(frame_number)
+        return self._message
+
+
+class ChangeFilter:
+    """Drops frames that barely differ from the last one sent.
+
+    A frame goes out when any channel of any pixel moved more than
+    ``threshold`` levels since the last sent frame, or when ``keepalive``
+    seconds passed. With ``spans``, only the changed pixel runs are sent as
+    ``(start, count)`` headers followed by their GRB bytes; the stock airpixel
+    receiver only understands full frames, so this is off by default.
+    """
+
+    SPAN_HEADER = struct.Struct(">HH")
+
+    def __init__(
+        self,
+        encoder: GRBEncoder,
+        threshold: int = 0,
+        keepalive: float = 1.0,
+        spans: bool = False,
+    ) -> None:
+        self._encoder = encoder
+        self._threshold = threshold
+        self._keepalive = keepalive
+        self._spans = spans
+        num_pixels = encoder.num_pixels
+        self._last = np.zeros((num_pixels, 3), dtype="uint8")
+        self._difference = np.empty((num_pixels, 3), dtype="int16")
+        self._pixel_difference = np.empty(num_pixels, dtype="int16")
+        self._changed = np.empty(num_pixels + 2, dtype="int8")
+        self._last_sent = -float("inf")
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+
+    def _changed_pixels(self) -> np.ndarray:
+        np.subtract(self._encoder.pixels, self._last, out=self._difference, dtype="int16")
+        np.abs(self._difference, out=self._difference)
+        np.max(self._difference, axis=1, out=self._pixel_difference)
+        return self._pixel_difference > self._threshold
+
+    def _span_bounds(self, changed: np.ndarray) -> t.Tuple[np.ndarray, np.ndarray]:
+        self._changed[0] = self._changed[-1] = 0
+        self._changed[1:-1] = changed
+        edges = np.flatnonzero(np.diff(self._changed))
+        starts, stops = edges[0::2], edges[1::2]
+        # A span header costs more than re-sending a one pixel gap
+        split = starts[1:] - stops[:-1] > 1
+        starts = np.concatenate([starts[:1], starts[1:][split]])
+        stops = np.concatenate([stops[:-1][split], stops[-1:]])
+        return starts, stops
+
+    def _spans_message(
+        self, message: bytearray, starts: np.ndarray, stops: np.ndarray
+    ) -> bytearray:
+        header_size = len(message) - self._encoder.num_pixels * 3
+        spans = bytearray(message[:header_size])
+        for start, stop in zip(starts, stops):
+            spans += self.SPAN_HEADER.pack(start, stop - start)
+            spans += message[header_size + 3 * start : header_size + 3 * stop]
+        return spans
+
+    def filter(
+        self, message: bytearray, now: t.Optional[float] = None
+    ) -> t.Optional[bytearray]:
+        now = time.monotonic() if now is None else now
+        changed = self._changed_pixels()
+        keepalive = now - self._last_sent >= self._keepalive
+        if not keepalive and not changed.any():
+            self.frames_suppressed += 1
+            self.bytes_saved += len(message)
+            return None
+        if self._spans and not keepalive:
+            starts, stops = self._span_bounds(changed)
+            outgoing = self._spans_message(message, starts, stops)
+            # Pixels outside the spans keep their last sent values, so slow drifts add up
+            for start, stop in zip(starts, stops):
+                self._last[start:stop] = self._encoder.pixels[start:stop]
+        else:
+            outgoing = message
+            np.copyto(self._last, self._encoder.pixels)
+        self._last_sent = now
+        self.frames_sent += 1
+        self.bytes_sent += len(outgoing)
+        self.bytes_saved += len(message) - len(outgoing)
+        return outgoing
@@ -0,0 +1,227 @@
+import dataclasses
+import typing as t
+
+import numpy as np
+import yaml
+
+
+OUT = "out"
+IN = "in"
+
+FORWARD = "forward"
+REVERSE = "reverse"
+
+ROWS = "rows"
+COLUMNS = "columns"
+
+BOTTOM = "bottom"
+TOP = "top"
+
+
+@dataclasses.dataclass
+class Layout:
+    """Which band and which bar position drive each LED, in wiring order.
+
+    ``led_bands`` indexes the band values handed to the renderer, with any
+    mirroring and rotation already folded in. Each LED sits ``offsets[c]``
+    LEDs above the foot of a bar of ``lengths[c]`` LEDs, ``c`` being its
+    entry in ``led_columns``; LEDs with the same length and offset share a
+    column of the brightness table.
+    """
+
+    bands: int
+    led_bands: np.ndarray
+    led_columns: np.ndarray
+    lengths: np.ndarray
+    offsets: np.ndarray
+
+    @property
+    def num_pixels(self) -> int:
+        return len(self.led_bands)
+
+    @property
+    def max_length(self) -> int:
+        return int(self.lengths.max())
+
+
+def _band_sources(
+    num_bars: int, mirror: t.Optional[str], roll: int
+) -> t.Tuple[int, np.ndarray]:
+    if mirror in (None, "none"):
+        return num_bars, np.roll(np.arange(num_bars), roll)
+    if mirror not in (FORWARD, REVERSE):
+        raise ValueError(f"Unknown mirror mode: {mirror}")
+    if num_bars % 2:
+        raise ValueError(f"Cannot mirror {num_bars} bars")
+    forward = np.arange(num_bars // 2)
+    if mirror == REVERSE:
+        sources = np.concatenate([forward, np.flip(forward)])
+    else:
+        sources = np.concatenate([np.flip(forward), forward])
+    return num_bars // 2, np.roll(sources, roll)
+
+
+def compile_layout(
+    num_bars: int,
+    bars: np.ndarray,
+    offsets: np.ndarray,
+    lengths: np.ndarray,
+    mirror: t.Optional[str] = None,
+    roll: int = 0,
+) -> Layout:
+    """Compiles the bar, offset and bar length of every LED into index maps."""
+    if not len(bars):
+        raise ValueError("The layout has no LEDs")
+    bands, sources = _band_sources(num_bars, mirror, roll)
+    columns, led_columns = np.unique(
+        np.stack([lengths, offsets], axis=1).astype("int"), axis=0, return_inverse=True
+    )
+    return Layout(
+        bands,
+        sources[np.asarray(bars, dtype="int")],
+        led_columns.reshape(-1),
+        columns[:, 0],
+        columns[:, 1],
+    )
+
+
+def strips(
+    strips: t.Sequence[t.Dict[str, t.Any]], mirror: t.Optional[str] = None, roll: int = 0
+) -> Layout:
+    """Strips in wiring order, each showing ``band`` as a bar of ``leds``.
+
+    ``direction`` ``out`` starts the strip at the foot of its bar, ``in`` at
+    the top.
+    """
+    bars, offsets, lengths = [], [], []
+    for index, strip in enumerate(strips):
+        for required in ("leds", "band"):
+            if required not in strip:
+                raise ValueError(f"Strip {index} has no {required!r}")
+        leds = int(strip["leds"])
+        direction = strip.get("direction", OUT)
+        if direction not in (OUT, IN):
+            raise ValueError(f"Unknown strip direction: {direction}")
+        positions = np.arange(leds)
+        bars.append(np.full(leds, strip["band"]))
+        offsets.append(positions if direction == OUT else np.flip(positions))
+        lengths.append(np.full(leds, leds))
+    bars_ = np.concatenate(bars) if bars else np.zeros(0)
+    return compile_layout(
+        int(bars_.max()) + 1 if len(bars_) else 0,
+        bars_,
+        np.concatenate(offsets) if offsets else np.zeros(0),
+        np.concatenate(lengths) if lengths else np.zeros(0),
+        mirror,
+        roll,
+    )
+
+
+def ring(
+    beams: int,
+    led_per_beam: int,
+    alternate: bool = True,
+    mirror: t.Optional[str] = None,
+    roll: int = 0,
+) -> Layout:
+    """Radial strips, one bar each, wired outwards and inwards in turn."""
+    return strips(
+        [
+            {
+                "leds": led_per_beam,
+                "band": beam,
+                "direction": IN if alternate and beam % 2 else OUT,
+            }
+            for beam in range(beams)
+        ],
+        mirror,
+        roll,
+    )
+
+
+def matrix(
+    width: int,
+    height: int,
+    wiring: str = ROWS,
+    serpentine: bool = True,
+    start: str = BOTTOM,
+    mirror: t.Optional[str] = None,
+    roll: int = 0,
+) -> Layout:
+    """A grid with one bar per column, wired row by row or column by column."""
+    leds = np.arange(width * height)
+    if wiring == ROWS:
+        rows, columns = np.divmod(leds, width)
+        if serpentine:
+            columns = np.where(rows % 2, width - 1 - columns, columns)
+    elif wiring == COLUMNS:
+        columns, rows = np.divmod(leds, height)
+        if serpentine:
+            rows = np.where(columns % 2, height - 1 - rows, rows)
+    else:
+        raise ValueError(f"Unknown matrix wiring: {wiring}")
+    if start == TOP:
+        rows = height - 1 - rows
+    elif start != BOTTOM:
+        raise ValueError(f"Unknown matrix start: {start}")
+    return compile_layout(width, columns, rows, np.full(len(leds), height), mirror, roll)
+
+
+def coordinates(
+    points: t.Sequence[t.Sequence[float]],
+    bands: int,
+    mirror: t.Optional[str] = None,
+    roll: int = 0,
+) -> Layout:
+    """LEDs at 2-D positions in wiring order.
+
+    The x range is cut into ``bands`` bars, and within a bar the LEDs light
+    up from the lowest y upwards.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    x, y = points[:, 0], points[:, 1]
+    span = x.max() - x.min() if len(x) else 0
+    if span:
+        bars = np.minimum(((x - x.min()) / span * bands).astype("int"), bands - 1)
+    else:
+        bars = np.zeros(len(x), dtype="int")
+    order = np.lexsort((y, bars))
+    counts = np.bincount(bars, minlength=bands)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    offsets = np.empty(len(x), dtype="int")
+    offsets[order] = np.arange(len(x)) - starts[bars[order]]
+    return compile_layout(bands, bars, offsets, counts[bars], mirror, roll)
+
+
+LAYOUTS = {
+    "ring": ring,
+    "strips": strips,
+    "matrix": matrix,
+    "coordinates": coordinates,
+}
+
+
+def from_dict(dict_: t.Dict[str, t.Any]) -> Layout:
+    """Builds a layout from one of ``ring``, ``strips``, ``matrix`` or ``coordinates``.
+
+    ``strips`` is a list of strips, the others map to keyword arguments.
+    ``mirror`` (``forward``, ``reverse`` or ``none``) and ``roll`` apply to
+    the bars of any of them.
+    """
+    options = {key: dict_[key] for key in ("mirror", "roll") if key in dict_}
+    kinds = [kind for kind in LAYOUTS if kind in dict_]
+    if len(kinds) != 1:
+        raise ValueError(f"A layout needs exactly one of {sorted(LAYOUTS)}")
+    (kind,) = kinds
+    description = dict_[kind]
+    if isinstance(description, dict):
+        return LAYOUTS[kind](**description, **options)
+    return LAYOUTS[kind](description, **options)
+
+
+def load(path: str) -> Layout:
+    with open(path) as file_:
+        description = yaml.safe_load(file_)
+    if not isinstance(description, dict) or "layout" not in description:
+        raise ValueError(f"{path} has no top level 'layout'")
+    return from_dict(description["layout"])
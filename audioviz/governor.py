@@ -0,0 +1,182 @@
+import abc
+import logging
+import time
+import typing as t
+
+import numpy as np
+
+
+log = logging.getLogger(__name__)
+
+STREAM = "governor"
+
+
+class Step(abc.ABC):
+    name = ""
+
+    @abc.abstractmethod
+    def apply(self, degraded: bool) -> None:
+        pass
+
+
+class MonitorStep(Step):
+    name = "monitor streaming off"
+
+    def __init__(self, nodes) -> None:
+        self._clients = {node: node.monitor_client for node in nodes}
+
+    def apply(self, degraded: bool) -> None:
+        for node, client in self._clients.items():
+            node.monitor_client = None if degraded else client
+
+
+class BypassStep(Step):
+    def __init__(self, node) -> None:
+        self.name = f"{node.name} bypassed"
+        self._node = node
+
+    def apply(self, degraded: bool) -> None:
+        self._node.bypass = degraded
+
+
+class ResolutionStep(Step):
+    def __init__(self, renderers, factor: int = 4) -> None:
+        self.name = f"strip resolution / {factor}"
+        self._renderers = renderers
+        self._factor = factor
+
+    def apply(self, degraded: bool) -> None:
+        for renderer in self._renderers:
+            full = renderer.full_resolution
+            renderer.set_resolution(full // self._factor if degraded else full)
+
+
+class WindowStep(Step):
+    def __init__(self, runner, factor: float = 0.5) -> None:
+        self.name = f"window length x {factor}"
+        self._runner = runner
+        self._factor = factor
+
+    def apply(self, degraded: bool) -> None:
+        self._runner.scale_window(self._factor if degraded else 1)
+
+
+def _steps(graphs, runner=None) -> t.List[Step]:
+    nodes = [node for graph in graphs for node in graph._graph]
+    steps: t.List[Step] = []
+    monitored = [node for node in nodes if getattr(node, "monitor_client", None)]
+    if monitored:
+        steps.append(MonitorStep(monitored))
+    steps.extend(BypassStep(node) for node in nodes if hasattr(node, "bypass"))
+    renderers = [node.renderer for node in nodes if hasattr(node, "renderer")]
+    renderers += [
+        renderer for node in nodes for renderer in getattr(node, "renderers", ())
+    ]
+    if renderers:
+        steps.append(ResolutionStep(renderers))
+    if runner is not None and runner.window_size_sec is not None:
+        steps.append(WindowStep(runner))
+    return steps
+
+
+class Governor:
+    """Steps quality down when frames take too long and back up when they are fast.
+
+    Frame time is smoothed and compared with the budget of ``1 / target_fps``.
+    Above ``high`` of the budget the next step is applied; below ``low`` the
+    last one is undone. A step is only taken after ``hold_sec`` without a
+    change, and stepping up waits three times as long as stepping down.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.level = 0
+        self.frame_time = 0.0
+        self.steps_down = 0
+        self.steps_up = 0
+        self._steps: t.List[Step] = []
+        self._budget = 0.0
+        self._high = 0.0
+        self._low = 0.0
+        self._smoothing = 0.0
+        self._hold = 0.0
+        self._last_change = 0.0
+        self._started: t.Optional[float] = None
+        self._monitor_client = None
+        self._readings = np.zeros(3)
+
+    def enable(
+        self,
+        target_fps: float = 30,
+        high: float = 0.9,
+        low: float = 0.5,
+        hold_sec: float = 2,
+        smoothing: float = 0.1,
+        monitor_client=None,
+    ) -> None:
+        self._budget = 1 / target_fps
+        self._high = high
+        self._low = low
+        self._hold = hold_sec
+        self._smoothing = smoothing
+        self._monitor_client = monitor_client
+        self._last_change = time.monotonic()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def attach(self, *graphs, runner=None) -> None:
+        self._steps = _steps(graphs, runner)
+        self.level = min(self.level, len(self._steps))
+        for index, step in enumerate(self._steps):
+            step.apply(index < self.level)
+
+    @property
+    def load(self) -> float:
+        return self.frame_time / self._budget if self._budget else 0.0
+
+    def metrics(self) -> t.Dict[str, float]:
+        return {
+            "level": self.level,
+            "frame_time": self.frame_time,
+            "load": self.load,
+            "steps_down": self.steps_down,
+            "steps_up": self.steps_up,
+        }
+
+    def frame_started(self) -> None:
+        self._started = time.perf_counter()
+
+    def frame_finished(self) -> None:
+        if self._started is None:
+            return
+        elapsed = time.perf_counter() - self._started
+        self._started = None
+        self.frame_time += self._smoothing * (elapsed - self.frame_time)
+        self._decide(time.monotonic())
+        if self._monitor_client is not None:
+            self._readings[:] = self.level, self.load, self.frame_time
+            self._monitor_client.send_np_array(STREAM, self._readings)
+
+    def _decide(self, now: float) -> None:
+        waited = now - self._last_change
+        if self.load > self._high and self.level < len(self._steps):
+            if waited >= self._hold:
+                step = self._steps[self.level]
+                self.level += 1
+                self.steps_down += 1
+                self._last_change = now
+                log.info("Load %.0f%%, degrading: %s", self.load * 100, step.name)
+                step.apply(True)
+        elif self.load < self._low and self.level > 0:
+            if waited >= 3 * self._hold:
+                self.level -= 1
+                step = self._steps[self.level]
+                self.steps_up += 1
+                self._last_change = now
+                log.info("Load %.0f%%, restoring: %s", self.load * 100, step.name)
+                step.apply(False)
+
+
+GOVERNOR = Governor()
@@ -0,0 +1,102 @@
+from pyPiper import NodeGraph
+
+from audioviz import nodes
+
+
+def successors(graph, node):
+    return graph._graph[node]
+
+
+def walk(graph):
+    pending = [graph._root]
+    while pending:
+        node = pending.pop(0)
+        yield node
+        pending.extend(successors(graph, node))
+
+
+def preallocate(graph, shape=None, dtype=None, node=None):
+    if node is None:
+        node = graph._root
+    if not isinstance(node, nodes.PlottableNode):
+        return
+    spec = node.preallocate(shape, dtype)
+    if spec is None:
+        return
+    for successor in successors(graph, node):
+        preallocate(graph, *spec, node=successor)
+
+
+def validate(graph, shape=None, dtype=None, node=None):
+    if node is None:
+        node = graph._root
+    if not isinstance(node, nodes.PlottableNode):
+        return
+    try:
+        spec = node.output_spec(shape, dtype)
+    except (ValueError, IndexError, TypeError) as error:
+        raise ValueError(f"Node {node.name!r} cannot take {shape}: {error}") from error
+    if spec is None:
+        return
+    for successor in successors(graph, node):
+        validate(graph, *spec, node=successor)
+
+
+def reset_output_counts(graph):
+    for node in walk(graph):
+        if isinstance(node, nodes.PlottableNode):
+            node.frames = 0
+            node.fresh_outputs = 0
+
+
+def fresh_outputs_per_frame(graph):
+    """Emitted arrays per root frame that were not written into ``out``."""
+    counted = [node for node in walk(graph) if isinstance(node, nodes.PlottableNode)]
+    frames = graph._root.frames
+    if not frames:
+        return 0.0
+    return sum(node.fresh_outputs for node in counted) / frames
+
+
+def _is_tap(node, taps):
+    if taps is not None:
+        return node.name in taps
+    return getattr(node, "monitor_client", None) is not None
+
+
+def _is_fusable(node):
+    return isinstance(node, nodes.PlottableNode) and node.fusion_ops() is not None
+
+
+def _fused_run(graph, node, taps):
+    run = []
+    while _is_fusable(node):
+        run.append(node)
+        following = successors(graph, node)
+        if _is_tap(node, taps) or len(following) != 1:
+            break
+        node = next(iter(following))
+    if not run:
+        return node, node
+    if len(run) == 1:
+        return run[0], run[0]
+    tap = run[-1] if _is_tap(run[-1], taps) else None
+    fused = nodes.FusedNode(
+        "+".join(member.name for member in run),
+        members=run,
+        monitor_client=getattr(tap, "monitor_client", None),
+    )
+    return fused, run[-1]
+
+
+def fuse(graph, taps=None):
+    root, last = _fused_run(graph, graph._root, taps)
+    fused_graph = NodeGraph(root)
+    pending = [(root, last)]
+    while pending:
+        replacement, last = pending.pop()
+        for successor in successors(graph, last):
+            successor_replacement, successor_last = _fused_run(graph, successor, taps)
+            fused_graph.add(replacement, successor_replacement)
+            pending.append((successor_replacement, successor_last))
+    return fused_graph
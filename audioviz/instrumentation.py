@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+import typing as t
+
+import numpy as np
+
+
+log = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+LATENCY = "capture-to-send"
+
+
+class RollingHistogram:
+    def __init__(self, size: int = 1024) -> None:
+        self._samples = np.zeros(size)
+        self._count = 0
+
+    def add(self, value: float) -> None:
+        self._samples[self._count % len(self._samples)] = value
+        self._count += 1
+
+    def __len__(self) -> int:
+        return min(self._count, len(self._samples))
+
+    def percentiles(self, percentiles: t.Sequence[float] = PERCENTILES) -> np.ndarray:
+        if not len(self):
+            return np.zeros(len(percentiles))
+        return np.percentile(self._samples[: len(self)], percentiles)
+
+
+class Instrumentation:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.histograms: t.Dict[str, RollingHistogram] = {}
+        self._frame = threading.local()
+        self._monitor_client = None
+        self._report_interval = 0.0
+        self._next_report = 0.0
+
+    def enable(self, report_interval: float = 10, monitor_client=None) -> None:
+        self.histograms.clear()
+        self._monitor_client = monitor_client
+        self._report_interval = report_interval
+        self._next_report = time.monotonic() + report_interval
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def record(self, name: str, seconds: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = RollingHistogram()
+        histogram.add(seconds)
+
+    @property
+    def capture_time(self) -> t.Optional[float]:
+        return getattr(self._frame, "capture_time", None)
+
+    def stamp(self, capture_time: t.Optional[float]) -> None:
+        self._frame.capture_time = capture_time
+
+    def frame_sent(self) -> None:
+        now = time.monotonic()
+        if self.capture_time is not None:
+            self.record(LATENCY, now - self.capture_time)
+        if self._report_interval and now >= self._next_report:
+            self._next_report = now + self._report_interval
+            self.report()
+
+    def summary(self) -> t.Dict[str, np.ndarray]:
+        return {
+            name: histogram.percentiles()
+            for name, histogram in sorted(self.histograms.items())
+        }
+
+    def report(self) -> None:
+        for name, percentiles in self.summary().items():
+            milliseconds = percentiles * 1000
+            log.info(
+                "%s: %s ms",
+                name,
+                " ".join(
+                    f"p{percentile}={value:.2f}"
+                    for percentile, value in zip(PERCENTILES, milliseconds)
+                ),
+            )
+            if self._monitor_client is not None:
+                self._monitor_client.send_np_array(f"{name}-timing", milliseconds)
+
+
+INSTRUMENTATION = Instrumentation()
@@ -0,0 +1,153 @@
+import collections
+import dataclasses
+import threading
+import time
+import typing as t
+
+import numpy as np
+import yaml
+
+from audioviz import audio_tools
+
+
+PEAK = "peak"
+MEAN = "mean"
+STRIDE = "stride"
+
+
+@dataclasses.dataclass(frozen=True)
+class StreamPolicy:
+    max_rate: t.Optional[float] = None
+    points: t.Optional[int] = None
+    decimation: str = PEAK
+    dtype: t.Optional[str] = None
+
+    @classmethod
+    def from_dict(
+        cls, dict_: t.Dict[str, t.Any], default: t.Optional["StreamPolicy"] = None
+    ) -> "StreamPolicy":
+        """Overrides the fields of ``default`` that ``dict_`` sets."""
+        fields = {field.name for field in dataclasses.fields(cls)}
+        return dataclasses.replace(
+            default or cls(),
+            **{key: value for key, value in dict_.items() if key in fields},
+        )
+
+
+def decimate(data: np.ndarray, points: int, method: str = PEAK) -> np.ndarray:
+    length = data.shape[-1]
+    if length <= points:
+        return np.array(data)
+    if method == STRIDE:
+        return data[..., np.linspace(0, length - 1, points).astype("int")]
+    edges = np.linspace(0, length, points + 1).astype("int")
+    if method == MEAN:
+        return np.add.reduceat(data, edges[:-1], axis=-1) / np.diff(edges)
+    if method == PEAK:
+        maxima = np.maximum.reduceat(data, edges[:-1], axis=-1)
+        minima = np.minimum.reduceat(data, edges[:-1], axis=-1)
+        return np.where(np.abs(minima) > np.abs(maxima), minima, maxima)
+    raise ValueError(f"Unknown decimation method: {method}")
+
+
+def quantize(data: np.ndarray, dtype: str) -> np.ndarray:
+    if dtype == "uint8":
+        low, high = np.min(data), np.max(data)
+        span = high - low if high > low else 1
+        return ((data - low) * (255 / span)).astype("uint8")
+    return data.astype(dtype)
+
+
+def reduce(data: np.ndarray, policy: StreamPolicy) -> np.ndarray:
+    if policy.points is not None:
+        data = decimate(data, policy.points, policy.decimation)
+    if policy.dtype is not None:
+        return quantize(data, policy.dtype)
+    return np.array(data)
+
+
+def load_policies(
+    path: str, default: t.Optional[StreamPolicy] = None
+) -> t.Dict[str, StreamPolicy]:
+    with open(path) as file_:
+        streams = yaml.safe_load(file_)["monitor"]["streams"]
+    return {
+        stream["name"]: StreamPolicy.from_dict(stream, default) for stream in streams
+    }
+
+
+class MonitorStreamer(audio_tools.LoopingThread):
+    """Applies per-stream policies and sends from a background thread.
+
+    The pipeline thread only copies each frame into a spare buffer of its
+    stream; decimation, quantisation and sending happen on this thread. Only
+    the newest pending frame of each stream is kept, and the queue never
+    holds more than ``queue_size`` frames, so a slow monitor drops frames
+    instead of stalling the pipeline. Streams without a policy use
+    ``default_policy``, or are not sent at all if it is ``None``.
+    """
+
+    def __init__(
+        self,
+        monitor_client,
+        policies: t.Optional[t.Dict[str, StreamPolicy]] = None,
+        default_policy: t.Optional[StreamPolicy] = StreamPolicy(),
+        queue_size: int = 8,
+    ) -> None:
+        super().__init__(name="monitor-stream-thread")
+        self._monitor_client = monitor_client
+        self._policies = policies or {}
+        self._default_policy = default_policy
+        self._queue_size = queue_size
+        self._pending: t.OrderedDict[str, np.ndarray] = collections.OrderedDict()
+        self._pending_changed = threading.Condition()
+        self._spare: t.Dict[str, t.List[np.ndarray]] = collections.defaultdict(list)
+        self._next_send: t.Dict[str, float] = {}
+        self.dropped = 0
+
+    def policy(self, stream_id: str) -> t.Optional[StreamPolicy]:
+        return self._policies.get(stream_id, self._default_policy)
+
+    def _release(self, stream_id: str, buffer: np.ndarray) -> None:
+        self._spare[stream_id].append(buffer)
+
+    def _copy(self, stream_id: str, data: np.ndarray) -> np.ndarray:
+        spare = self._spare[stream_id]
+        while spare:
+            buffer = spare.pop()
+            if buffer.shape == data.shape and buffer.dtype == data.dtype:
+                np.copyto(buffer, data)
+                return buffer
+        return np.array(data)
+
+    def send_np_array(self, stream_id: str, data: np.ndarray) -> None:
+        policy = self.policy(stream_id)
+        if policy is None:
+            return
+        if policy.max_rate:
+            now = time.monotonic()
+            if now < self._next_send.get(stream_id, 0):
+                return
+            self._next_send[stream_id] = now + 1 / policy.max_rate
+        data = np.asarray(data)
+        with self._pending_changed:
+            copied = self._copy(stream_id, data)
+            replaced = self._pending.pop(stream_id, None)
+            if replaced is not None:
+                self.dropped += 1
+                self._release(stream_id, replaced)
+            self._pending[stream_id] = copied
+            while len(self._pending) > self._queue_size:
+                self._release(*self._pending.popitem(last=False))
+                self.dropped += 1
+            self._pending_changed.notify()
+
+    def loop(self) -> None:
+        with self._pending_changed:
+            if not self._pending_changed.wait_for(lambda: self._pending, timeout=1):
+                return
+            stream_id, data = self._pending.popitem(last=False)
+        reduced = reduce(data, self.policy(stream_id))
+        with self._pending_changed:
+            self._release(stream_id, data)
+        self._monitor_client.send_np_array(stream_id, reduced)
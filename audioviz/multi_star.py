@@ -0,0 +1,58 @@
+import sys
+
+from pyPiper import Pipeline
+
+from audioviz import config, geometry, graph, nodes, rendering, star
+from audioviz.governor import GOVERNOR
+
+
+DEFAULT_ROLL = 16
+
+
+def parse_device(spec, constants):
+    address, *options = spec.split(",")
+    ip_address, port = address.rsplit(":", 1)
+    settings = dict(option.split("=", 1) for option in options)
+    mirror = settings.get("mirror", "forward")
+    return rendering.StarRenderer(
+        ip_address,
+        int(port),
+        led_per_beam=int(settings.get("led_per_beam", constants["led_per_beam"])),
+        beams=int(settings.get("beams", constants["beams"])),
+        mirror=mirror != "none",
+        reverse=mirror == "reverse",
+        roll=int(settings.get("roll", DEFAULT_ROLL)),
+        threshold=int(settings["threshold"]) if "threshold" in settings else None,
+        layout=geometry.load(settings["layout"]) if "layout" in settings else None,
+        palette=settings.get("palette"),
+    )
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        sys.exit(
+            "usage: python -m audioviz.multi_star "
+            "IP:PORT[,beams=N][,led_per_beam=N][,roll=N][,mirror=forward|reverse|none]"
+            "[,threshold=LEVELS][,layout=FILE][,palette=NAME] ..."
+        )
+    pipeline_config = star.analysis_config()
+    renderers = [parse_device(spec, pipeline_config.constants) for spec in sys.argv[1:]]
+
+    mon_client = star.monitor_client()
+    star.enable_profiling(mon_client)
+    star.enable_governor(mon_client)
+    audio_input = star.start_audio_input(pipeline_config)
+
+    chain = config.build_chain(pipeline_config, audio_input, mon_client) | nodes.MultiStar(
+        "rings", renderers=renderers
+    )
+
+    pipeline = Pipeline(graph.fuse(chain))
+    graph.preallocate(pipeline.graph)
+    if GOVERNOR.enabled:
+        GOVERNOR.attach(pipeline.graph)
+    pipeline.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,126 +1,439 @@
 import time
 import threading
+import inspect
 import math
 from functools import reduce
 
 import numpy as np
 
 import io
-from airpixel import client as air_client
 import airpixel.monitoring
 from numpy.fft import rfft as fourier_transform, rfftfreq
 from pyPiper import Node, Pipeline
-from scipy import ndimage
 
-from audioviz import a_weighting_table, audio_tools
+from audioviz import a_weighting_table, audio_tools, geometry, rendering, table_cache
+from audioviz.governor import GOVERNOR
+from audioviz.instrumentation import INSTRUMENTATION
 
+# numpy < 2 has no ``out`` for the FFT, so the complex spectrum is a temporary
+_FFT_TAKES_OUT = "out" in inspect.signature(fourier_transform).parameters
 
-class ContiniuousVolumeNormalizer:
-    def __init__(self, min_threshold=0, falloff=1.1) -> None:
-        self._min_threshold = min_threshold
-        self._falloff = falloff
-        self._current_threshold = self._min_threshold
-        self._last_call = 0
 
-    def _update_threshold(self, max_sample, timestamp):
-        if max_sample >= self._current_threshold:
-            self._current_threshold = max_sample
-        else:
-            target_threshold = max_sample
-            factor = 1 / self._falloff ** (timestamp - self._last_call)
-            self._current_threshold = (
-                self._current_threshold * factor + target_threshold * (1 - factor)
-            )
-        self._last_call = timestamp
+class GainControl:
+    """Automatic gain control with attack and release time constants.
+
+    An envelope follows the peak of each band, or of the whole frame when
+    ``per_band`` is off. It moves towards a louder peak with time constant
+    ``attack_sec`` and towards a quieter one with ``release_sec``; 0 follows
+    at once. The envelope starts at the first frame's peak, or at
+    ``min_threshold`` if that is louder. Frames are divided by the envelope,
+    and bands whose envelope is 0 or below ``min_threshold`` are silenced.
+    With an attack time a sudden rise would overshoot until the envelope
+    catches up, so the output is clipped to [-1, 1].
+
+    ``normalize`` takes a single frame and its timestamp, or a block of
+    frames, one per row, and an array of timestamps.
+    """
 
-    def normalize(self, signal, timestamp):
-        if self._last_call == 0:
-            self._last_call = timestamp
-        max_sample = np.max(np.abs(signal))
-        self._update_threshold(max_sample, timestamp)
-        if (
-            self._current_threshold >= self._min_threshold
-            and self._current_threshold != 0
-        ):
-            return signal / self._current_threshold
-        return np.zeros_like(signal)
+    def __init__(
+        self, attack_sec=0.0, release_sec=1.0, min_threshold=0, per_band=False
+    ) -> None:
+        self._attack_sec = attack_sec
+        self._release_sec = release_sec
+        self._min_threshold = min_threshold
+        self._per_band = per_band
+        self._envelope = None
+        self._last_time = None
+
+    @staticmethod
+    def _coefficients(time_constant, deltas):
+        if time_constant <= 0:
+            return np.ones(len(deltas))
+        return -np.expm1(-deltas / time_constant)
+
+    @staticmethod
+    def _coefficient(time_constant, delta):
+        if time_constant <= 0:
+            return 1.0
+        return -math.expm1(-delta / time_constant)
+
+    def _prepare(self, shape, timestamp):
+        """Allocates the state for frames of ``shape``; True if it was reset."""
+        shape = shape if self._per_band else ()
+        if self._envelope is not None and self._envelope.shape == shape:
+            return False
+        self._envelope = np.empty(shape, dtype=np.float64)
+        self._difference = np.empty(shape)
+        self._rising = np.empty(shape, dtype=bool)
+        self._weights = np.empty(shape)
+        self._divisor = np.empty(shape)
+        self._last_time = timestamp
+        return True
+
+    def _seed(self, peak):
+        np.maximum(peak, self._min_threshold, out=self._envelope)
+
+    def _step(self, peak, attack, release):
+        envelope = self._envelope
+        if not self._per_band:
+            weight = attack if peak > envelope else release
+            envelope[()] += weight * (peak - envelope[()])
+            return
+        np.greater(peak, envelope, out=self._rising)
+        self._weights.fill(release)
+        np.copyto(self._weights, attack, where=self._rising)
+        np.subtract(peak, envelope, out=self._difference)
+        self._difference *= self._weights
+        envelope += self._difference
+
+    def _divisors(self, envelopes):
+        usable = (envelopes >= self._min_threshold) & (envelopes != 0)
+        return np.where(usable, envelopes, np.inf)
+
+    def envelopes(self, frames, timestamps):
+        """Updates the envelope with a block of frames and returns it after each."""
+        if self._per_band:
+            peaks = np.abs(frames)
+        else:
+            peaks = np.max(np.abs(frames.reshape(len(frames), -1)), axis=1)
+        if self._prepare(frames.shape[1:], timestamps[0]):
+            self._seed(peaks[0])
+        deltas = np.diff(timestamps, prepend=self._last_time)
+        attacks = self._coefficients(self._attack_sec, deltas)
+        releases = self._coefficients(self._release_sec, deltas)
+        envelopes = np.empty(peaks.shape)
+        for index, peak in enumerate(peaks):
+            self._step(peak, attacks[index], releases[index])
+            envelopes[index] = self._envelope
+        self._last_time = timestamps[-1]
+        return envelopes
+
+    def _clip(self, result):
+        if self._attack_sec > 0:
+            np.clip(result, -1, 1, out=result)
+        return result
+
+    def _normalize_frame(self, signal, timestamp, out):
+        fresh = self._prepare(signal.shape, timestamp)
+        if self._per_band:
+            peak = np.abs(signal, out=self._divisor)
+        else:
+            peak = max(signal.max(), -signal.min())
+        if fresh:
+            self._seed(peak)
+        delta = timestamp - self._last_time
+        self._last_time = timestamp
+        attack = self._coefficient(self._attack_sec, delta)
+        release = self._coefficient(self._release_sec, delta)
+        self._step(peak, attack, release)
+        if self._per_band:
+            np.copyto(self._divisor, self._divisors(self._envelope))
+            return self._clip(np.divide(signal, self._divisor, out=out))
+        envelope = float(self._envelope)
+        if envelope >= self._min_threshold and envelope != 0:
+            return self._clip(np.divide(signal, envelope, out=out))
+        if out is None:
+            return np.zeros_like(signal)
+        out.fill(0)
+        return out
+
+    def normalize(self, signals, timestamps, out=None):
+        if np.ndim(timestamps) == 0:
+            return self._normalize_frame(signals, timestamps, out)
+        envelopes = self.envelopes(signals, np.asarray(timestamps, dtype=np.float64))
+        divisors = self._divisors(envelopes)
+        divisors = divisors.reshape(divisors.shape + (1,) * (signals.ndim - divisors.ndim))
+        return self._clip(np.divide(signals, divisors, out=out))
+
+
+def _expect_length(shape, length):
+    if shape is not None and shape[-1:] != (length,):
+        raise ValueError(f"expected {length} values per frame, got shape {shape}")
+
+
+POINTWISE = "pointwise"
+SCALE = "scale"
+GATHER = "gather"
 
 
 class PlottableNode(Node):
+    # Output depends on the current frame only, so blocks may run in any order
+    independent_frames = False
+
     def setup(self, monitor_client=None):
         self.monitor_client = monitor_client
+        self.out = None
+        self.frames = 0
+        self.fresh_outputs = 0
+
+    def output_spec(self, shape, dtype):
+        return None
+
+    def fusion_ops(self):
+        return None
+
+    def preallocate(self, shape, dtype):
+        spec = self.output_spec(shape, dtype)
+        if spec is not None:
+            self.out = np.empty(*spec)
+        return spec
 
     def plot(self, data):
         if self.monitor_client is None:
             return
         self.monitor_client.send_np_array(self.name, data)
 
+    def batch(self, frames, times):
+        """Runs a block of frames, one per row, and returns the outputs stacked.
+
+        ``times`` are the capture times of the frames for nodes that depend on
+        time. Nodes without a vectorised version run frame by frame.
+        """
+        outputs = []
+        for frame in frames:
+            self.run(frame)
+            outputs.extend(np.array(parcel.data) for parcel in self._output_buffer)
+            self._output_buffer.clear()
+        return np.array(outputs)
+
+    def _run(self, data):
+        if not INSTRUMENTATION.enabled:
+            return super()._run(data)
+        self._run_started = time.perf_counter()
+        super()._run(data)
+        INSTRUMENTATION.record(self.name, time.perf_counter() - self._run_started)
+
+    def _restart_timer(self):
+        """Stops charging the time spent so far, such as waiting for input."""
+        self._run_started = time.perf_counter()
+
     def emit(self, data):
+        self.frames += 1
+        # Counts emitted arrays that own new memory, not temporaries inside run
+        if data is not self.out and getattr(data, "base", self) is None:
+            self.fresh_outputs += 1
         self.plot(data)
         return super().emit(data)
 
 
 class AudioGenerator(PlottableNode):
-    def setup(self, audio_input, samples, monitor_client=None):
+    def setup(self, audio_input, samples, hop=None, monitor_client=None):
         super().setup(monitor_client)
         self._samples = samples
         self._input_device = audio_input
+        self._hop = hop
+        self._position = audio_input.samples_written
+
+    def run(self, data):
+        if self._hop is not None:
+            self._position = self._input_device.wait_for_samples(
+                self._position + self._hop
+            )
+        if GOVERNOR.enabled:
+            GOVERNOR.frame_started()
+        if INSTRUMENTATION.enabled:
+            self._restart_timer()
+            INSTRUMENTATION.stamp(self._input_device.capture_time)
+        self.emit(self._input_device.get_samples(self._samples, out=self.out))
+
+    def output_spec(self, shape, dtype):
+        return (self._samples,), np.float32
+
+
+class AudioStream(PlottableNode):
+    def setup(self, audio_input, hop, monitor_client=None):
+        super().setup(monitor_client)
+        self._input_device = audio_input
+        self._hop = hop
+        self._position = audio_input.samples_written
 
     def run(self, data):
-        samples = np.array(self._input_device.get_samples(self._samples))
+        self._input_device.wait_for_samples(self._position + self._hop)
+        samples, self._position = self._input_device.get_samples_since(self._position)
+        if GOVERNOR.enabled:
+            GOVERNOR.frame_started()
+        if INSTRUMENTATION.enabled:
+            self._restart_timer()
+            INSTRUMENTATION.stamp(self._input_device.capture_time)
         self.emit(samples)
 
 
 class Hamming(PlottableNode):
+    independent_frames = True
+
     def setup(self, samples, monitor_client=None):
         super().setup(monitor_client)
         self._window = np.hamming(samples)
 
+    def output_spec(self, shape, dtype):
+        _expect_length(shape, len(self._window))
+        return shape, np.result_type(dtype, self._window)
+
+    def batch(self, frames, times):
+        return np.multiply(frames, self._window)
+
     def run(self, data):
-        self.emit(np.multiply(data, self._window))
+        if self.out is None:
+            self.emit(np.multiply(data, self._window))
+            return
+        # Casting inside a mixed dtype ufunc goes through a scratch buffer
+        np.copyto(self.out, data)
+        self.emit(np.multiply(self.out, self._window, out=self.out))
 
 
 class FastFourierTransform(PlottableNode):
+    independent_frames = True
+
     def setup(self, samples, sample_delta, monitor_client=None):
         super().setup(monitor_client)
+        self._samples = samples
         self.sample_delta = sample_delta
         self.fourier_frequencies = rfftfreq(samples, d=sample_delta)
+        self._complex = None
+
+    def output_spec(self, shape, dtype):
+        _expect_length(shape, self._samples)
+        return self.fourier_frequencies.shape, np.float64
+
+    def preallocate(self, shape, dtype):
+        spec = super().preallocate(shape, dtype)
+        if _FFT_TAKES_OUT:
+            self._complex = np.empty(self.fourier_frequencies.shape, np.complex128)
+        return spec
+
+    def batch(self, frames, times):
+        spectra = np.absolute(fourier_transform(frames, axis=-1))
+        spectra *= self.sample_delta
+        return spectra
 
     def run(self, data):
-        self.emit(np.absolute(fourier_transform(data) * self.sample_delta))
+        if self._complex is None:
+            spectrum = np.absolute(fourier_transform(data), out=self.out)
+        else:
+            fourier_transform(data, out=self._complex)
+            spectrum = np.absolute(self._complex, out=self.out)
+        spectrum *= self.sample_delta
+        self.emit(spectrum)
+
+
+class ShortTimeFourierTransform(PlottableNode):
+    def setup(self, samples, hop, sample_delta, monitor_client=None):
+        super().setup(monitor_client)
+        if not 0 < hop <= samples:
+            raise ValueError(
+                f"The hop must be between 1 and the {samples} sample window, got {hop}"
+            )
+        self._samples = samples
+        self._hop = hop
+        self.sample_delta = sample_delta
+        self.fourier_frequencies = rfftfreq(samples, d=sample_delta)
+        self._window = np.hamming(samples)
+        self._pending = np.zeros(samples - hop)
+        self.skipped = 0
+
+    def output_spec(self, shape, dtype):
+        return self.fourier_frequencies.shape, np.float64
+
+    def _frames(self):
+        num_frames = (len(self._pending) - self._samples) // self._hop + 1
+        stride = self._pending.strides[0]
+        return np.lib.stride_tricks.as_strided(
+            self._pending,
+            shape=(max(num_frames, 0), self._samples),
+            strides=(self._hop * stride, stride),
+            writeable=False,
+        )
+
+    def _spectra(self, frames):
+        return np.absolute(
+            fourier_transform(frames * self._window, axis=-1) * self.sample_delta
+        )
+
+    def batch(self, frames, times):
+        """One spectrum per hop of the block, all from a single ``rfft`` call."""
+        self._pending = np.concatenate([self._pending, np.ravel(frames)])
+        windows = self._frames()
+        spectra = self._spectra(windows)
+        self._pending = self._pending[len(windows) * self._hop :]
+        return spectra
+
+    def run(self, data):
+        self._pending = np.concatenate([self._pending, data])
+        windows = self._frames()
+        if not len(windows):
+            return
+        # The executor forwards one output per step, so only the newest hop
+        # is transformed when the pipeline fell behind
+        self.skipped += len(windows) - 1
+        spectrum = self._spectra(windows[-1])
+        self._pending = self._pending[len(windows) * self._hop :]
+        self.emit(spectrum)
+
+
+def octave_sample_points(start_octave, samples_per_octave, num_octaves):
+    return np.exp2(
+        (np.arange(samples_per_octave * num_octaves) + samples_per_octave * start_octave)
+        / samples_per_octave
+    )
+
+
+def exponential_sample_points(start_frequency, stop_frequency, samples):
+    start_note = np.log2(start_frequency)
+    stop_note = np.log2(stop_frequency)
+    return np.exp2(np.linspace(start_note, stop_note, samples))
+
+
+def a_weights(frequencies):
+    return np.interp(
+        frequencies, a_weighting_table.frequencies, a_weighting_table.weights
+    )
 
 
 class OctaveSubsampler(PlottableNode):
+    independent_frames = True
+
     def setup(
         self, start_octave, samples_per_octave, num_octaves, frequencies, monitor_client=None
     ):
         super().setup(monitor_client)
-        self._sample_points = np.exp2(
-            (
-                np.arange(samples_per_octave * num_octaves)
-                + samples_per_octave * start_octave
-            )
-            / samples_per_octave
+        self._sample_points = octave_sample_points(
+            start_octave, samples_per_octave, num_octaves
         )
         self.frequencies = frequencies
 
+    def output_spec(self, shape, dtype):
+        _expect_length(shape, len(self.frequencies))
+        return self._sample_points.shape, np.float64
+
+    def batch(self, frames, times):
+        matrix = _interpolation_matrix(self._sample_points, self.frequencies)
+        return np.dot(frames, matrix.T)
+
     def run(self, data):
         self.emit(
             np.interp(self._sample_points, self.frequencies, data, left=0, right=0)
         )
 
 class ExponentialSubsampler(PlottableNode):
+    independent_frames = True
+
     def setup(
         self, start_frequency, stop_frequency, samples, frequencies, monitor_client=None
     ):
         super().setup(monitor_client)
-        start_note = np.log2(start_frequency)
-        stop_note = np.log2(stop_frequency)
-        self._sample_points = np.exp2(
-            np.linspace(start_note, stop_note, samples)
+        self._sample_points = exponential_sample_points(
+            start_frequency, stop_frequency, samples
         )
         self.frequencies = frequencies
 
+    def output_spec(self, shape, dtype):
+        _expect_length(shape, len(self.frequencies))
+        return self._sample_points.shape, np.float64
+
+    def batch(self, frames, times):
+        matrix = _interpolation_matrix(self._sample_points, self.frequencies)
+        return np.dot(frames, matrix.T)
+
     def run(self, data):
         self.emit(
             np.interp(self._sample_points, self.frequencies, data, left=0, right=0)
@@ -128,173 +441,833 @@ class ExponentialSubsampler(PlottableNode):
 
 
 class AWeighting(PlottableNode):
+    independent_frames = True
+
     def setup(self, frequencies, monitor_client=None):
-        self.weights = np.interp(
-            frequencies, a_weighting_table.frequencies, a_weighting_table.weights
+        self.weights = a_weights(frequencies)
+        super().setup(monitor_client)
+
+    def output_spec(self, shape, dtype):
+        _expect_length(shape, len(self.weights))
+        return shape, np.result_type(dtype, self.weights)
+
+    def fusion_ops(self):
+        return [(SCALE, self.weights)]
+
+    def batch(self, frames, times):
+        return np.multiply(frames, self.weights)
+
+    def run(self, data):
+        self.emit(np.multiply(data, self.weights, out=self.out))
+
+
+def _interpolation_matrix(points, frequencies):
+    matrix = np.zeros((len(points), len(frequencies)))
+    inside = np.flatnonzero((points >= frequencies[0]) & (points <= frequencies[-1]))
+    upper = np.clip(
+        np.searchsorted(frequencies, points[inside], side="right"),
+        1,
+        len(frequencies) - 1,
+    )
+    lower = upper - 1
+    fraction = (points[inside] - frequencies[lower]) / (
+        frequencies[upper] - frequencies[lower]
+    )
+    matrix[inside, lower] = 1 - fraction
+    matrix[inside, upper] = fraction
+    return matrix
+
+
+def _band_edges(points):
+    notes = np.log2(points)
+    note_edges = np.concatenate(
+        [
+            [1.5 * notes[0] - 0.5 * notes[1]],
+            (notes[:-1] + notes[1:]) / 2,
+            [1.5 * notes[-1] - 0.5 * notes[-2]],
+        ]
+    )
+    return np.exp2(note_edges)
+
+
+def _integration_matrix(band_edges, frequencies):
+    edges = band_edges[:, np.newaxis]
+    half_bin = (frequencies[1] - frequencies[0]) / 2
+    overlap = np.minimum(edges[1:], frequencies + half_bin) - np.maximum(
+        edges[:-1], frequencies - half_bin
+    )
+    return np.clip(overlap, 0, None) / (edges[1:] - edges[:-1])
+
+
+def _projection_matrix(
+    start_frequency, stop_frequency, samples, frequencies, mode, a_weighting
+):
+    points = exponential_sample_points(start_frequency, stop_frequency, samples)
+    weights = a_weights(frequencies) if a_weighting else np.ones(len(frequencies))
+    if mode == SpectralProjector.INTERPOLATE:
+        return _interpolation_matrix(points, frequencies) * weights
+    if mode == SpectralProjector.INTEGRATE:
+        return _integration_matrix(_band_edges(points), frequencies) * weights ** 2
+    raise ValueError(f"Unknown projection mode: {mode}")
+
+
+class SpectralProjector(PlottableNode):
+    INTERPOLATE = "interpolate"
+    INTEGRATE = "integrate"
+    independent_frames = True
+
+    def setup(
+        self,
+        start_frequency,
+        stop_frequency,
+        samples,
+        frequencies,
+        mode=INTERPOLATE,
+        a_weighting=True,
+        monitor_client=None,
+    ):
+        super().setup(monitor_client)
+        matrix = table_cache.cached(
+            "spectral-projection",
+            _projection_matrix,
+            start_frequency=start_frequency,
+            stop_frequency=stop_frequency,
+            samples=samples,
+            frequencies=frequencies,
+            mode=mode,
+            a_weighting=a_weighting,
         )
+        self._mode = mode
+        self._num_frequencies = len(frequencies)
+
+        columns = np.flatnonzero(matrix.any(axis=0))
+        self._start = columns[0] if len(columns) else 0
+        self._stop = columns[-1] + 1 if len(columns) else 0
+        self._projection = np.ascontiguousarray(matrix[:, self._start : self._stop].T)
+        self._energy = np.empty(self._stop - self._start)
+
+    def output_spec(self, shape, dtype):
+        _expect_length(shape, self._num_frequencies)
+        return self._projection.shape[1:], np.float64
+
+    def batch(self, frames, times):
+        band = frames[..., self._start : self._stop]
+        if self._mode != self.INTEGRATE:
+            return np.dot(band, self._projection)
+        return np.sqrt(np.dot(band ** 2, self._projection))
+
+    def run(self, data):
+        band = data[..., self._start : self._stop]
+        if self._mode != self.INTEGRATE:
+            self.emit(np.dot(band, self._projection, out=self.out))
+            return
+        if self.out is None:
+            self.emit(np.sqrt(np.dot(band ** 2, self._projection)))
+            return
+        np.square(band, out=self._energy)
+        np.dot(self._energy, self._projection, out=self.out)
+        self.emit(np.sqrt(self.out, out=self.out))
+
+
+def _multirate_projection(sample_points, point_stages, samples, sample_delta):
+    num_stages = point_stages.max() + 1
+    band_edges = _band_edges(sample_points)
+    num_bins = samples // 2 + 1
+    projection = np.zeros((len(sample_points), num_stages * num_bins))
+    for stage in range(num_stages):
+        frequencies = rfftfreq(samples, d=sample_delta * 2 ** stage)
+        rows = np.flatnonzero(point_stages == stage)
+        edges = band_edges[np.concatenate([rows, rows[-1:] + 1])]
+        projection[
+            rows, stage * num_bins : (stage + 1) * num_bins
+        ] = _integration_matrix(edges, frequencies)
+    return projection
+
+
+class MultirateOctaveTransform(PlottableNode):
+    PASSBAND = 0.8
+    FILTER_TAPS = 31
+
+    def setup(
+        self,
+        start_octave,
+        samples_per_octave,
+        num_octaves,
+        sample_delta,
+        samples=128,
+        monitor_client=None,
+    ):
         super().setup(monitor_client)
+        self.sample_delta = sample_delta
+        self._samples = samples
+        self._window = np.hamming(samples)
+        self._sample_points = octave_sample_points(
+            start_octave, samples_per_octave, num_octaves
+        )
+
+        nyquist = 1 / (2 * sample_delta)
+        point_stages = np.floor(
+            np.log2(self.PASSBAND * nyquist / self._sample_points)
+        ).clip(0, None).astype("int")
+        num_stages = point_stages.max() + 1
+
+        self._projection = _multirate_projection(
+            self._sample_points, point_stages, samples, sample_delta
+        )
+
+        taps = np.arange(self.FILTER_TAPS) - (self.FILTER_TAPS - 1) / 2
+        self._filter = np.sinc(taps / 2) * np.hamming(self.FILTER_TAPS)
+        self._filter /= self._filter.sum()
+        self._filter_states = np.zeros((num_stages - 1, self.FILTER_TAPS - 1))
+        self._phases = [0] * (num_stages - 1)
+        self._histories = np.zeros((num_stages, samples))
+
+    def output_spec(self, shape, dtype):
+        return self._sample_points.shape, np.float64
+
+    def _decimate(self, stage, data):
+        padded = np.concatenate([self._filter_states[stage], data])
+        self._filter_states[stage] = padded[len(data) :]
+        filtered = np.convolve(padded, self._filter, mode="valid")
+        decimated = filtered[self._phases[stage] :: 2]
+        self._phases[stage] = (self._phases[stage] - len(data)) % 2
+        return decimated
+
+    def _push(self, stage, data):
+        history = self._histories[stage]
+        if len(data) >= self._samples:
+            history[:] = data[-self._samples :]
+        elif len(data):
+            history[: -len(data)] = history[len(data) :]
+            history[-len(data) :] = data
 
     def run(self, data):
-        self.emit(data * self.weights)
+        for stage in range(len(self._histories)):
+            self._push(stage, data)
+            if stage < len(self._filter_states):
+                data = self._decimate(stage, data)
+        spectra = np.absolute(fourier_transform(self._histories * self._window))
+        self.emit(
+            np.sqrt(np.dot(self._projection, (spectra ** 2).reshape(-1)))
+            * self.sample_delta
+        )
 
 
 class Gaussian(PlottableNode):
+    independent_frames = True
+
     def setup(self, sigma, monitor_client=None):
+        from scipy import ndimage
+
+        self._gaussian_filter = ndimage.gaussian_filter
         self._sigma = sigma
+        self.bypass = False
         super().setup(monitor_client)
 
+    def output_spec(self, shape, dtype):
+        return shape, np.float64
+
+    def batch(self, frames, times):
+        if self.bypass:
+            return np.array(frames, dtype=np.float64)
+        sigma = (0,) + (self._sigma,) * (frames.ndim - 1)
+        return self._gaussian_filter(frames, sigma=sigma, output=np.float64)
+
     def run(self, data):
-        self.emit(ndimage.gaussian_filter(data, sigma=self._sigma))
+        if self.bypass:
+            if self.out is not None:
+                np.copyto(self.out, data)
+                data = self.out
+            self.emit(data)
+            return
+        self.emit(self._gaussian_filter(data, sigma=self._sigma, output=self.out))
 
 class Square(PlottableNode):
+    independent_frames = True
+
+    def output_spec(self, shape, dtype):
+        return shape, dtype
+
+    def fusion_ops(self):
+        return [(POINTWISE, lambda data: np.square(data, out=data))]
+
+    def batch(self, frames, times):
+        return np.square(frames)
+
     def run(self, data):
-        self.emit(data ** 2)
+        self.emit(np.square(data, out=self.out))
 
 
 class FoldingNode(PlottableNode):
+    independent_frames = True
+
     def setup(self, samples_per_octave, monitor_client=None):
         self._samples_per_octave = samples_per_octave
         super().setup(monitor_client)
 
+    def output_spec(self, shape, dtype):
+        if shape[-1] % self._samples_per_octave:
+            raise ValueError(
+                f"{shape[-1]} values do not fold into rows of {self._samples_per_octave}"
+            )
+        return (shape[-1] // self._samples_per_octave, self._samples_per_octave), dtype
+
+    def batch(self, frames, times):
+        return np.reshape(frames, (len(frames), -1, self._samples_per_octave))
+
     def run(self, data):
         wrapped = np.reshape(data, (-1, self._samples_per_octave))
         self.emit(wrapped)
 
 
 class SumMatrixVertical(PlottableNode):
+    independent_frames = True
+
+    def output_spec(self, shape, dtype):
+        return shape[1:], dtype
+
+    def batch(self, frames, times):
+        return np.add.reduce(frames, axis=1)
+
     def run(self, data):
-        self.emit(np.add.reduce(data))
+        self.emit(np.add.reduce(data, out=self.out))
 
 
 class MaxMatrixVertical(PlottableNode):
+    independent_frames = True
+
+    def output_spec(self, shape, dtype):
+        return shape[1:], dtype
+
+    def batch(self, frames, times):
+        return np.maximum.reduce(frames, axis=1)
+
     def run(self, data):
-        self.emit(np.maximum.reduce(data))
+        self.emit(np.maximum.reduce(data, out=self.out))
 
 
 class Mirror(PlottableNode):
+    independent_frames = True
+
     def setup(self, reverse=False, monitor_client=None):
         super().setup(monitor_client=monitor_client)
         self.reverse = reverse
 
+    def output_spec(self, shape, dtype):
+        return (2 * shape[0],) + shape[1:], dtype
+
+    def _indices(self, length):
+        forward = np.arange(length)
+        if self.reverse:
+            return np.concatenate([forward, np.flip(forward)])
+        return np.concatenate([np.flip(forward), forward])
+
+    def fusion_ops(self):
+        return [(GATHER, self._indices)]
+
+    def batch(self, frames, times):
+        return np.take(frames, self._indices(frames.shape[1]), axis=1)
+
     def run(self, data):
         if self.reverse:
-            self.emit(np.concatenate([data, np.flip(data)]))
+            self.emit(np.concatenate([data, np.flip(data)], out=self.out))
         else:
-            self.emit(np.concatenate([np.flip(data), data]))
+            self.emit(np.concatenate([np.flip(data), data], out=self.out))
 
 
 class Roll(PlottableNode):
+    independent_frames = True
+
     def setup(self, shift, monitor_client=None):
         super().setup(monitor_client=monitor_client)
         self._shift = shift
+        self._indices = np.arange(0)
+
+    def output_spec(self, shape, dtype):
+        return shape, dtype
+
+    def fusion_ops(self):
+        return [(GATHER, lambda length: np.roll(np.arange(length), self._shift))]
+
+    def batch(self, frames, times):
+        return np.roll(frames, self._shift, axis=1)
 
     def run(self, data):
-        self.emit(np.roll(data, self._shift))
+        if len(self._indices) != len(data):
+            self._indices = np.roll(np.arange(len(data)), self._shift)
+        self.emit(np.take(data, self._indices, axis=0, out=self.out))
 
 
 class Logarithm(PlottableNode):
+    independent_frames = True
+
     def setup(self, i_0=0, monitor_client=None):
         super().setup(monitor_client=monitor_client)
         self.i_0 = i_0
         self.at_1 = np.log(1 / self.i_0 + 1)
 
+    def output_spec(self, shape, dtype):
+        return shape, np.float64
+
+    def _apply(self, result):
+        result /= self.i_0
+        result += 1
+        np.log(result, out=result)
+        result /= self.at_1
+
+    def fusion_ops(self):
+        return [(POINTWISE, self._apply)]
+
+    def batch(self, frames, times):
+        result = np.array(frames, dtype=np.float64)
+        self._apply(result)
+        return result
+
     def run(self, data):
-        self.emit((np.log(data / self.i_0 + 1) / self.at_1))
+        result = np.divide(data, self.i_0, out=self.out)
+        result += 1
+        np.log(result, out=result)
+        result /= self.at_1
+        self.emit(result)
 
 
 class Normalizer(PlottableNode):
-    def setup(self, min_threshold=0, falloff=1.1, monitor_client=None):
+    def setup(
+        self,
+        min_threshold=0,
+        falloff=1.1,
+        per_band=False,
+        attack_sec=0,
+        release_sec=None,
+        clock=time.time,
+        monitor_client=None,
+    ):
         super().setup(monitor_client=monitor_client)
-        self.normalizer = ContiniuousVolumeNormalizer(
-            min_threshold=min_threshold, falloff=falloff
+        self._clock = clock
+        if release_sec is None:
+            # The envelope decays by a factor of ``falloff`` per second
+            release_sec = 1 / math.log(falloff) if falloff > 1 else math.inf
+        self.normalizer = GainControl(
+            attack_sec=attack_sec,
+            release_sec=release_sec,
+            min_threshold=min_threshold,
+            per_band=per_band,
         )
 
+    def output_spec(self, shape, dtype):
+        return shape, np.float64
+
+    def batch(self, frames, times):
+        return self.normalizer.normalize(frames, times)
+
     def run(self, data):
-        self.emit(self.normalizer.normalize(data, time.time()))
+        self.emit(self.normalizer.normalize(data, self._clock(), out=self.out))
 
 
 class Fade(PlottableNode):
-    def setup(self, falloff, monitor_client=None):
+    def setup(self, falloff, clock=time.time, monitor_client=None):
         super().setup(monitor_client=monitor_client)
+        self._clock = clock
         self._falloff = falloff
         self.last_data = None
         self.last_update = None
 
+    def output_spec(self, shape, dtype):
+        return shape, np.float64
+
+    def _factors(self, times):
+        deltas = np.diff(times, prepend=self.last_update)
+        factors = np.power(float(self._falloff), -deltas)
+        factors[deltas >= 2] = 0
+        return factors
+
+    def batch(self, frames, times):
+        if self.last_data is None:
+            self.last_data = np.array(frames[0], dtype=np.float64)
+            self.last_update = times[0]
+        faded = np.empty(frames.shape)
+        for frame, factor, out in zip(frames, self._factors(times), faded):
+            self.last_data *= factor
+            np.maximum(self.last_data, frame, out=self.last_data)
+            np.copyto(out, self.last_data)
+        self.last_update = times[-1]
+        return faded
+
     def run(self, data):
-        now = time.time()
+        now = self._clock()
         if self.last_data is None:
-            self.last_data = data
+            self.last_data = self.out
+            if self.last_data is None:
+                self.last_data = np.empty_like(data, dtype=np.float64)
+            np.copyto(self.last_data, data)
             self.last_update = now
             return
-        diff = now - self.last_update
+        delta = now - self.last_update
         self.last_update = now
-        factor = 1 / self._falloff ** (diff) if diff < 2 else 0
-        self.last_data = self.last_data * factor
-        self.last_data = np.maximum(self.last_data, data)
+        self.last_data *= 1 / self._falloff ** delta if delta < 2 else 0
+        np.maximum(self.last_data, data, out=self.last_data)
         self.emit(self.last_data)
 
 
-class Shift(Node):
-    def setup(self, minimum=0, maximum=1):
+class Shift(PlottableNode):
+    independent_frames = True
+
+    def setup(self, minimum=0, maximum=1, monitor_client=None):
+        super().setup(monitor_client=monitor_client)
         self.minimum = minimum
         self.factor = maximum - minimum
 
+    def output_spec(self, shape, dtype):
+        return shape, np.result_type(dtype, self.factor, self.minimum)
+
+    def _apply(self, result):
+        result *= self.factor
+        result += self.minimum
+
+    def fusion_ops(self):
+        return [(POINTWISE, self._apply)]
+
+    def batch(self, frames, times):
+        result = np.multiply(frames, self.factor)
+        result += self.minimum
+        return result
+
     def run(self, data):
-        self.emit(data * self.factor + self.minimum)
+        result = np.multiply(data, self.factor, out=self.out)
+        result += self.minimum
+        self.emit(result)
 
 
-class Star(Node):
-    def setup(self, ip_address, port, led_per_beam, beams, octaves):
-        self.led_per_beam = led_per_beam
-        self.beams = beams
-        self.client = air_client.AirClient(ip_address, int(port), air_client.ColorMethodGRB)
-        self._resolution = led_per_beam * 16
-        self._pre_computed_strips = self._pre_compute_strips(self._resolution)
-        self._octaves = octaves
-        # self._colors = np.array(
-        #     [
-        #         np.array([1 - b, 0, b] * led_per_beam)
-        #         for b in np.linspace(0, 1, num=self._octaves * beams)
-        #     ]
-        # ).reshape((self._octaves, beams * led_per_beam, 3))
-        self._colors = np.transpose(np.array([np.array([0, 1, 1])] * led_per_beam * beams))
-
-        self._index_mask = np.zeros(beams, dtype="int")
-        self._index_mask[1::2] = self._resolution
-
-        self._blank_frame = np.zeros(beams * led_per_beam * 3).reshape(
-            (beams * led_per_beam, 3)
+class BeatTracker(PlottableNode):
+    """Passes the spectrum through and tracks onsets and tempo on the side.
+
+    Onset strength is the half-wave rectified spectral flux of the log
+    compressed spectrum above its running mean. Tempo comes from an
+    autocorrelation of the onset strength over the last ``window_sec``
+    seconds, updated by adding the newest and removing the oldest products
+    each frame; the peak is interpolated between lags, so periods that are
+    not a whole number of frames keep their tempo. ``pulse`` jumps to 1 on a
+    beat and decays after it.
+    """
+
+    def setup(
+        self,
+        frame_rate,
+        window_sec=4,
+        min_bpm=60,
+        max_bpm=180,
+        threshold=1.5,
+        compression=1000,
+        pulse_sec=0.15,
+        min_confidence=0.2,
+        monitor_client=None,
+    ):
+        super().setup(monitor_client=monitor_client)
+        self.frame_rate = frame_rate
+        self._threshold = threshold
+        self._compression = compression
+        self._pulse_frames = pulse_sec * frame_rate
+        self._min_confidence = min_confidence
+        self._alpha = 1 / (window_sec * frame_rate)
+        self._min_gap = int(0.1 * frame_rate)
+
+        shortest = max(int(60 * frame_rate / max_bpm), 1)
+        longest = int(math.ceil(60 * frame_rate / min_bpm))
+        # Candidate periods are scored with their neighbouring lags, which
+        # share the peak of a period between two frame counts, and with
+        # their double, so the tracker does not settle an octave low.
+        self._periods = np.arange(shortest, longest + 1)
+        self._lags = np.arange(shortest - 1, 2 * longest + 2)
+        self._period_indices = self._periods - self._lags[0] - 1
+        self._double_indices = 2 * self._periods - self._lags[0] - 1
+        octaves_from_120 = np.log2(60 * frame_rate / self._periods / 120)
+        self._tempo_weights = np.exp(-0.5 * octaves_from_120 ** 2)
+        self._window = int(window_sec * frame_rate)
+        self._history = np.zeros(self._window + self._lags[-1] + 1)
+        self._position = 0
+        self._indices = np.empty(len(self._lags), dtype="int")
+        self._products = np.empty(len(self._lags))
+        self._autocorrelation = np.zeros(len(self._lags))
+        self._smoothed = np.empty(len(self._lags) - 2)
+        self._weighted = np.empty(len(self._periods))
+        self._doubles = np.empty(len(self._periods))
+        self._energy = 0.0
+
+        self._previous = None
+        self._compressed = None
+        self._mean = 0.0
+        self._deviation = 0.0
+        self._since_onset = self._min_gap
+        self._since_beat = 0
+
+        self.onset = False
+        self.strength = 0.0
+        self.bpm = 0.0
+        self.confidence = 0.0
+        self.pulse = 0.0
+        self.pulses = np.zeros(0)
+        self._readings = np.zeros(4)
+
+    def output_spec(self, shape, dtype):
+        return shape, dtype
+
+    def _flux(self, spectrum):
+        if self._previous is None:
+            self._previous = np.log1p(spectrum * self._compression)
+            self._compressed = np.empty(spectrum.shape)
+            return 0.0
+        np.multiply(spectrum, self._compression, out=self._compressed)
+        np.log1p(self._compressed, out=self._compressed)
+        np.subtract(self._compressed, self._previous, out=self._previous)
+        flux = np.add.reduce(np.maximum(self._previous, 0, out=self._previous))
+        self._previous, self._compressed = self._compressed, self._previous
+        return flux / len(spectrum)
+
+    def _lagged(self, offset):
+        np.subtract(self._position - offset, self._lags, out=self._indices)
+        np.mod(self._indices, len(self._history), out=self._indices)
+        return np.take(self._history, self._indices, out=self._products)
+
+    def _update_autocorrelation(self, strength):
+        oldest = self._history[(self._position - self._window) % len(self._history)]
+        self._autocorrelation -= oldest * self._lagged(self._window)
+        self._autocorrelation += strength * self._lagged(0)
+        self._energy += strength ** 2 - oldest ** 2
+        self._history[self._position] = strength
+        self._position = (self._position + 1) % len(self._history)
+
+    def _update_tempo(self):
+        autocorrelation = self._autocorrelation
+        np.add(autocorrelation[:-2], autocorrelation[2:], out=self._smoothed)
+        self._smoothed *= 0.5
+        self._smoothed += autocorrelation[1:-1]
+        np.take(self._smoothed, self._period_indices, out=self._weighted)
+        np.take(self._smoothed, self._double_indices, out=self._doubles)
+        self._doubles *= 0.5
+        self._weighted += self._doubles
+        self._weighted *= self._tempo_weights
+        index = self._period_indices[np.argmax(self._weighted)] + 1
+        left, centre, right = autocorrelation[index - 1 : index + 2]
+        curvature = left - 2 * centre + right
+        offset = 0.5 * (left - right) / curvature if curvature < 0 else 0.0
+        period = self._lags[index] + min(max(offset, -0.5), 0.5)
+        self.bpm = 60 * self.frame_rate / period
+        self.confidence = (
+            (centre + max(left, right)) / self._energy if self._energy > 1e-12 else 0.0
+        )
+        return period
+
+    def _update_beat(self, period):
+        self._since_beat += 1
+        on_beat = self.onset and self._since_beat >= period / 2
+        predicted = (
+            self._since_beat + 0.5 >= period and self.confidence >= self._min_confidence
         )
+        if on_beat or predicted:
+            self._since_beat = 0
+        self.pulse = math.exp(-self._since_beat / self._pulse_frames)
+
+    def run(self, data):
+        flux = self._flux(data)
+        self._deviation += self._alpha * (abs(flux - self._mean) - self._deviation)
+        self._mean += self._alpha * (flux - self._mean)
+        self.strength = max(flux - self._mean, 0.0)
+        self._since_onset += 1
+        self.onset = (
+            self.strength > self._threshold * self._deviation
+            and self._since_onset >= self._min_gap
+        )
+        if self.onset:
+            self._since_onset = 0
+
+        self._update_autocorrelation(self.strength)
+        self._update_beat(self._update_tempo())
+
+        if self.out is not None:
+            np.copyto(self.out, data)
+            data = self.out
+        self.emit(data)
+
+    def batch(self, frames, times):
+        self.pulses = np.empty(len(frames))
+        for index, frame in enumerate(frames):
+            self.run(frame)
+            self.pulses[index] = self.pulse
+            self._output_buffer.clear()
+        return frames
+
+    def plot(self, data):
+        self._readings[:] = self.pulse, self.strength, self.bpm, self.confidence
+        super().plot(self._readings)
+
+
+class FusedNode(PlottableNode):
+    def setup(self, members, monitor_client=None):
+        super().setup(monitor_client=monitor_client)
+        self.members = members
+        self._tap_name = members[-1].name
+        self._ops = [op for member in members for op in member.fusion_ops()]
+        self._length = None
+
+    def _compile(self, length):
+        self._length = length
+        self._pre_ops = []
+        self._post_ops = []
+        self._indices = None
+        for kind, argument in self._ops:
+            if kind == GATHER:
+                indices = argument(length if self._indices is None else len(self._indices))
+                self._indices = indices if self._indices is None else self._indices[indices]
+                self._post_ops = [
+                    (post_kind, post_argument[indices] if post_kind == SCALE else post_argument)
+                    for post_kind, post_argument in self._post_ops
+                ]
+            elif self._indices is None or (kind == POINTWISE and not self._post_ops):
+                self._pre_ops.append((kind, argument))
+            else:
+                self._post_ops.append((kind, argument))
+        if self._indices is None:
+            self._indices = np.arange(length)
+        self._work = np.empty(length)
+
+    @staticmethod
+    def _apply(ops, data):
+        for kind, argument in ops:
+            if kind == SCALE:
+                data *= argument
+            else:
+                argument(data)
+
+    def output_spec(self, shape, dtype):
+        self._compile(shape[0])
+        return self._indices.shape, np.float64
+
+    def plot(self, data):
+        if self.monitor_client is None:
+            return
+        self.monitor_client.send_np_array(self._tap_name, data)
+
+    def run(self, data):
+        if len(data) != self._length:
+            self._compile(len(data))
+        np.copyto(self._work, data)
+        self._apply(self._pre_ops, self._work)
+        result = np.take(self._work, self._indices, out=self.out)
+        self._apply(self._post_ops, result)
+        self.emit(result)
+
+
+class _LedOutput(PlottableNode):
+    def _setup_output(self, renderers, output_rate=None, output_mode=None):
+        self._renderers = renderers
+        self._sender = rendering.UDPBatchSender()
+        self._frames = None
+        self._clock = None
+        if output_rate:
+            self._frames = rendering.LatestFrames(renderers[0].bands)
+            self._clock = rendering.OutputClock(
+                renderers,
+                self._frames,
+                rate=output_rate,
+                mode=output_mode or rendering.OutputClock.INTERPOLATE,
+            )
+
+    def output_spec(self, shape, dtype):
+        for renderer in self._renderers:
+            _expect_length(shape, renderer.bands)
+        return None
 
-    def _make_strip(self, value):
-        scaled_value = value * self.led_per_beam
-        return np.array(
-            [0.3 for i in range(math.floor(scaled_value))]
-            + [0.3 * (scaled_value - math.floor(scaled_value))]
-            + [0 for _ in range(self.led_per_beam - math.floor(scaled_value) - 1)]
+    def render_block(self, frames):
+        """Wire pixels for a block of frames, one uint8 GRB array per renderer."""
+        return [renderer.render_block(frames) for renderer in self._renderers]
+
+    def _send(self, data):
+        if self._clock is None:
+            self._sender.send(
+                [(renderer.render(data), renderer.address) for renderer in self._renderers]
+            )
+        else:
+            self._frames.publish(data, time.monotonic())
+            if self._clock.ident is None:
+                self._clock.start()
+        if GOVERNOR.enabled:
+            GOVERNOR.frame_finished()
+        if INSTRUMENTATION.enabled:
+            INSTRUMENTATION.frame_sent()
+
+    def close(self):
+        super().close()
+        if self._clock is not None:
+            self._clock.stop()
+
+    def release(self):
+        """Closes the sockets once the node's pipeline has exited."""
+        if self._clock is not None and self._clock.ident is not None:
+            self._clock.stop()
+            self._clock.join()
+        self._sender.close()
+
+
+class Star(_LedOutput):
+    def setup(
+        self,
+        ip_address,
+        port,
+        led_per_beam,
+        beams,
+        octaves,
+        pulse=None,
+        pulse_depth=0.5,
+        output_rate=None,
+        output_mode=None,
+        change_threshold=None,
+        keepalive=1.0,
+        spans=False,
+        layout=None,
+        palette=None,
+        monitor_client=None,
+    ):
+        super().setup(monitor_client=monitor_client)
+        self._octaves = octaves
+        self._pulse = pulse
+        self._pulse_depth = pulse_depth
+        if isinstance(layout, str):
+            layout = geometry.load(layout)
+        elif layout is not None:
+            layout = geometry.from_dict(layout)
+        self.renderer = rendering.StarRenderer(
+            ip_address,
+            port,
+            led_per_beam,
+            beams,
+            threshold=change_threshold,
+            keepalive=keepalive,
+            spans=spans,
+            layout=layout,
+            palette=palette,
         )
+        self._setup_output([self.renderer], output_rate, output_mode)
 
-    def _make_reverse_strip(self, value):
-        return np.flip(self._make_strip(value), axis=0)
+    def render_block(self, frames):
+        if self._pulse is None:
+            return super().render_block(frames)
+        brightness = 1 - self._pulse_depth * (1 - self._pulse.pulses)
+        return [self.renderer.render_block(frames, brightness)]
 
-    def _pre_compute_strips(self, resolution):
-        strips = [self._make_strip(i / resolution) for i in range(resolution)]
-        reverse = [self._make_reverse_strip(i / resolution) for i in range(resolution)]
-        return np.array(strips + reverse)
+    def run(self, data):
+        if self._pulse is not None:
+            self.renderer.brightness = 1 - self._pulse_depth * (1 - self._pulse.pulse)
+        self._send(data)
 
-    def _values_to_rgb(self, values, timestamp):
-        indexes = (np.clip(np.nan_to_num(values), 0, 0.999) * self._resolution).astype(
-            "int"
-        ) + self._index_mask
-        alphas = self._pre_computed_strips[indexes].reshape(-1)
-        return np.transpose(alphas * self._colors)
+
+class MultiStar(_LedOutput):
+    def setup(self, renderers, output_rate=None, output_mode=None, monitor_client=None):
+        super().setup(monitor_client=monitor_client)
+        self.renderers = renderers
+        self._setup_output(renderers, output_rate, output_mode)
 
     def run(self, data):
-        frame = [
-            air_client.Pixel(r, g, b)
-            for r, g, b in self._values_to_rgb(data, time.time())
-        ]
-        self.client.show_frame(frame)
+        self._send(data)
 
 class Void(Node):
     def run(self, data):
@@ -0,0 +1,272 @@
+import argparse
+import dataclasses
+import multiprocessing
+import os
+import struct
+import time
+import typing as t
+
+import numpy as np
+
+from airpixel import client as air_client
+
+from audioviz import audio_tools, config, encoding, graph, nodes, sources
+
+
+MAGIC = b"AVZF"
+VERSION = 1
+HEADER = struct.Struct("<4sHdQI")
+
+CHUNK_FRAMES = 512
+
+
+class OfflineError(Exception):
+    pass
+
+
+@dataclasses.dataclass
+class FrameFile:
+    """Rendered frames as gamma corrected GRB bytes, ready to send as they are.
+
+    A small header is followed by a ``(num_frames, num_pixels, 3)`` uint8
+    array that is memory-mapped rather than read.
+    """
+
+    frame_rate: float
+    frames: np.ndarray
+
+    @classmethod
+    def create(
+        cls, path: str, frame_rate: float, num_frames: int, num_pixels: int
+    ) -> "FrameFile":
+        with open(path, "wb") as file_:
+            file_.write(HEADER.pack(MAGIC, VERSION, frame_rate, num_frames, num_pixels))
+            file_.truncate(HEADER.size + num_frames * num_pixels * 3)
+        frames = np.memmap(
+            path,
+            dtype="uint8",
+            mode="r+",
+            offset=HEADER.size,
+            shape=(num_frames, num_pixels, 3),
+        )
+        return cls(frame_rate, frames)
+
+    @classmethod
+    def open(cls, path: str) -> "FrameFile":
+        with open(path, "rb") as file_:
+            header = file_.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise OfflineError(f"{path} is not a frame file")
+        magic, version, frame_rate, num_frames, num_pixels = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise OfflineError(f"{path} is not a version {VERSION} frame file")
+        frames = np.memmap(
+            path,
+            dtype="uint8",
+            mode="r",
+            offset=HEADER.size,
+            shape=(num_frames, num_pixels, 3),
+        )
+        return cls(frame_rate, frames)
+
+
+_WORKER: t.Optional["OfflineRenderer"] = None
+
+
+def _start_worker(renderer: "OfflineRenderer") -> None:
+    global _WORKER
+    _WORKER = renderer
+
+
+def _analyse_in_worker(chunk: t.Tuple[int, int]) -> np.ndarray:
+    return _WORKER.analyse(*chunk)
+
+
+class OfflineRenderer:
+    """Renders a recording through a configured pipeline as fast as possible.
+
+    Every frame the audio node would have produced is cut straight from the
+    recording, and the nodes run on blocks of frames through ``batch``. The
+    leading nodes with ``independent_frames`` run in a pool of forked
+    processes, one chunk per task; the others run in order in this process,
+    with frame times taken from the sample position instead of the clock.
+    """
+
+    def __init__(
+        self,
+        pipeline_config: config.PipelineConfig,
+        source: sources.ReplaySource,
+        chunk_frames: int = CHUNK_FRAMES,
+        processes: t.Optional[int] = None,
+        **extra_constants: t.Any,
+    ) -> None:
+        self._source = source
+        self._chunk_frames = chunk_frames
+        self._processes = processes or os.cpu_count() or 1
+        audio_input = audio_tools.AudioInput(source=source)
+        constants = dict(dict(ip_address="0.0.0.0", port=0), **extra_constants)
+        chain = config.build_chain(pipeline_config, audio_input, **constants)
+
+        members = list(graph.walk(chain))
+        if any(len(graph.successors(chain, node)) > 1 for node in members):
+            raise OfflineError("Only linear pipelines can be rendered offline")
+        root, *analysis, self._output = members
+        if isinstance(root, nodes.AudioGenerator):
+            self.window = root._samples
+            self.hop = root._hop or audio_input.period_size
+        elif isinstance(root, nodes.AudioStream):
+            self.window = self.hop = root._hop
+        else:
+            raise OfflineError(f"Cannot cut frames for {type(root).__name__}")
+        if not isinstance(self._output, (nodes.Star, nodes.MultiStar)):
+            raise OfflineError("The pipeline does not end in a LED output")
+
+        parallel = 0
+        while parallel < len(analysis) and analysis[parallel].independent_frames:
+            parallel += 1
+        self._parallel = analysis[:parallel]
+        self._sequential = analysis[parallel:]
+        self.sample_rate = audio_input.sample_rate
+        self.frame_rate = self.sample_rate / self.hop
+        self.num_frames = source.num_samples // self.hop
+
+    def times(self, first: int, last: int) -> np.ndarray:
+        return (np.arange(first, last) + 1) * self.hop / self.sample_rate
+
+    def frames(self, first: int, last: int) -> np.ndarray:
+        """The audio windows of frames ``first`` to ``last``, one per row."""
+        start = (first + 1) * self.hop - self.window
+        samples = self._source.mono(max(start, 0), last * self.hop)
+        if start < 0:
+            samples = np.concatenate([np.zeros(-start), samples])
+        # The capture ring stores float32, so do the same here
+        samples = samples.astype(np.float32)
+        stride = samples.strides[0]
+        return np.lib.stride_tricks.as_strided(
+            samples,
+            shape=(last - first, self.window),
+            strides=(self.hop * stride, stride),
+            writeable=False,
+        )
+
+    def analyse(self, first: int, last: int) -> np.ndarray:
+        data, times = self.frames(first, last), self.times(first, last)
+        for node in self._parallel:
+            data = node.batch(data, times)
+        return data
+
+    def _frame_files(self, path: str, blocks) -> t.List[FrameFile]:
+        if len(blocks) == 1:
+            paths = [path]
+        else:
+            stem, extension = os.path.splitext(path)
+            paths = [f"{stem}-{index}{extension}" for index in range(len(blocks))]
+        return [
+            FrameFile.create(path_, self.frame_rate, self.num_frames, block.shape[1])
+            for path_, block in zip(paths, blocks)
+        ]
+
+    def _write(self, path, chunks, analysed) -> t.List[FrameFile]:
+        frame_files = []
+        for (first, last), data in zip(chunks, analysed):
+            times = self.times(first, last)
+            for node in self._sequential:
+                data = node.batch(data, times)
+            blocks = self._output.render_block(data)
+            if not frame_files:
+                frame_files = self._frame_files(path, blocks)
+            for frame_file, pixels in zip(frame_files, blocks):
+                frame_file.frames[first:last] = pixels
+        for frame_file in frame_files:
+            frame_file.frames.flush()
+        return frame_files
+
+    def render(self, path: str) -> t.List[FrameFile]:
+        """Writes one frame file per renderer, numbered if there are several."""
+        if not self.num_frames:
+            raise OfflineError("The recording is shorter than one frame")
+        chunks = [
+            (first, min(first + self._chunk_frames, self.num_frames))
+            for first in range(0, self.num_frames, self._chunk_frames)
+        ]
+        if self._processes == 1 or len(chunks) == 1:
+            return self._write(path, chunks, (self.analyse(*chunk) for chunk in chunks))
+        context = multiprocessing.get_context("fork")
+        with context.Pool(self._processes, _start_worker, (self,)) as pool:
+            return self._write(path, chunks, pool.imap(_analyse_in_worker, chunks))
+
+
+def play(
+    frame_file: FrameFile, ip_address: str, port: int, loop: bool = False
+) -> None:
+    client = air_client.AirClient(ip_address, int(port))
+    encoder = encoding.GRBEncoder(frame_file.frames.shape[1])
+    period = 1 / frame_file.frame_rate
+    next_frame = time.monotonic()
+    while True:
+        for pixels in frame_file.frames:
+            time.sleep(max(next_frame - time.monotonic(), 0))
+            next_frame += period
+            client.send_bytes(encoder.encode_pixels(client.frame_number, pixels))
+            client.frame_number += 1
+        if not loop:
+            return
+
+
+def render_command(args) -> None:
+    pipeline_config = config.PipelineConfig.load(args.config)
+    source = sources.ReplaySource(
+        args.recording,
+        sample_rate=args.sample_rate,
+        period_size=args.period_size,
+        realtime=False,
+        loop=False,
+    )
+    renderer = OfflineRenderer(
+        pipeline_config, source, chunk_frames=args.chunk_frames, processes=args.processes
+    )
+    start = time.perf_counter()
+    frame_files = renderer.render(args.frames)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{renderer.num_frames} frames at {renderer.frame_rate:.1f} fps into "
+        f"{len(frame_files)} file(s) in {elapsed:.2f} s, "
+        f"{source.duration / elapsed:.0f}x real time"
+    )
+
+
+def play_command(args) -> None:
+    play(FrameFile.open(args.frames), args.ip_address, args.port, loop=args.loop)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m audioviz.offline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render_parser = commands.add_parser("render", help="render a recording to a frame file")
+    render_parser.add_argument("recording", help="WAV or raw S32_LE file")
+    render_parser.add_argument("frames", help="frame file to write")
+    render_parser.add_argument("--config", default="star.yaml")
+    render_parser.add_argument(
+        "--sample-rate", type=int, default=None, help="needed for raw recordings"
+    )
+    render_parser.add_argument("--period-size", type=int, default=1024)
+    render_parser.add_argument("--chunk-frames", type=int, default=CHUNK_FRAMES)
+    render_parser.add_argument(
+        "--processes", type=int, default=None, help="defaults to one per core"
+    )
+    render_parser.set_defaults(run=render_command)
+
+    play_parser = commands.add_parser("play", help="stream a frame file to a ring")
+    play_parser.add_argument("frames")
+    play_parser.add_argument("ip_address")
+    play_parser.add_argument("port", type=int)
+    play_parser.add_argument("--loop", action="store_true")
+    play_parser.set_defaults(run=play_command)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
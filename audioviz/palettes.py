@@ -0,0 +1,60 @@
+import dataclasses
+import typing as t
+
+import numpy as np
+
+
+@dataclasses.dataclass(frozen=True)
+class Palette:
+    """Colours spread evenly from the first band to the last, blended between.
+
+    ``brightness`` scales every colour. ``gamma`` replaces airpixel's gamma
+    table with a power curve.
+    """
+
+    colors: t.Tuple[t.Tuple[float, float, float], ...]
+    brightness: float = 1.0
+    gamma: t.Optional[float] = None
+
+    def band_colors(self, bands: int) -> np.ndarray:
+        """One RGB row per band."""
+        stops = np.array(self.colors, dtype=np.float64).reshape(-1, 3)
+        if len(stops) == 1 or bands == 1:
+            return np.tile(stops[0], (bands, 1)) * self.brightness
+        positions = np.linspace(0, 1, len(stops))
+        at = np.linspace(0, 1, bands)
+        return (
+            np.stack([np.interp(at, positions, stops[:, channel]) for channel in range(3)], 1)
+            * self.brightness
+        )
+
+
+PALETTES = {
+    "cyan": Palette(((0, 1, 1),)),
+    "red-blue": Palette(((1, 0, 0), (0, 0, 1))),
+    "fire": Palette(((1, 0, 0), (1, 0.4, 0), (1, 0.9, 0.2))),
+    "ocean": Palette(((0, 0.2, 1), (0, 1, 1), (0.6, 1, 0.8))),
+    "rainbow": Palette(
+        ((1, 0, 0), (1, 1, 0), (0, 1, 0), (0, 1, 1), (0, 0, 1), (1, 0, 1))
+    ),
+}
+DEFAULT = "cyan"
+
+
+def get(palette: t.Union[None, str, t.Dict[str, t.Any], Palette]) -> Palette:
+    """A palette by name, from a config dict, or the default one."""
+    if palette is None:
+        return PALETTES[DEFAULT]
+    if isinstance(palette, Palette):
+        return palette
+    if isinstance(palette, str):
+        if palette not in PALETTES:
+            raise ValueError(f"Unknown palette {palette!r}, pick one of {sorted(PALETTES)}")
+        return PALETTES[palette]
+    if not palette.get("colors"):
+        raise ValueError("A palette needs a non-empty list of 'colors'")
+    return Palette(
+        tuple(tuple(color) for color in palette["colors"]),
+        brightness=palette.get("brightness", 1.0),
+        gamma=palette.get("gamma"),
+    )
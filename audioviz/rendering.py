@@ -0,0 +1,296 @@
+import socket
+import time
+import typing as t
+
+import numpy as np
+
+from audioviz import audio_tools, encoding, geometry, palettes
+
+
+STRIP_BRIGHTNESS = 0.3
+BRIGHTNESS_STEPS = 16
+MAX_TABLE_BYTES = 16 * 2 ** 20
+
+
+def color_table(
+    band_colors: np.ndarray, resolution: int, steps: int, gamma: t.Optional[float]
+) -> np.ndarray:
+    """Wire bytes of every band colour for every brightness step and LED fill.
+
+    An LED filled to ``fill`` shows ``fill / resolution`` of its colour. The
+    result has the shape ``(steps, bands, resolution + 1, 3)``.
+    """
+    fills = np.arange(resolution + 1) / resolution * STRIP_BRIGHTNESS
+    rgb = fills[:, np.newaxis] * band_colors[:, np.newaxis]
+    rgb = rgb * np.linspace(0, 1, steps).reshape((-1, 1, 1, 1))
+    return encoding.grb_levels(
+        rgb, None if gamma is None else encoding.power_gamma_table(gamma)
+    )
+
+
+class StarRenderer:
+    """Renders band levels as bars of LEDs.
+
+    Without ``layout`` the LEDs form a ring of ``beams`` radial strips of
+    ``led_per_beam`` LEDs, mirrored and rolled as asked. Any layout is
+    compiled to index maps up front. How far each LED is lit follows from
+    its bar's level with integer operations, and colour, brightness and
+    gamma are compiled with the palette into a table of wire bytes per band
+    and fill, so a frame ends in one gather straight into the message,
+    whatever the shape of the installation. ``brightness`` is rounded to one
+    of ``BRIGHTNESS_STEPS`` steps.
+    """
+
+    RESOLUTION_PER_LED = 16
+
+    def __init__(
+        self,
+        ip_address: str,
+        port: int,
+        led_per_beam: int,
+        beams: int,
+        mirror: bool = False,
+        reverse: bool = False,
+        roll: int = 0,
+        threshold: t.Optional[int] = None,
+        keepalive: float = 1.0,
+        spans: bool = False,
+        layout: t.Optional[geometry.Layout] = None,
+        palette=None,
+    ) -> None:
+        self.address = (ip_address, int(port))
+        self.frame_number = 0
+        self.brightness = 1.0
+        if layout is None:
+            if mirror:
+                mirror_mode = geometry.REVERSE if reverse else geometry.FORWARD
+            else:
+                mirror_mode = None
+            layout = geometry.ring(beams, led_per_beam, mirror=mirror_mode, roll=roll)
+        self.layout = layout
+        self.full_resolution = layout.max_length * self.RESOLUTION_PER_LED
+        self._led_lengths = layout.lengths[layout.led_columns].astype("int")
+        self._led_offsets = layout.offsets[layout.led_columns].astype("int")
+
+        self._table = None
+        self._compile(self.full_resolution, palettes.get(palette))
+
+        self._levels = np.empty(layout.bands)
+        self._level_indexes = np.empty(layout.bands, dtype="int")
+        self._indexes = np.empty(layout.num_pixels, dtype="int")
+        self._encoder = encoding.GRBEncoder(layout.num_pixels)
+        self.change_filter = None
+        if threshold is not None:
+            self.change_filter = encoding.ChangeFilter(
+                self._encoder, threshold=threshold, keepalive=keepalive, spans=spans
+            )
+
+    def _compile(self, resolution: int, palette: palettes.Palette) -> None:
+        size = BRIGHTNESS_STEPS * self.layout.bands * (resolution + 1) * 3
+        if size > MAX_TABLE_BYTES:
+            raise ValueError(
+                f"A colour table of {resolution} levels for {self.layout.bands} bands "
+                f"needs {size} bytes, more than {MAX_TABLE_BYTES}"
+            )
+        table = color_table(
+            palette.band_colors(self.layout.bands),
+            resolution,
+            BRIGHTNESS_STEPS,
+            palette.gamma,
+        )
+        # An LED's fill is level * length - offset * resolution, clipped to one LED
+        floors = self._led_offsets * resolution
+        bases = self.layout.led_bands * (resolution + 1)
+        step_size = self.layout.bands * (resolution + 1)
+        # One assignment, so a render on another thread never mixes tables
+        self._table = (resolution, palette, table.reshape((-1, 3)), floors, bases, step_size)
+
+    @property
+    def _resolution(self) -> int:
+        return self._table[0]
+
+    @property
+    def palette(self) -> palettes.Palette:
+        return self._table[1]
+
+    def set_resolution(self, resolution: int) -> None:
+        if resolution != self._resolution:
+            self._compile(resolution, self.palette)
+
+    def set_palette(self, palette) -> None:
+        """Switches to a palette given by name, config dict or ``Palette``."""
+        palette = palettes.get(palette)
+        if palette != self.palette:
+            self._compile(self._resolution, palette)
+
+    @property
+    def bands(self) -> int:
+        return self.layout.bands
+
+    def _step(self, brightness: float) -> int:
+        step = int(brightness * (BRIGHTNESS_STEPS - 1) + 0.5)
+        return min(max(step, 0), BRIGHTNESS_STEPS - 1)
+
+    def render_pixels(self, values) -> np.ndarray:
+        """Writes the wire pixels of one frame into the message buffer."""
+        resolution, _, table, floors, bases, step_size = self._table
+        np.clip(values, 0, 0.999, out=self._levels)
+        np.nan_to_num(self._levels, copy=False)
+        self._levels *= resolution
+        np.copyto(self._level_indexes, self._levels, casting="unsafe")
+        np.take(self._level_indexes, self.layout.led_bands, out=self._indexes)
+        self._indexes *= self._led_lengths
+        self._indexes -= floors
+        np.maximum(self._indexes, 0, out=self._indexes)
+        np.minimum(self._indexes, resolution, out=self._indexes)
+        self._indexes += bases
+        self._indexes += self._step(self.brightness) * step_size
+        # Indexes are in range, and "clip" spares take a buffered copy
+        return np.take(table, self._indexes, axis=0, out=self._encoder.pixels, mode="clip")
+
+    def render_block(
+        self, values: np.ndarray, brightness: t.Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """GRB wire pixels for a block of frames, one row of band values each."""
+        resolution, _, table, floors, bases, step_size = self._table
+        levels = (np.nan_to_num(np.clip(values, 0, 0.999)) * resolution).astype("int")
+        if brightness is None:
+            steps = np.full(len(values), self._step(self.brightness))
+        else:
+            steps = (np.asarray(brightness) * (BRIGHTNESS_STEPS - 1) + 0.5).astype("int")
+            steps = np.clip(steps, 0, BRIGHTNESS_STEPS - 1)
+        fills = np.take(levels, self.layout.led_bands, axis=1) * self._led_lengths
+        fills -= floors
+        np.clip(fills, 0, resolution, out=fills)
+        fills += bases + steps[:, np.newaxis] * step_size
+        return np.take(table, fills, axis=0)
+
+    def render(self, values) -> t.Optional[bytearray]:
+        self.render_pixels(values)
+        message = self._encoder.encode_header(self.frame_number)
+        self.frame_number += 1
+        if self.change_filter is not None:
+            return self.change_filter.filter(message)
+        return message
+
+
+class UDPBatchSender:
+    def __init__(self) -> None:
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def send(
+        self, messages: t.Iterable[t.Tuple[t.Optional[bytes], t.Tuple[str, int]]]
+    ) -> None:
+        for message, address in messages:
+            if message is None:
+                continue
+            try:
+                self.socket.sendto(message, address)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+class LatestFrames:
+    """Hands the newest analysis frames to the output clock without locking.
+
+    The writer fills slot ``sequence % SLOTS`` and then bumps ``sequence``.
+    A reader copies the two newest frames and retries if the writer got far
+    enough in the meantime to reuse one of their slots.
+    """
+
+    SLOTS = 4
+
+    def __init__(self, length: int) -> None:
+        self.sequence = 0
+        self._values = np.zeros((self.SLOTS, length))
+        self._times = np.zeros(self.SLOTS)
+
+    def publish(self, values: np.ndarray, timestamp: float) -> None:
+        slot = self.sequence % self.SLOTS
+        np.copyto(self._values[slot], values)
+        self._times[slot] = timestamp
+        self.sequence += 1
+
+    def read(self, previous: np.ndarray, latest: np.ndarray) -> t.Tuple[float, float]:
+        while True:
+            sequence = self.sequence
+            older, newer = (sequence - 2) % self.SLOTS, (sequence - 1) % self.SLOTS
+            np.copyto(previous, self._values[older])
+            np.copyto(latest, self._values[newer])
+            times = self._times[older], self._times[newer]
+            if self.sequence < sequence + 2:
+                return times
+
+
+class OutputClock(audio_tools.LoopingThread):
+    """Renders and sends at a fixed rate, blending the two newest analysis frames.
+
+    ``interpolate`` renders one analysis interval behind and blends between
+    the frames; ``extrapolate`` continues the latest change for at most
+    ``max_extrapolation`` intervals, trading overshoot for latency.
+    """
+
+    INTERPOLATE = "interpolate"
+    EXTRAPOLATE = "extrapolate"
+
+    def __init__(
+        self,
+        renderers: t.Sequence[StarRenderer],
+        frames: LatestFrames,
+        rate: float = 120,
+        mode: str = INTERPOLATE,
+        max_extrapolation: float = 1.0,
+    ) -> None:
+        super().__init__(name="output-clock-thread")
+        if mode not in (self.INTERPOLATE, self.EXTRAPOLATE):
+            raise ValueError(f"Unknown output clock mode: {mode}")
+        self._renderers = renderers
+        self._frames = frames
+        self._period = 1 / rate
+        self._mode = mode
+        self._max_extrapolation = max_extrapolation
+        self._sender = None
+        length = frames._values.shape[1]
+        self._previous = np.zeros(length)
+        self._latest = np.zeros(length)
+        self._blended = np.zeros(length)
+        self._next_tick = 0.0
+
+    def blend(self, now: float) -> np.ndarray:
+        previous_time, latest_time = self._frames.read(self._previous, self._latest)
+        interval = latest_time - previous_time
+        if interval <= 0:
+            return self._latest
+        if self._mode == self.INTERPOLATE:
+            weight = min(max((now - latest_time) / interval, 0.0), 1.0)
+        else:
+            weight = 1 + min(max((now - latest_time) / interval, 0.0), self._max_extrapolation)
+        np.subtract(self._latest, self._previous, out=self._blended)
+        self._blended *= weight
+        self._blended += self._previous
+        return self._blended
+
+    def setup(self) -> None:
+        super().setup()
+        self._sender = UDPBatchSender()
+        self._next_tick = time.monotonic()
+
+    def tear_down(self) -> None:
+        self._sender.close()
+
+    def loop(self) -> None:
+        now = time.monotonic()
+        if now < self._next_tick:
+            time.sleep(self._next_tick - now)
+            now = self._next_tick
+        self._next_tick = max(self._next_tick + self._period, now)
+        if self._frames.sequence < 2:
+            return
+        values = self.blend(now)
+        self._sender.send(
+            [(renderer.render(values), renderer.address) for renderer in self._renderers]
+        )
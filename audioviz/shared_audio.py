@@ -0,0 +1,175 @@
+import sys
+import time
+import typing as t
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy
+
+from audioviz import audio_tools
+
+
+DEFAULT_NAME = "audioviz-capture"
+
+SEQUENCE, WRITTEN, SAMPLE_RATE, PERIOD_SIZE, BUFFER_LENGTH, CAPTURE_TIME_NS = range(6)
+HEADER_FIELDS = 6
+HEADER_DTYPE = numpy.dtype("int64")
+
+
+def _header(shm):
+    return numpy.ndarray((HEADER_FIELDS,), dtype=HEADER_DTYPE, buffer=shm.buf)
+
+
+def _data(shm, buffer_length):
+    return numpy.ndarray(
+        (2 * buffer_length,),
+        dtype=numpy.float32,
+        buffer=shm.buf,
+        offset=HEADER_FIELDS * HEADER_DTYPE.itemsize,
+    )
+
+
+class SharedRingBuffer(audio_tools.RingBuffer):
+    """RingBuffer living in shared memory, guarded by a sequence lock.
+
+    The writer makes ``SEQUENCE`` odd before it touches the ring and even
+    again afterwards, clears included, and never waits for readers. Readers
+    copy what they need and start over if the counter was odd or changed in
+    the meantime, so a slow reader only delays itself.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, length: int) -> None:
+        self._header = _header(shm)
+        super().__init__(length, data=_data(shm, length))
+
+    @property
+    def written(self) -> int:
+        return int(self._header[WRITTEN])
+
+    @written.setter
+    def written(self, value: int) -> None:
+        self._header[WRITTEN] = value
+
+    def clear(self) -> None:
+        self._header[SEQUENCE] += 1
+        super().clear()
+        self._header[SEQUENCE] += 1
+
+    def write(self, samples: numpy.ndarray) -> None:
+        self._header[SEQUENCE] += 1
+        super().write(samples)
+        self._header[CAPTURE_TIME_NS] = time.monotonic_ns()
+        self._header[SEQUENCE] += 1
+
+    @property
+    def capture_time(self) -> t.Optional[float]:
+        capture_time_ns = int(self._header[CAPTURE_TIME_NS])
+        return capture_time_ns / 1e9 if capture_time_ns else None
+
+    def _stable_sequence(self) -> int:
+        sequence = int(self._header[SEQUENCE])
+        while sequence % 2:
+            time.sleep(0)
+            sequence = int(self._header[SEQUENCE])
+        return sequence
+
+    def consistent(self, read: t.Callable[[int], t.Any]) -> t.Any:
+        while True:
+            sequence = self._stable_sequence()
+            try:
+                result = read(self.written)
+            except ValueError:
+                # A torn ``written`` can ask for an impossible window
+                if int(self._header[SEQUENCE]) == sequence:
+                    raise
+                continue
+            if int(self._header[SEQUENCE]) == sequence:
+                return result
+
+
+class SharedAudioInput(audio_tools.AudioInput):
+    def __init__(self, name: str = DEFAULT_NAME, **kwargs: t.Any) -> None:
+        self.shared_memory_name = name
+        super().__init__(**kwargs)
+
+    def _make_buffer(self) -> audio_tools.RingBuffer:
+        size = HEADER_FIELDS * HEADER_DTYPE.itemsize + 2 * self.buffer_length * 4
+        self._shm = shared_memory.SharedMemory(
+            name=self.shared_memory_name, create=True, size=size
+        )
+        header = _header(self._shm)
+        header[SAMPLE_RATE] = self.sample_rate
+        header[PERIOD_SIZE] = self.period_size
+        header[BUFFER_LENGTH] = self.buffer_length
+        return SharedRingBuffer(self._shm, self.buffer_length)
+
+    def tear_down(self) -> None:
+        super().tear_down()
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SharedAudioReader:
+    def __init__(self, name: str = DEFAULT_NAME) -> None:
+        self._shm = shared_memory.SharedMemory(name=name)
+        # Readers must not unlink the segment when they exit.
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        header = _header(self._shm)
+        self.sample_rate = int(header[SAMPLE_RATE])
+        self.period_size = int(header[PERIOD_SIZE])
+        self.buffer_length = int(header[BUFFER_LENGTH])
+        self.sample_delta = 1 / self.sample_rate
+        self._poll_interval = self.period_size / self.sample_rate / 4
+        self._buffer = SharedRingBuffer(self._shm, self.buffer_length)
+
+    @property
+    def samples_written(self) -> int:
+        return self._buffer.written
+
+    @property
+    def capture_time(self) -> t.Optional[float]:
+        return self._buffer.capture_time
+
+    def wait_for_samples(self, position: int, timeout: t.Optional[float] = None) -> int:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._buffer.written < position:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(self._poll_interval)
+        return self._buffer.written
+
+    def get_samples(self, num_samples, out=None):
+        return self._buffer.consistent(
+            lambda written: self._buffer.read(num_samples, out=out)
+        )
+
+    def get_samples_since(self, position: int) -> t.Tuple[numpy.ndarray, int]:
+        return self._buffer.consistent(
+            lambda written: (
+                self._buffer.read(min(written - position, self.buffer_length)),
+                written,
+            )
+        )
+
+    def get_data(self, length=0):
+        return self.get_samples(self.seconds_to_samples(length))
+
+    def seconds_to_samples(self, seconds):
+        return int(seconds * self.sample_rate)
+
+    def close(self) -> None:
+        self._shm.close()
+
+
+def main() -> None:
+    name = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_NAME
+    audio_input = SharedAudioInput(name)
+    audio_input.start()
+    try:
+        audio_input.join()
+    except KeyboardInterrupt:
+        audio_input.stop()
+        audio_input.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import abc
+import mmap
+import struct
+import time
+import typing as t
+
+import numpy
+
+
+SAMPLE_FORMAT = numpy.dtype("<i4")
+SAMPLE_SCALE = 1 / 2 ** (8 * SAMPLE_FORMAT.itemsize - 1)
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class SourceError(Exception):
+    pass
+
+
+def encode_s32_le(samples: numpy.ndarray) -> bytes:
+    scaled = numpy.clip(samples, -1, 1 - SAMPLE_SCALE) / SAMPLE_SCALE
+    return scaled.astype(SAMPLE_FORMAT).tobytes()
+
+
+class AudioSource(abc.ABC):
+    """Produces mono S32_LE periods through the same read() as alsaaudio.PCM."""
+
+    def __init__(self, sample_rate: int, period_size: int) -> None:
+        self.sample_rate = sample_rate
+        self.period_size = period_size
+
+    @abc.abstractmethod
+    def read(self) -> t.Tuple[int, bytes]:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class AlsaSource(AudioSource):
+    number_channels = 1
+
+    def __init__(
+        self, device="default", cardindex=1, sample_rate=22050, period_size=1024
+    ) -> None:
+        import alsaaudio as alsa
+
+        super().__init__(sample_rate, period_size)
+        self._pcm = alsa.PCM(alsa.PCM_CAPTURE, alsa.PCM_NORMAL, device, cardindex=cardindex)
+        self._pcm.setperiodsize(period_size)
+        self._pcm.setrate(sample_rate)
+        self._pcm.setformat(alsa.PCM_FORMAT_S32_LE)
+        self._pcm.setchannels(self.number_channels)
+
+    def read(self) -> t.Tuple[int, bytes]:
+        return self._pcm.read()
+
+    def close(self) -> None:
+        self._pcm.close()
+
+
+class PacedSource(AudioSource):
+    def __init__(self, sample_rate: int, period_size: int, realtime: bool = True) -> None:
+        super().__init__(sample_rate, period_size)
+        self.realtime = realtime
+        self._period_duration = period_size / sample_rate
+        self._next_period = None
+
+    def _wait_for_period(self) -> None:
+        if not self.realtime:
+            return
+        now = time.monotonic()
+        if self._next_period is None or self._next_period < now - self._period_duration:
+            self._next_period = now
+        time.sleep(max(self._next_period - now, 0))
+        self._next_period += self._period_duration
+
+    @abc.abstractmethod
+    def next_period(self) -> numpy.ndarray:
+        pass
+
+    def read(self) -> t.Tuple[int, bytes]:
+        self._wait_for_period()
+        samples = self.next_period()
+        return len(samples), encode_s32_le(samples)
+
+
+def _wave_chunks(data: mmap.mmap) -> t.Dict[bytes, t.Tuple[int, int]]:
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise SourceError("Not a RIFF/WAVE file")
+    chunks = {}
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, offset)
+        chunks[chunk_id] = (offset + 8, size)
+        offset += 8 + size + size % 2
+    return chunks
+
+
+class ReplaySource(PacedSource):
+    """Replays a memory-mapped WAV file or headerless S32_LE mono recording."""
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: t.Optional[int] = None,
+        period_size: int = 1024,
+        realtime: bool = True,
+        loop: bool = True,
+    ) -> None:
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if path.lower().endswith(".wav"):
+            file_sample_rate, self._samples = self._map_wave()
+            sample_rate = sample_rate or file_sample_rate
+        else:
+            if sample_rate is None:
+                raise SourceError("Raw PCM replay needs an explicit sample rate")
+            self._samples = numpy.frombuffer(self._mmap, dtype=SAMPLE_FORMAT)[
+                :, numpy.newaxis
+            ]
+            self._scale = SAMPLE_SCALE
+        super().__init__(sample_rate, period_size, realtime=realtime)
+        self.loop = loop
+        self._position = 0
+
+    def _map_wave(self):
+        chunks = _wave_chunks(self._mmap)
+        if b"fmt " not in chunks or b"data" not in chunks:
+            raise SourceError("WAVE file without fmt or data chunk")
+        fmt_offset, _ = chunks[b"fmt "]
+        wave_format, channels, sample_rate, _, _, bits = struct.unpack_from(
+            "<HHIIHH", self._mmap, fmt_offset
+        )
+        if wave_format == WAVE_FORMAT_EXTENSIBLE:
+            (wave_format,) = struct.unpack_from("<H", self._mmap, fmt_offset + 24)
+        if wave_format == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+            dtype, self._scale = numpy.dtype("<f4"), 1
+        elif wave_format == WAVE_FORMAT_PCM and bits in (16, 32):
+            dtype = numpy.dtype(f"<i{bits // 8}")
+            self._scale = 1 / 2 ** (bits - 1)
+        else:
+            raise SourceError(f"Unsupported WAVE format {wave_format} ({bits} bit)")
+        data_offset, data_size = chunks[b"data"]
+        frames = data_size // (dtype.itemsize * channels)
+        samples = numpy.frombuffer(
+            self._mmap, dtype=dtype, count=frames * channels, offset=data_offset
+        )
+        return sample_rate, samples.reshape((frames, channels))
+
+    @property
+    def duration(self) -> float:
+        return len(self._samples) / self.sample_rate
+
+    @property
+    def num_samples(self) -> int:
+        return len(self._samples)
+
+    def mono(self, start: int, stop: int) -> numpy.ndarray:
+        return self._samples[start:stop].mean(axis=1) * self._scale
+
+    def next_period(self) -> numpy.ndarray:
+        if not self.loop and self._position >= len(self._samples):
+            raise EOFError("End of recording")
+        stop = self._position + self.period_size
+        samples = self.mono(self._position, stop)
+        self._position = stop
+        if stop > len(self._samples):
+            if not self.loop:
+                # The last, partial period goes out padded with silence
+                padding = numpy.zeros(stop - len(self._samples))
+                return numpy.concatenate([samples, padding])
+            self._position = stop - len(self._samples)
+            samples = numpy.concatenate([samples, self.mono(0, self._position)])
+        return samples
+
+    def close(self) -> None:
+        self._samples = None
+        self._mmap.close()
+        self._file.close()
+
+
+class SineSweepSource(PacedSource):
+    def __init__(
+        self,
+        start_frequency: float = 20,
+        stop_frequency: float = 10000,
+        duration: float = 10,
+        amplitude: float = 0.5,
+        sample_rate: int = 22050,
+        period_size: int = 1024,
+        realtime: bool = True,
+    ) -> None:
+        super().__init__(sample_rate, period_size, realtime=realtime)
+        self._start_note = numpy.log2(start_frequency)
+        self._octaves = numpy.log2(stop_frequency) - self._start_note
+        self._duration = duration
+        self._amplitude = amplitude
+        self._phase = 0.0
+        self._time = 0.0
+
+    def next_period(self) -> numpy.ndarray:
+        times = self._time + numpy.arange(self.period_size) / self.sample_rate
+        self._time = (self._time + self.period_size / self.sample_rate) % self._duration
+        frequencies = numpy.exp2(
+            self._start_note + self._octaves * (times % self._duration) / self._duration
+        )
+        phases = self._phase + 2 * numpy.pi * numpy.cumsum(frequencies) / self.sample_rate
+        self._phase = phases[-1] % (2 * numpy.pi)
+        return self._amplitude * numpy.sin(phases)
+
+
+class PinkNoiseSource(PacedSource):
+    # Paul Kellet's economy pinking filter, applied to white noise.
+    NUMERATOR = [0.049922035, -0.095993537, 0.050612699, -0.004408786]
+    DENOMINATOR = [1, -2.494956002, 2.017265875, -0.522189400]
+
+    def __init__(
+        self,
+        amplitude: float = 0.5,
+        sample_rate: int = 22050,
+        period_size: int = 1024,
+        realtime: bool = True,
+        seed: t.Optional[int] = None,
+    ) -> None:
+        from scipy import signal
+
+        super().__init__(sample_rate, period_size, realtime=realtime)
+        self._lfilter = signal.lfilter
+        self._amplitude = amplitude
+        self._random = numpy.random.default_rng(seed)
+        self._state = numpy.zeros(len(self.DENOMINATOR) - 1)
+
+    def next_period(self) -> numpy.ndarray:
+        white = self._random.standard_normal(self.period_size)
+        pink, self._state = self._lfilter(
+            self.NUMERATOR, self.DENOMINATOR, white, zi=self._state
+        )
+        return numpy.clip(self._amplitude * pink, -1, 1)
+
+
+class DrumLoopSource(PacedSource):
+    def __init__(
+        self,
+        bpm: float = 120,
+        amplitude: float = 0.8,
+        sample_rate: int = 22050,
+        period_size: int = 1024,
+        realtime: bool = True,
+        seed: t.Optional[int] = 0,
+    ) -> None:
+        super().__init__(sample_rate, period_size, realtime=realtime)
+        self._loop = amplitude * self._make_bar(
+            bpm, numpy.random.default_rng(seed)
+        )
+        self._position = 0
+
+    def _make_bar(self, bpm, random):
+        beat = int(self.sample_rate * 60 / bpm)
+        bar = numpy.zeros(4 * beat)
+        times = numpy.arange(beat) / self.sample_rate
+
+        kick_pitch = 50 + 100 * numpy.exp(-times * 30)
+        kick = numpy.sin(2 * numpy.pi * numpy.cumsum(kick_pitch) / self.sample_rate)
+        kick *= numpy.exp(-times * 8)
+        snare = random.uniform(-1, 1, beat) * numpy.exp(-times * 20) * 0.6
+        hat = random.uniform(-1, 1, beat // 2) * numpy.exp(-times[: beat // 2] * 80) * 0.3
+
+        for index in range(4):
+            bar[index * beat : (index + 1) * beat] += kick if index % 2 == 0 else snare
+            bar[index * beat : index * beat + len(hat)] += hat
+            bar[index * beat + beat // 2 : index * beat + beat // 2 + len(hat)] += hat
+        return numpy.clip(bar, -1, 1)
+
+    def next_period(self) -> numpy.ndarray:
+        indices = (self._position + numpy.arange(self.period_size)) % len(self._loop)
+        self._position = (self._position + self.period_size) % len(self._loop)
+        return self._loop[indices]
+
+
+SYNTHETIC_SOURCES = {
+    "sweep": SineSweepSource,
+    "pink": PinkNoiseSource,
+    "drums": DrumLoopSource,
+}
+
+
+def open_source(name: str, **kwargs: t.Any) -> AudioSource:
+    if name in SYNTHETIC_SOURCES:
+        return SYNTHETIC_SOURCES[name](**kwargs)
+    return ReplaySource(name, **kwargs)
@@ -0,0 +1,199 @@
+import math
+import multiprocessing
+import queue
+import threading
+import typing as t
+
+import numpy as np
+from pyPiper import NodeGraph, Pipeline
+
+from audioviz import graph, nodes
+from audioviz.instrumentation import INSTRUMENTATION
+
+
+class ArrayQueue:
+    """Bounded queue of preallocated arrays that drops the oldest entry when full.
+
+    ``put`` and ``get`` copy, so neither side ever holds on to a slot. With
+    ``shared`` the slots live in shared memory and the queue works across
+    forked processes.
+    """
+
+    HEAD, COUNT, DROPPED = range(3)
+
+    def __init__(self, shape, dtype, size: int = 2, shared: bool = False) -> None:
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.size = size
+        slot_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        if shared:
+            context = multiprocessing.get_context("fork")
+            slots = np.frombuffer(context.RawArray("b", size * slot_bytes), dtype=self.dtype)
+            self._times = np.frombuffer(context.RawArray("d", size))
+            self._state = np.frombuffer(context.RawArray("q", 3), dtype="int64")
+            self._changed = context.Condition()
+        else:
+            slots = np.empty(size * int(np.prod(self.shape)), dtype=self.dtype)
+            self._times = np.empty(size)
+            self._state = np.zeros(3, dtype="int64")
+            self._changed = threading.Condition()
+        self._slots = slots.reshape((size,) + self.shape)
+
+    @property
+    def dropped(self) -> int:
+        return int(self._state[self.DROPPED])
+
+    def put(self, array: np.ndarray, capture_time: t.Optional[float] = None) -> None:
+        with self._changed:
+            head, count = self._state[self.HEAD], self._state[self.COUNT]
+            if count == self.size:
+                head = self._state[self.HEAD] = (head + 1) % self.size
+                count -= 1
+                self._state[self.DROPPED] += 1
+            slot = (head + count) % self.size
+            np.copyto(self._slots[slot], array, casting="unsafe")
+            self._times[slot] = math.nan if capture_time is None else capture_time
+            self._state[self.COUNT] = count + 1
+            self._changed.notify()
+
+    def get(self, out: np.ndarray, timeout: t.Optional[float] = None) -> t.Optional[float]:
+        """Copies the oldest entry into ``out`` and returns its capture time."""
+        with self._changed:
+            if not self._changed.wait_for(lambda: self._state[self.COUNT], timeout):
+                raise queue.Empty
+            head = self._state[self.HEAD]
+            np.copyto(out, self._slots[head])
+            capture_time = self._times[head]
+            self._state[self.HEAD] = (head + 1) % self.size
+            self._state[self.COUNT] -= 1
+        return None if math.isnan(capture_time) else float(capture_time)
+
+
+class QueueSink(nodes.PlottableNode):
+    def setup(self, array_queue, monitor_client=None):
+        super().setup(monitor_client)
+        self._queue = array_queue
+
+    def run(self, data):
+        self._queue.put(data, INSTRUMENTATION.capture_time)
+
+
+class QueueSource(nodes.PlottableNode):
+    POLL_SEC = 0.1
+
+    def setup(self, array_queue, stopped=None, monitor_client=None):
+        super().setup(monitor_client)
+        self._queue = array_queue
+        self._stopped = stopped
+        self._buffer = np.empty(array_queue.shape, array_queue.dtype)
+
+    def output_spec(self, shape, dtype):
+        return self._queue.shape, self._queue.dtype
+
+    def run(self, data):
+        if self._stopped is not None and self._stopped.is_set():
+            self.close()
+            return
+        out = self._buffer if self.out is None else self.out
+        try:
+            capture_time = self._queue.get(out, timeout=self.POLL_SEC)
+        except queue.Empty:
+            return
+        if INSTRUMENTATION.enabled:
+            INSTRUMENTATION.stamp(capture_time)
+        self.emit(out)
+
+
+def _stage(members, process, stopped):
+    chain = NodeGraph(members[0])
+    for node in members[1:]:
+        chain = chain | node
+    if process:
+        for node in members:
+            node.monitor_client = None
+    return Stage(chain, process=process, stopped=stopped)
+
+
+class Stage:
+    def __init__(self, chain, process: bool = False, stopped=None) -> None:
+        self.graph = graph.fuse(chain)
+        graph.preallocate(self.graph)
+        self._stopped = stopped
+        self.process = process
+        if process:
+            context = multiprocessing.get_context("fork")
+            self._worker = context.Process(target=self._run, daemon=True)
+        else:
+            self._worker = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        Pipeline(self.graph).run()
+
+    def start(self) -> None:
+        self._worker.start()
+
+    def stop(self) -> None:
+        if self._stopped is not None:
+            self._stopped.set()
+        self.graph._root.close()
+
+    def join(self, timeout: t.Optional[float] = None) -> bool:
+        """Waits for the stage to exit and returns whether it did.
+
+        A forked stage still running after ``timeout`` is terminated, so it
+        cannot keep writing into queues that a new pipeline reuses.
+        """
+        self._worker.join(timeout)
+        if self.process and self._worker.is_alive():
+            self._worker.terminate()
+            self._worker.join()
+        return not self._worker.is_alive()
+
+    def release(self) -> None:
+        """Closes the output nodes' sockets; call once the stage has exited."""
+        for node in graph.walk(self.graph):
+            if isinstance(node, nodes._LedOutput):
+                node.release()
+
+
+def split(chain, boundaries, processes: bool = False, queue_size: int = 2):
+    """Cuts a linear chain into stages before each node named in ``boundaries``.
+
+    The first stage keeps the chain's root and always runs on a thread, since
+    the audio input lives in this process. With ``processes`` the later
+    stages run in forked processes; their nodes do not stream to the monitor
+    and the governor cannot reach them.
+    """
+    members = list(graph.walk(chain))
+    names = [node.name for node in members]
+    unknown = set(boundaries) - set(names[1:])
+    if unknown:
+        raise ValueError(f"Unknown stage boundaries: {sorted(unknown)}")
+
+    specs = []
+    shape, dtype = None, None
+    for node in members:
+        spec = node.output_spec(shape, dtype)
+        if spec is None:
+            break
+        specs.append(spec)
+        shape, dtype = spec
+
+    stopped = multiprocessing.get_context("fork").Event() if processes else None
+    stages = []
+    current = [members[0]]
+    for index, node in enumerate(members[1:], start=1):
+        if node.name not in boundaries:
+            current.append(node)
+            continue
+        if index > len(specs):
+            raise ValueError(f"Cannot split before {node.name!r}, its input shape is unknown")
+        array_queue = ArrayQueue(*specs[index - 1], size=queue_size, shared=processes)
+        current.append(QueueSink(f"{node.name}-queue-in", array_queue=array_queue))
+        stages.append(_stage(current, bool(stages) and processes, stopped))
+        source = QueueSource(
+            f"{node.name}-queue-out", array_queue=array_queue, stopped=stopped
+        )
+        current = [source, node]
+    stages.append(_stage(current, bool(stages) and processes, stopped))
+    return stages
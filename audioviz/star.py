@@ -1,94 +1,98 @@
 import typing as t
+import logging
 import time
 import sys
 import os
 
 import threading
 from airpixel import client as air_client
-from pyPiper import Pipeline
 
-from audioviz import audio_tools, nodes
+from audioviz import audio_tools, config, monitoring, taps
+from audioviz.governor import GOVERNOR
+from audioviz.instrumentation import INSTRUMENTATION
 
 
-BEAMS = 36
-LED_PER_BEAM = 8
-
 VISUALIZE = bool(os.environ.get("VISUALIZE", False))
+PROFILE = bool(os.environ.get("PROFILE", False))
+PROFILE_REPORT_SEC = 10
+GOVERN = bool(os.environ.get("GOVERN", False))
+TARGET_FPS = 30
+TAP_RECORDING = os.environ.get("TAP_RECORDING")
+
+PIPELINE_CONFIG = os.environ.get("PIPELINE_CONFIG", "star.yaml")
+MONITOR_CONFIG = "monitor.yaml"
+MONITOR_DEFAULT_POLICY = monitoring.StreamPolicy(max_rate=30)
+
+
+def monitor_client():
+    # With a monitor config, only the streams it lists are sent
+    policies, default_policy = {}, MONITOR_DEFAULT_POLICY
+    if os.path.exists(MONITOR_CONFIG):
+        policies = monitoring.load_policies(MONITOR_CONFIG, MONITOR_DEFAULT_POLICY)
+        default_policy = None
+    streamer = monitoring.MonitorStreamer(
+        air_client.MonitorClient("monitoring_uds"),
+        policies=policies,
+        default_policy=default_policy,
+    )
+    streamer.start()
+    return streamer
 
-SAMPLE_RATE = 22050
 
-PORT = 50000
+def record_taps(mon_client):
+    if not TAP_RECORDING:
+        return mon_client
+    return taps.TapRecorder(TAP_RECORDING, forward=mon_client)
 
-VOLUME_MIN_THRESHOLD = 0
-VOLUME_FALLOFF = 1.1
-VOLUME_DEBUG = 0
 
-FADE_FALLOFF = 32
+def enable_profiling(mon_client):
+    if not PROFILE:
+        return
+    logging.basicConfig(level=logging.INFO)
+    INSTRUMENTATION.enable(report_interval=PROFILE_REPORT_SEC, monitor_client=mon_client)
 
-FIRST_OCTAVE = 8
-NUM_OCTAVES = 6
 
-WINDOW_SIZE_SEC = 0.05
+def enable_governor(mon_client):
+    if not GOVERN:
+        return
+    logging.basicConfig(level=logging.INFO)
+    GOVERNOR.enable(target_fps=TARGET_FPS, monitor_client=mon_client)
 
 
-def main() -> None:
-    ip_address, port = sys.argv[1:3]
+def analysis_config(file_name=PIPELINE_CONFIG):
+    """The configured pipeline without its Star outputs, for other renderers."""
+    pipeline_config = config.PipelineConfig.load(file_name)
+    pipeline_config.nodes = [node for node in pipeline_config.nodes if node.type != "Star"]
+    return pipeline_config
 
-    mon_client = air_client.MonitorClient("monitoring_uds")
 
-    audio_input = audio_tools.AudioInput(sample_rate=SAMPLE_RATE)
+def start_audio_input(pipeline_config):
+    sample_rate = pipeline_config.constants.get("sample_rate")
+    if sample_rate is None:
+        audio_input = audio_tools.AudioInput()
+    else:
+        audio_input = audio_tools.AudioInput(sample_rate=sample_rate)
     audio_input.start()
+    return audio_input
 
-    samples = audio_input.seconds_to_samples(WINDOW_SIZE_SEC)
-    fft_node = nodes.FastFourierTransform(
-        "fft", samples=samples, sample_delta=audio_input.sample_delta, monitor_client=mon_client
-    )
 
-    pipeline = Pipeline(
-        nodes.AudioGenerator(
-            "mic", audio_input=audio_input, samples=samples, monitor_client=mon_client
-        )
-        | nodes.Hamming("hamming", samples=samples, monitor_client=mon_client)
-        | fft_node
-        | nodes.AWeighting(
-            "a-weighting", frequencies=fft_node.fourier_frequencies, monitor_client=mon_client
-        )
-        # | nodes.OctaveSubsampler(
-        #     "sampled",
-        #     start_octave=FIRST_OCTAVE,
-        #     samples_per_octave=BEAMS / NUM_OCTAVES,
-        #     num_octaves=NUM_OCTAVES,
-        #     frequencies=fft_node.fourier_frequencies,
-        #     monitor_client=mon_client,
-        # )
-        | nodes.ExponentialSubsampler("sampled", start_frequency=65, stop_frequency=1046, samples=18, frequencies=fft_node.fourier_frequencies, monitor_client=mon_client)
-        # | nodes.Gaussian("smoothed", sigma=0.5, monitor_client=mon_client)
-        # | nodes.FoldingNode("folded", samples_per_octave=BEAMS, monitor_client=mon_client)
-        # | nodes.SumMatrixVertical("sum", monitor_client=mon_client)
-        # | nodes.MaxMatrixVertical("max", monitor_client=mon_client)
-        | nodes.Normalizer(
-            "normalized",
-            min_threshold=VOLUME_MIN_THRESHOLD,
-            falloff=VOLUME_FALLOFF,
-            monitor_client=mon_client,
-        )
-        | nodes.Square("square", monitor_client=mon_client)
-        # | nodes.Logarithm("log", i_0=0.03, monitor_client=mon_client)
-        # | nodes.Fade("fade", falloff=FADE_FALLOFF, monitor_client=mon_client)
-        # | nodes.Shift("clip", minimum=0.14)
-        | nodes.Mirror("mirrored", reverse=False, monitor_client=mon_client)
-        | nodes.Roll("rolled", shift=16, monitor_client=mon_client)
-        | nodes.Star(
-            "ring",
-            ip_address=ip_address,
-            port=port,
-            led_per_beam=LED_PER_BEAM,
-            beams=BEAMS,
-            octaves=NUM_OCTAVES,
-        )
-    )
+def main() -> None:
+    ip_address, port = sys.argv[1:3]
 
-    pipeline.run()
+    pipeline_config = config.PipelineConfig.load(PIPELINE_CONFIG)
+    mon_client = record_taps(monitor_client())
+    enable_profiling(mon_client)
+    enable_governor(mon_client)
+    audio_input = start_audio_input(pipeline_config)
+
+    runner = config.Runner(
+        PIPELINE_CONFIG,
+        audio_input,
+        mon_client,
+        ip_address=ip_address,
+        port=port,
+    )
+    runner.run()
 
 
 if __name__ == "__main__":
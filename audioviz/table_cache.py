@@ -0,0 +1,104 @@
+import hashlib
+import os
+import tempfile
+import types
+import typing as t
+
+import numpy as np
+
+
+VERSION = 1
+
+CACHE_DIR = os.environ.get(
+    "AUDIOVIZ_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "audioviz")
+)
+
+
+def _update(hasher, value) -> None:
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        hasher.update(f"ndarray{value.dtype.str}{value.shape}".encode())
+        hasher.update(value.tobytes())
+    elif isinstance(value, (list, tuple)):
+        hasher.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update(hasher, item)
+    else:
+        hasher.update(repr(value).encode())
+
+
+def _update_code(hasher, code: types.CodeType) -> None:
+    hasher.update(code.co_code)
+    hasher.update(repr(code.co_names).encode())
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            _update_code(hasher, constant)
+        else:
+            hasher.update(repr(constant).encode())
+
+
+def key(
+    kind: str,
+    compute: t.Optional[t.Callable[..., np.ndarray]] = None,
+    /,
+    **params: t.Any,
+) -> str:
+    """Hashes ``kind``, the bytecode of ``compute`` and ``params``.
+
+    Editing ``compute`` itself changes the key; bump ``VERSION`` when only a
+    helper it calls changes.
+    """
+    hasher = hashlib.sha256(f"{kind}-{VERSION}".encode())
+    code = getattr(compute, "__code__", None)
+    if code is not None:
+        _update_code(hasher, code)
+    elif compute is not None:
+        hasher.update(getattr(compute, "__qualname__", repr(compute)).encode())
+    for name in sorted(params):
+        hasher.update(name.encode())
+        _update(hasher, params[name])
+    return hasher.hexdigest()[:24]
+
+
+def path(
+    kind: str,
+    compute: t.Optional[t.Callable[..., np.ndarray]] = None,
+    /,
+    **params: t.Any,
+) -> str:
+    return os.path.join(CACHE_DIR, f"{kind}-{key(kind, compute, **params)}.npy")
+
+
+def _load(file_name: str) -> np.ndarray:
+    return np.load(file_name, mmap_mode="r").view(np.ndarray)
+
+
+def cached(
+    kind: str, compute: t.Callable[..., np.ndarray], **params: t.Any
+) -> np.ndarray:
+    """Returns ``compute(**params)``, memory-mapped from disk if stored before.
+
+    The file name is a hash of ``kind``, ``compute``'s bytecode and
+    ``params``, so changing any of them computes a new table. Cached tables
+    are read-only. An empty ``AUDIOVIZ_CACHE`` disables the cache.
+
+    Hashing and mapping a table takes about 0.2 ms, more than building a
+    window or a weighting curve, so only use it for slower tables.
+    """
+    if not CACHE_DIR:
+        return compute(**params)
+    file_name = path(kind, compute, **params)
+    try:
+        return _load(file_name)
+    except (OSError, ValueError):
+        pass
+    table = compute(**params)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=CACHE_DIR, suffix=".npy")
+        with os.fdopen(handle, "wb") as file_:
+            np.save(file_, table)
+        os.replace(temporary, file_name)
+    except OSError:
+        return table
+    return _load(file_name)
@@ -0,0 +1,342 @@
+import argparse
+import dataclasses
+import os
+import struct
+import time
+import typing as t
+
+import numpy as np
+import yaml
+
+from audioviz import audio_tools, config, graph, sources
+
+
+INDEX = "index.yaml"
+MAGIC = b"AVZC"
+HEADER = struct.Struct("<4s4xq")
+BLOCK_ROWS = 4096
+
+
+class TapError(Exception):
+    pass
+
+
+class Column:
+    """Append-only memory-mapped array of fixed-shape rows.
+
+    The file grows in blocks of ``BLOCK_ROWS``. The row count lives in the
+    header and is bumped after each row is written, so a reader (or a run
+    that crashed) never sees a half written row.
+    """
+
+    def __init__(self, path: str, shape: t.Tuple[int, ...], dtype) -> None:
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._row_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        with open(path, "wb") as file_:
+            file_.write(HEADER.pack(MAGIC, 0))
+        self._count = np.memmap(path, dtype="<i8", mode="r+", offset=8, shape=(1,))
+        self._rows = None
+        self._capacity = 0
+        self._grow()
+
+    def __len__(self) -> int:
+        return int(self._count[0])
+
+    def _grow(self) -> None:
+        self._capacity += BLOCK_ROWS
+        with open(self.path, "r+b") as file_:
+            file_.truncate(HEADER.size + self._capacity * self._row_bytes)
+        self._rows = np.memmap(
+            self.path,
+            dtype=self.dtype,
+            mode="r+",
+            offset=HEADER.size,
+            shape=(self._capacity,) + self.shape,
+        )
+
+    def append(self, row) -> None:
+        count = len(self)
+        if count == self._capacity:
+            self._grow()
+        self._rows[count] = row
+        self._count[0] = count + 1
+
+    def close(self) -> None:
+        self._rows.flush()
+        self._count.flush()
+        self._rows = None
+        with open(self.path, "r+b") as file_:
+            file_.truncate(HEADER.size + len(self) * self._row_bytes)
+
+    @staticmethod
+    def read(path: str, shape: t.Tuple[int, ...], dtype) -> np.ndarray:
+        with open(path, "rb") as file_:
+            magic, count = HEADER.unpack(file_.read(HEADER.size))
+        if magic != MAGIC:
+            raise TapError(f"{path} is not a tap column")
+        if not count:
+            return np.empty((0,) + tuple(shape), dtype=dtype)
+        return np.memmap(
+            path,
+            dtype=dtype,
+            mode="r",
+            offset=HEADER.size,
+            shape=(count,) + tuple(shape),
+        )
+
+
+@dataclasses.dataclass
+class Stream:
+    name: str
+    shape: t.Tuple[int, ...]
+    dtype: str
+
+    @classmethod
+    def from_dict(cls, dict_: t.Dict[str, t.Any]) -> "Stream":
+        return cls(dict_["name"], tuple(dict_["shape"]), dict_["dtype"])
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {"name": self.name, "shape": list(self.shape), "dtype": self.dtype}
+
+
+def _file_name(stream_name: str, column: str) -> str:
+    return f"{stream_name.replace(os.sep, '_')}.{column}"
+
+
+class TapRecorder:
+    """Records node outputs into a directory of columnar logs.
+
+    It takes the place of a monitor client, so every node that would plot
+    records instead; ``forward`` passes the data on to a real monitor. Each
+    stream gets a column of timestamps and one of values. The first frame
+    fixes a stream's shape, later frames of another shape are counted in
+    ``skipped`` and not recorded.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        streams: t.Optional[t.Collection[str]] = None,
+        forward=None,
+        clock: t.Callable[[], float] = time.monotonic,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.skipped = 0
+        self._selected = None if streams is None else set(streams)
+        self._forward = forward
+        self._clock = clock
+        self._streams: t.Dict[str, Stream] = {}
+        self._columns: t.Dict[str, t.Tuple[Column, Column]] = {}
+
+    def _open(self, stream_id: str, data: np.ndarray) -> t.Tuple[Column, Column]:
+        stream = Stream(stream_id, data.shape, data.dtype.str)
+        path = os.path.join(self.directory, _file_name(stream_id, "{}"))
+        columns = (
+            Column(path.format("time"), (), "<f8"),
+            Column(path.format("data"), stream.shape, stream.dtype),
+        )
+        self._streams[stream_id] = stream
+        self._columns[stream_id] = columns
+        with open(os.path.join(self.directory, INDEX), "w") as file_:
+            yaml.safe_dump(
+                {"streams": [stream.to_dict() for stream in self._streams.values()]}, file_
+            )
+        return columns
+
+    def send_np_array(self, stream_id: str, data: np.ndarray) -> None:
+        if self._selected is None or stream_id in self._selected:
+            data = np.asarray(data)
+            columns = self._columns.get(stream_id)
+            if columns is None:
+                columns = self._open(stream_id, data)
+            times, values = columns
+            if data.shape == values.shape:
+                values.append(data)
+                times.append(self._clock())
+            else:
+                self.skipped += 1
+        if self._forward is not None:
+            self._forward.send_np_array(stream_id, data)
+
+    def close(self) -> None:
+        for columns in self._columns.values():
+            for column in columns:
+                column.close()
+
+
+class TapLog:
+    """Reads a directory written by ``TapRecorder``, memory-mapped."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        try:
+            with open(os.path.join(directory, INDEX)) as file_:
+                index = yaml.safe_load(file_) or {}
+        except OSError as error:
+            raise TapError(f"{directory} is not a tap recording") from error
+        self.streams = {
+            stream.name: stream
+            for stream in map(Stream.from_dict, index.get("streams") or [])
+        }
+
+    def read(self, stream_id: str) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Timestamps and values of ``stream_id``, one row per frame."""
+        if stream_id not in self.streams:
+            raise TapError(f"No stream {stream_id!r} in {self.directory}")
+        stream = self.streams[stream_id]
+        path = os.path.join(self.directory, _file_name(stream_id, "{}"))
+        times = Column.read(path.format("time"), (), "<f8")
+        values = Column.read(path.format("data"), stream.shape, stream.dtype)
+        count = min(len(times), len(values))
+        return times[:count], values[:count]
+
+
+class VirtualClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@dataclasses.dataclass
+class NodeReport:
+    name: str
+    frames: int
+    timings: np.ndarray
+    compared: int = 0
+    max_difference: float = 0.0
+
+    @property
+    def percentiles(self) -> np.ndarray:
+        if not len(self.timings):
+            return np.zeros(3)
+        return np.percentile(self.timings, (50, 95, 99))
+
+
+class Replay:
+    """Feeds a recorded tap into the nodes after it and checks what comes out.
+
+    The chain is built from ``pipeline_config`` without fusion, and the nodes
+    after the one named ``tap`` run frame by frame on the recorded values. A
+    virtual clock set to each frame's timestamp replaces the wall clock, so
+    replays are deterministic. Every node is timed, and outputs of nodes that
+    were recorded too are compared with the recording. With ``record`` the
+    replayed outputs are recorded into that directory, to compare against
+    later.
+    """
+
+    def __init__(
+        self,
+        pipeline_config: config.PipelineConfig,
+        tap_log: TapLog,
+        tap: str,
+        audio_input=None,
+        record: t.Optional[str] = None,
+        **extra_constants: t.Any,
+    ) -> None:
+        self._tap_log = tap_log
+        self._tap = tap
+        self.clock = VirtualClock()
+        self._recorder = None if record is None else TapRecorder(record, clock=self.clock)
+        if audio_input is None:
+            audio_input = audio_tools.AudioInput(source=sources.SineSweepSource(realtime=False))
+        constants = dict(dict(ip_address="0.0.0.0", port=0), **extra_constants)
+        chain = config.build_chain(
+            pipeline_config, audio_input, self._recorder, clock=self.clock, **constants
+        )
+        members = list(graph.walk(chain))
+        names = [node.name for node in members]
+        if tap not in names:
+            raise TapError(f"The pipeline has no node {tap!r}")
+        self.nodes = members[names.index(tap) + 1 :]
+        if any(len(graph.successors(chain, node)) > 1 for node in members):
+            raise TapError("Only linear pipelines can be replayed")
+
+    def run(self) -> t.List[NodeReport]:
+        times, frames = self._tap_log.read(self._tap)
+        timings = np.zeros((len(self.nodes), len(frames)))
+        outputs: t.List[t.List[np.ndarray]] = [[] for _ in self.nodes]
+        for index, (now, frame) in enumerate(zip(times, frames)):
+            self.clock.now = float(now)
+            data = [np.array(frame)]
+            if self._recorder is not None:
+                self._recorder.send_np_array(self._tap, data[0])
+            for position, node in enumerate(self.nodes):
+                emitted = []
+                for item in data:
+                    start = time.perf_counter()
+                    node.run(item)
+                    timings[position, index] += time.perf_counter() - start
+                    emitted.extend(np.array(parcel.data) for parcel in node._output_buffer)
+                    node._output_buffer.clear()
+                outputs[position].extend(emitted)
+                data = emitted
+        if self._recorder is not None:
+            self._recorder.close()
+        return [
+            self._report(node, timings[position], outputs[position])
+            for position, node in enumerate(self.nodes)
+        ]
+
+    def _report(self, node, timings, outputs) -> NodeReport:
+        report = NodeReport(node.name, len(outputs), timings)
+        if node.name not in self._tap_log.streams or not outputs:
+            return report
+        _, recorded = self._tap_log.read(node.name)
+        count = min(len(recorded), len(outputs))
+        if count and recorded.shape[1:] == outputs[0].shape:
+            report.compared = count
+            report.max_difference = float(
+                np.max(np.abs(np.array(outputs[:count]) - recorded[:count]))
+            )
+        return report
+
+
+def replay_command(args) -> None:
+    pipeline_config = config.PipelineConfig.load(args.config)
+    audio_input = audio_tools.AudioInput(
+        source=sources.SineSweepSource(
+            sample_rate=args.sample_rate, period_size=args.period_size, realtime=False
+        )
+    )
+    replay = Replay(
+        pipeline_config, TapLog(args.recording), args.tap, audio_input, record=args.record
+    )
+    reports = replay.run()
+    print(f"{'node':>16} {'frames':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max diff':>10}")
+    for report in reports:
+        p50, p95, p99 = report.percentiles * 1e6
+        difference = f"{report.max_difference:.3g}" if report.compared else "-"
+        print(
+            f"{report.name:>16} {report.frames:>7} {p50:>6.1f} us {p95:>6.1f} us "
+            f"{p99:>6.1f} us {difference:>10}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m audioviz.taps")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = commands.add_parser(
+        "replay", help="run the nodes after a recorded tap and compare their outputs"
+    )
+    replay_parser.add_argument("recording", help="directory written by TapRecorder")
+    replay_parser.add_argument("tap", help="node whose recorded output is fed in")
+    replay_parser.add_argument("--config", default="star.yaml")
+    replay_parser.add_argument("--sample-rate", type=int, default=22050)
+    replay_parser.add_argument("--period-size", type=int, default=1024)
+    replay_parser.add_argument(
+        "--record", default=None, help="record the replayed outputs into this directory"
+    )
+    replay_parser.set_defaults(run=replay_command)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
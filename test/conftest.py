@@ -0,0 +1,11 @@
+import pytest
+
+from audioviz import table_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keeps the table cache of every test out of the user's home directory."""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(table_cache, "CACHE_DIR", str(cache_dir))
+    return cache_dir
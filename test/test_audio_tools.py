@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from audioviz import audio_tools
+
+
+def test_ring_buffer_wraps_around_and_counts_written_samples():
+    ring = audio_tools.RingBuffer(8)
+    ring.write(np.arange(5, dtype=np.float32))
+    ring.write(np.arange(5, 11, dtype=np.float32))
+
+    assert ring.written == 11
+    np.testing.assert_array_equal(ring.view(8), np.arange(3, 11))
+    np.testing.assert_array_equal(ring.read(3), [8, 9, 10])
+
+    ring.write(np.arange(11, 31, dtype=np.float32))
+
+    assert ring.written == 31
+    np.testing.assert_array_equal(ring.view(8), np.arange(23, 31))
+
+
+def test_ring_buffer_refuses_windows_longer_than_the_ring():
+    ring = audio_tools.RingBuffer(8)
+
+    with pytest.raises(ValueError):
+        ring.view(9)
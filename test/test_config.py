@@ -0,0 +1,170 @@
+import contextlib
+import shutil
+import threading
+import time
+
+import pytest
+
+from audioviz import audio_tools, config, graph, nodes, sources
+from audioviz.governor import GOVERNOR
+
+
+def _audio_input():
+    return audio_tools.AudioInput(
+        source=sources.SineSweepSource(sample_rate=22050, realtime=False)
+    )
+
+
+def _config(pipeline, **constants):
+    return config.PipelineConfig.from_dict(
+        {"constants": dict({"window_size_sec": 0.05}, **constants), "pipeline": pipeline}
+    )
+
+
+def test_star_config_builds_preallocated_graph():
+    pipeline_config = config.PipelineConfig.load("star.yaml")
+
+    built = config.build(
+        pipeline_config, _audio_input(), ip_address="127.0.0.1", port=9
+    )
+
+    names = [node.name for node in graph.walk(built)]
+    assert names[0] == "mic"
+    assert names[-1] == "ring"
+    assert built._root.out.shape == (1102,)
+
+
+def test_references_resolve_constants_and_earlier_nodes():
+    pipeline_config = _config(
+        [
+            {"type": "AudioGenerator", "name": "mic", "samples": "$window_samples"},
+            {"type": "Hamming", "name": "hamming", "samples": "$window_samples"},
+            {
+                "type": "FastFourierTransform",
+                "name": "fft",
+                "samples": "$window_samples",
+                "sample_delta": "$sample_delta",
+            },
+            {"type": "AWeighting", "name": "weighted", "frequencies": "$fft.fourier_frequencies"},
+        ]
+    )
+
+    built = config.build(pipeline_config, _audio_input())
+
+    last = list(graph.walk(built))[-1]
+    assert isinstance(last, nodes.PlottableNode)
+    assert last.out.shape == (552,)
+
+
+@pytest.mark.parametrize(
+    "pipeline, message",
+    [
+        ([{"type": "Nope", "name": "x"}], "Unknown node type"),
+        ([{"type": "Square", "name": "x", "power": 2}], "unexpected keyword"),
+        ([{"type": "Hamming", "name": "x", "samples": "$missing"}], "Unknown constant"),
+        (
+            [
+                {"type": "AudioGenerator", "name": "mic", "samples": "$window_samples"},
+                {"type": "Hamming", "name": "hamming", "samples": 100},
+            ],
+            "expected 100 values",
+        ),
+        (
+            [
+                {
+                    "type": "Star",
+                    "name": "ring",
+                    "ip_address": "127.0.0.1",
+                    "port": 9,
+                    "led_per_beam": 2,
+                    "beams": 2,
+                    "octaves": 1,
+                    "layout": {"strips": [{"leds": 2, "band": 0}, {"band": 1}]},
+                }
+            ],
+            "Strip 1 has no 'leds'",
+        ),
+    ],
+)
+def test_bad_configs_fail_at_build_time(pipeline, message):
+    with pytest.raises(config.ConfigError, match=message):
+        config.build(_config(pipeline), _audio_input())
+
+
+def test_governor_refuses_process_stages():
+    pipeline_config = config.PipelineConfig.load("star.yaml")
+    pipeline_config.stages = ["sampled"]
+    pipeline_config.processes = True
+    GOVERNOR.enable()
+    try:
+        with pytest.raises(config.ConfigError, match="governor"):
+            config.build_stages(
+                pipeline_config, _audio_input(), ip_address="127.0.0.1", port=9
+            )
+    finally:
+        GOVERNOR.disable()
+
+
+def test_duplicate_names_are_rejected():
+    with pytest.raises(config.ConfigError, match="Duplicate"):
+        _config([{"type": "Square", "name": "x"}, {"type": "Square", "name": "x"}])
+
+
+@contextlib.contextmanager
+def _running(file_name, runner_class=config.Runner):
+    audio_input = audio_tools.AudioInput(
+        source=sources.SineSweepSource(sample_rate=22050, realtime=True)
+    )
+    audio_input.start()
+    runner = runner_class(file_name, audio_input, ip_address="127.0.0.1", port=9)
+    thread = threading.Thread(target=runner.run, daemon=True)
+    thread.start()
+    try:
+        while runner._next_stages is None:
+            time.sleep(0.01)
+        yield runner
+    finally:
+        runner.stop()
+        thread.join(10)
+        audio_input.stop()
+    assert not thread.is_alive()
+
+
+def _wait_for_swap(runner, old):
+    while runner._next_stages is old or runner._swap.is_set():
+        time.sleep(0.01)
+
+
+def test_runner_swaps_after_the_old_stages_exit(tmp_path):
+    file_name = str(tmp_path / "star.yaml")
+    shutil.copy("star.yaml", file_name)
+    with _running(file_name) as runner:
+        old = runner._next_stages
+        time.sleep(0.2)
+        runner.reload()
+        _wait_for_swap(runner, old)
+
+    assert all(stage.join(0) for stage in old)
+    ring = list(graph.walk(old[-1].graph))[-1]
+    assert ring._sender.socket.fileno() == -1
+
+
+def test_window_scaling_rebuilds_on_the_watcher_thread(tmp_path):
+    file_name = str(tmp_path / "star.yaml")
+    shutil.copy("star.yaml", file_name)
+    built_on = []
+
+    class RecordingRunner(config.Runner):
+        def build(self):
+            built_on.append(threading.current_thread().name)
+            return super().build()
+
+    with _running(file_name, RecordingRunner) as runner:
+        old = runner._next_stages
+        runner.scale_window(0.5)
+        assert len(built_on) == 1
+        _wait_for_swap(runner, old)
+        mic = runner._next_stages[0].graph._root
+
+    assert built_on[1] == "config-watcher-thread"
+    assert mic._samples == 551
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from audioviz import encoding, geometry, rendering
+
+
+def test_ring_alternates_strip_direction_and_folds_mirror_and_roll():
+    layout = geometry.ring(beams=4, led_per_beam=3, mirror=geometry.FORWARD, roll=1)
+
+    assert layout.bands == 2
+    np.testing.assert_array_equal(layout.led_bands, [1] * 6 + [0] * 6)
+    np.testing.assert_array_equal(layout.offsets[layout.led_columns], [0, 1, 2, 2, 1, 0] * 2)
+
+
+def test_serpentine_matrix_maps_columns_to_bands():
+    layout = geometry.from_dict({"matrix": {"width": 3, "height": 2}})
+
+    np.testing.assert_array_equal(layout.led_bands, [0, 1, 2, 2, 1, 0])
+    np.testing.assert_array_equal(layout.offsets[layout.led_columns], [0, 0, 0, 1, 1, 1])
+
+
+def test_coordinates_light_up_each_bar_from_the_bottom():
+    layout = geometry.coordinates([(0, 2), (0, 1), (1, 0), (2, 5), (2, 3)], bands=2)
+
+    np.testing.assert_array_equal(layout.led_bands, [0, 0, 1, 1, 1])
+    np.testing.assert_array_equal(layout.offsets[layout.led_columns], [1, 0, 0, 2, 1])
+    np.testing.assert_array_equal(layout.lengths[layout.led_columns], [2, 2, 3, 3, 3])
+
+
+def test_renderer_lights_matrix_column_to_its_level():
+    layout = geometry.matrix(width=2, height=4, wiring="columns")
+    renderer = rendering.StarRenderer("127.0.0.1", 9, 0, 0, layout=layout)
+
+    pixels = renderer.render_pixels(np.array([0.5, 0.0]))
+
+    rgb = np.zeros((8, 3))
+    rgb[:2, 1:] = 0.3
+    np.testing.assert_array_equal(pixels, encoding.grb_levels(rgb))
+    np.testing.assert_array_equal(renderer.render_block(np.array([[0.5, 0.0]]))[0], pixels)
+
+
+def test_strips_name_a_missing_key():
+    with pytest.raises(ValueError, match="Strip 0 has no 'band'"):
+        geometry.strips([{"leds": 3}])
+
+
+def test_layout_needs_one_kind():
+    with pytest.raises(ValueError):
+        geometry.from_dict({"ring": {"beams": 2, "led_per_beam": 2}, "matrix": {}})
@@ -0,0 +1,52 @@
+import numpy as np
+
+from audioviz import governor, nodes
+
+
+def _governed_chain():
+    smoothed = nodes.Gaussian("smoothed", sigma=0.5, monitor_client=object())
+    star = nodes.Star(
+        "ring", ip_address="127.0.0.1", port=9, led_per_beam=8, beams=36, octaves=6
+    )
+    quality = governor.Governor()
+    quality.enable(target_fps=100, hold_sec=1)
+    quality.attach(smoothed | star)
+    return quality, smoothed, star
+
+
+def test_governor_steps_down_with_hold_and_back_up_later():
+    quality, smoothed, star = _governed_chain()
+    start = quality._last_change
+
+    quality.frame_time = 0.02
+    quality._decide(start + 0.5)
+    assert quality.level == 0
+    quality._decide(start + 1)
+    quality._decide(start + 1.5)
+    assert quality.level == 1
+    assert smoothed.monitor_client is None
+
+    quality._decide(start + 2)
+    quality._decide(start + 3)
+    assert quality.level == 3
+    assert smoothed.bypass
+    assert star.renderer._resolution == 8 * 4
+
+    quality.frame_time = 0.007
+    quality._decide(start + 4)
+    assert quality.level == 3
+    quality.frame_time = 0.001
+    quality._decide(start + 6)
+    assert quality.level == 2
+    assert star.renderer._resolution == 8 * 16
+    assert quality.metrics()["steps_up"] == 1
+
+
+def test_bypassed_gaussian_passes_data_through():
+    smoothed = nodes.Gaussian("smoothed", sigma=2)
+    smoothed.bypass = True
+    data = np.arange(5.0)
+
+    smoothed.run(data)
+
+    np.testing.assert_array_equal(smoothed._output_buffer.pop().data, data)
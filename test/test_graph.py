@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from audioviz import graph, nodes
+
+
+BANDS = 18
+
+
+def _members(kinds):
+    frequencies = np.geomspace(65, 1046, BANDS)
+    factories = {
+        "square": lambda name: nodes.Square(name),
+        "log": lambda name: nodes.Logarithm(name, i_0=0.03),
+        "shift": lambda name: nodes.Shift(name, minimum=0.1, maximum=0.9),
+        "weight": lambda name: nodes.AWeighting(name, frequencies=frequencies),
+        "mirror": lambda name: nodes.Mirror(name, reverse=True),
+        "roll": lambda name: nodes.Roll(name, shift=5),
+    }
+    return [factories[kind](f"{kind}-{index}") for index, kind in enumerate(kinds)]
+
+
+def _run(chain, data):
+    for node in graph.walk(chain):
+        node._run(data)
+        data = node._output_buffer.pop().data
+    return data
+
+
+def _chain(kinds):
+    chain = nodes.Hamming("hamming", samples=BANDS)
+    for member in _members(kinds):
+        chain = chain | member
+    return chain
+
+
+@pytest.mark.parametrize(
+    "kinds",
+    [
+        ["square", "log", "shift"],
+        ["weight", "square"],
+        ["square", "weight", "mirror"],
+        ["weight", "mirror", "roll", "square"],
+        ["mirror", "square", "roll", "log"],
+        ["roll", "weight", "shift", "mirror", "roll"],
+    ],
+)
+def test_fused_chain_matches_unfused_chain(kinds):
+    data = np.random.default_rng(0).uniform(0, 1, BANDS)
+    expected = _run(_chain(kinds), data)
+
+    fused = graph.fuse(_chain(kinds))
+
+    members = list(graph.walk(fused))
+    assert len(members) == 2
+    assert isinstance(members[-1], nodes.FusedNode)
+    np.testing.assert_allclose(_run(fused, data), expected, rtol=1e-12)
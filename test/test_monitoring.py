@@ -0,0 +1,113 @@
+import threading
+import time
+
+import numpy as np
+
+from audioviz import monitoring
+
+
+class RecordingClient:
+    def __init__(self):
+        self.sent = []
+
+    def send_np_array(self, stream_id, data):
+        self.sent.append((stream_id, data))
+
+
+def test_peak_decimation_keeps_extremes():
+    data = np.zeros(1000)
+    data[123] = 5
+    data[777] = -7
+
+    decimated = monitoring.decimate(data, 10)
+
+    assert decimated.shape == (10,)
+    assert decimated[1] == 5
+    assert decimated[7] == -7
+
+
+def test_uint8_quantization_spans_range():
+    quantized = monitoring.quantize(np.linspace(-1, 1, 5), "uint8")
+
+    assert quantized.dtype == np.uint8
+    assert quantized[0] == 0
+    assert quantized[-1] == 255
+
+
+def test_streamer_rate_limits_and_copies():
+    client = RecordingClient()
+    streamer = monitoring.MonitorStreamer(
+        client, {"fft": monitoring.StreamPolicy(max_rate=1, points=4)}
+    )
+    data = np.arange(16, dtype="float")
+
+    streamer.send_np_array("fft", data)
+    data[:] = 0
+    streamer.send_np_array("fft", data)
+    streamer.start()
+    time.sleep(0.1)
+    streamer.stop()
+
+    assert len(client.sent) == 1
+    stream_id, sent = client.sent[0]
+    assert stream_id == "fft"
+    np.testing.assert_array_equal(sent, [3, 7, 11, 15])
+
+
+def test_streamer_reduces_off_the_calling_thread(monkeypatch):
+    reducing_threads = []
+    reduce = monitoring.reduce
+
+    def recording_reduce(data, policy):
+        reducing_threads.append(threading.current_thread().name)
+        return reduce(data, policy)
+
+    monkeypatch.setattr(monitoring, "reduce", recording_reduce)
+    client = RecordingClient()
+    streamer = monitoring.MonitorStreamer(
+        client, default_policy=monitoring.StreamPolicy(points=2)
+    )
+    data = np.arange(8, dtype="float")
+
+    streamer.send_np_array("fft", data)
+    data[:] = 0
+    assert not reducing_threads
+    streamer.start()
+    time.sleep(0.1)
+    streamer.stop()
+
+    assert reducing_threads == ["monitor-stream-thread"]
+    np.testing.assert_array_equal(client.sent[0][1], [3, 7])
+
+
+def test_listed_streams_build_on_the_default_policy(tmp_path):
+    path = tmp_path / "monitor.yaml"
+    path.write_text(
+        "monitor:\n"
+        "    streams:\n"
+        "        - name: sampled\n"
+        "        - name: fft\n"
+        "          points: 128\n"
+    )
+    default = monitoring.StreamPolicy(max_rate=30)
+
+    policies = monitoring.load_policies(str(path), default)
+
+    assert policies["sampled"] == default
+    assert policies["fft"] == monitoring.StreamPolicy(max_rate=30, points=128)
+
+
+def test_streamer_without_default_policy_skips_unlisted_streams():
+    client = RecordingClient()
+    streamer = monitoring.MonitorStreamer(
+        client, {"fft": monitoring.StreamPolicy()}, default_policy=None
+    )
+
+    streamer.send_np_array("mic", np.arange(8, dtype="float"))
+    streamer.send_np_array("fft", np.arange(4, dtype="float"))
+    streamer.start()
+    time.sleep(0.1)
+    streamer.stop()
+
+    assert [stream_id for stream_id, _ in client.sent] == ["fft"]
+    assert streamer.dropped == 0
@@ -0,0 +1,323 @@
+import math
+import time
+
+import numpy as np
+import pytest
+from numpy.fft import rfftfreq
+from pyPiper import Pipeline
+
+from audioviz import audio_tools, graph, nodes, sources
+from audioviz.instrumentation import INSTRUMENTATION
+
+
+SAMPLE_RATE = 22050
+SAMPLES = 1102
+
+
+def _run(node, data):
+    node.run(data)
+    return node._output_buffer.pop().data
+
+
+def _spectrum():
+    signal = np.random.default_rng(0).uniform(-1, 1, SAMPLES)
+    fft = nodes.FastFourierTransform(
+        "fft", samples=SAMPLES, sample_delta=1 / SAMPLE_RATE
+    )
+    return fft.fourier_frequencies, _run(fft, signal)
+
+
+def test_spectral_projector_matches_node_chain():
+    frequencies, spectrum = _spectrum()
+    a_weighting = nodes.AWeighting("a-weighting", frequencies=frequencies)
+    subsampler = nodes.ExponentialSubsampler(
+        "sampled",
+        start_frequency=65,
+        stop_frequency=1046,
+        samples=18,
+        frequencies=frequencies,
+    )
+    projector = nodes.SpectralProjector(
+        "projected",
+        start_frequency=65,
+        stop_frequency=1046,
+        samples=18,
+        frequencies=frequencies,
+    )
+
+    expected = _run(subsampler, _run(a_weighting, spectrum))
+
+    np.testing.assert_allclose(_run(projector, spectrum), expected, rtol=1e-12)
+
+
+def test_spectral_projector_projects_batches():
+    frequencies, spectrum = _spectrum()
+    projector = nodes.SpectralProjector(
+        "projected",
+        start_frequency=65,
+        stop_frequency=8000,
+        samples=36,
+        frequencies=frequencies,
+        mode=nodes.SpectralProjector.INTEGRATE,
+    )
+    single = _run(projector, spectrum)
+
+    batch = _run(projector, np.stack([spectrum, 2 * spectrum]))
+
+    np.testing.assert_allclose(batch, [single, 2 * single])
+
+
+def test_spectral_projector_integrates_flat_spectrum():
+    frequencies = rfftfreq(SAMPLES, d=1 / SAMPLE_RATE)
+    projector = nodes.SpectralProjector(
+        "projected",
+        start_frequency=100,
+        stop_frequency=8000,
+        samples=24,
+        frequencies=frequencies,
+        mode=nodes.SpectralProjector.INTEGRATE,
+        a_weighting=False,
+    )
+
+    np.testing.assert_allclose(_run(projector, np.ones(len(frequencies))), 1)
+
+
+@pytest.mark.parametrize(
+    "frame_rate, bpm", [(50, 120), (43, 90), (43, 120), (43, 140), (50, 140)]
+)
+def test_beat_tracker_follows_click_track(frame_rate, bpm):
+    period = 60 * frame_rate / bpm
+    tracker = nodes.BeatTracker("beats", frame_rate=frame_rate)
+    rng = np.random.default_rng(0)
+    beats = []
+    for frame in range(frame_rate * 10):
+        spectrum = rng.uniform(0, 0.001, 552)
+        if frame == 0 or int(frame / period) != int((frame - 1) / period):
+            spectrum[:100] += 0.05
+        assert _run(tracker, spectrum) is spectrum
+        if tracker.pulse == 1:
+            beats.append(frame)
+
+    assert tracker.bpm == pytest.approx(bpm, rel=0.02)
+    assert tracker.confidence > 0.5
+    assert np.all(np.abs(np.diff(beats[-5:]) - period) < 1)
+
+
+def test_per_band_gain_control_keeps_quiet_bands_bright():
+    gain_control = nodes.GainControl(attack_sec=0, release_sec=1, per_band=True)
+    frames = np.tile([10.0, 0.1, 0.2], (20, 1))
+    times = np.arange(20) * 0.05
+
+    single = nodes.GainControl(attack_sec=0, release_sec=1, per_band=True)
+    one_by_one = [single.normalize(frame, now) for frame, now in zip(frames, times)]
+    batch = gain_control.normalize(frames, times)
+
+    np.testing.assert_allclose(batch, 1)
+    np.testing.assert_allclose(batch, one_by_one)
+
+
+def test_gain_control_step_response_starts_at_full_scale_and_never_overshoots():
+    gain_control = nodes.GainControl(attack_sec=0.05, release_sec=1)
+    times = np.arange(100) * 0.01
+    levels = np.where(np.arange(100) < 50, 0.1, 1.0)
+
+    outputs, envelopes = [], []
+    for level, now in zip(levels, times):
+        outputs.append(gain_control.normalize(np.full(4, level), now)[0])
+        envelopes.append(float(gain_control._envelope))
+
+    assert outputs[0] == 1
+    assert max(outputs) == 1
+    np.testing.assert_allclose(envelopes[54], 0.1 + 0.9 * (1 - math.exp(-1)))
+    np.testing.assert_allclose(outputs[-1], 1, atol=1e-3)
+
+
+def _old_normalizer(frames, times, min_threshold, falloff):
+    """The global ContiniuousVolumeNormalizer that GainControl replaced."""
+    threshold, last_call, normalized = min_threshold, times[0], []
+    for frame, now in zip(frames, times):
+        peak = max(np.max(frame), -np.min(frame))
+        if peak >= threshold:
+            threshold = peak
+        else:
+            factor = 1 / falloff ** (now - last_call)
+            threshold = threshold * factor + peak * (1 - factor)
+        last_call = now
+        usable = threshold >= min_threshold and threshold != 0
+        normalized.append(frame / threshold if usable else np.zeros_like(frame))
+    return np.array(normalized)
+
+
+@pytest.mark.parametrize("min_threshold", [0, 0.3])
+def test_normalizer_defaults_match_the_old_volume_normalizer(min_threshold):
+    rng = np.random.default_rng(1)
+    frames = rng.uniform(-1, 1, (200, 18)) * rng.uniform(0, 1, (200, 1))
+    times = 100 + np.cumsum(rng.uniform(0.01, 0.05, 200))
+    expected = _old_normalizer(frames, times, min_threshold, falloff=1.1)
+
+    node = nodes.Normalizer(
+        "normalized", min_threshold=min_threshold, falloff=1.1, clock=iter(times).__next__
+    )
+    one_by_one = [_run(node, frame).copy() for frame in frames]
+    batch = nodes.Normalizer("batch", min_threshold=min_threshold, falloff=1.1).batch(
+        frames, times
+    )
+
+    np.testing.assert_allclose(one_by_one, expected, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(batch, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_fade_single_frames_match_blocks():
+    frames = np.random.default_rng(2).uniform(0, 1, (50, 6))
+    times = np.cumsum(np.full(50, 0.02))
+    times[30:] += 3
+    node = nodes.Fade("fade", falloff=32, clock=iter(times).__next__)
+
+    node.run(frames[0])
+    one_by_one = [_run(node, frame).copy() for frame in frames[1:]]
+    batch = nodes.Fade("batch", falloff=32).batch(frames, times)
+
+    np.testing.assert_allclose(one_by_one, batch[1:], rtol=1e-12)
+
+
+def test_short_time_fourier_transform_matches_framed_signal():
+    audio_input = audio_tools.AudioInput(
+        source=sources.SineSweepSource(
+            sample_rate=SAMPLE_RATE, period_size=256, realtime=False
+        )
+    )
+    stream = nodes.AudioStream("mic", audio_input=audio_input, hop=256)
+    stft = nodes.ShortTimeFourierTransform(
+        "stft", samples=1024, hop=256, sample_delta=1 / SAMPLE_RATE
+    )
+    captured, spectra = [], []
+    for _ in range(12):
+        audio_input.loop()
+        samples = _run(stream, None)
+        captured.append(samples)
+        stft.run(samples)
+        spectra.extend(parcel.data for parcel in stft._output_buffer)
+        stft._output_buffer.clear()
+
+    signal = np.concatenate([np.zeros(1024 - 256)] + captured)
+    frames = np.lib.stride_tricks.sliding_window_view(signal, 1024)[::256]
+    expected = np.abs(np.fft.rfft(frames * np.hamming(1024), axis=1)) / SAMPLE_RATE
+    assert len(spectra) == 12
+    np.testing.assert_allclose(spectra, expected, rtol=1e-9, atol=1e-12)
+
+
+class _Chunks(nodes.PlottableNode):
+    def setup(self, chunks):
+        super().setup()
+        self._chunks = list(chunks)
+
+    def run(self, data):
+        if not self._chunks:
+            self.close()
+            return
+        self.emit(self._chunks.pop(0))
+
+
+class _Sink(nodes.PlottableNode):
+    def setup(self, received):
+        super().setup()
+        self._received = received
+
+    def run(self, data):
+        self._received.append(np.array(data))
+
+
+def test_short_time_fourier_transform_forwards_newest_of_pending_hops():
+    signal = np.random.default_rng(3).uniform(-1, 1, 12 * 256)
+    padded = np.concatenate([np.zeros(1024 - 256), signal])
+    frames = np.lib.stride_tricks.sliding_window_view(padded, 1024)[::256]
+    expected = np.abs(np.fft.rfft(frames * np.hamming(1024), axis=1)) / SAMPLE_RATE
+    stft = nodes.ShortTimeFourierTransform(
+        "stft", samples=1024, hop=256, sample_delta=1 / SAMPLE_RATE
+    )
+    received = []
+
+    Pipeline(
+        _Chunks("chunks", chunks=np.split(signal, 3))
+        | stft
+        | _Sink("sink", received=received)
+    ).run()
+
+    np.testing.assert_allclose(received, expected[[3, 7, 11]], rtol=1e-9, atol=1e-12)
+    assert stft.skipped == 9
+    batch = nodes.ShortTimeFourierTransform(
+        "batch", samples=1024, hop=256, sample_delta=1 / SAMPLE_RATE
+    ).batch(signal.reshape((12, 256)), np.arange(12))
+    np.testing.assert_allclose(batch, expected, rtol=1e-9, atol=1e-12)
+
+
+def test_short_time_fourier_transform_refuses_gaps():
+    with pytest.raises(ValueError, match="hop"):
+        nodes.ShortTimeFourierTransform("stft", samples=512, hop=1024, sample_delta=1)
+
+
+@pytest.mark.parametrize("frequency", [100, 440, 1500, 3000])
+def test_multirate_octave_transform_peaks_at_sine_frequency(frequency):
+    octave_transform = nodes.MultirateOctaveTransform(
+        "octaves",
+        start_octave=6,
+        samples_per_octave=4,
+        num_octaves=6,
+        sample_delta=1 / SAMPLE_RATE,
+    )
+    times = np.arange(2 * SAMPLE_RATE) / SAMPLE_RATE
+    for block in np.sin(2 * np.pi * frequency * times).reshape(-1, 441):
+        spectrum = _run(octave_transform, block)
+
+    peak = np.argmax(spectrum)
+    expected = 4 * (np.log2(frequency) - 6)
+    assert peak // 4 == int(np.log2(frequency)) - 6
+    assert abs(peak - expected) <= 1
+    assert np.sort(spectrum)[-3] < 0.6 * spectrum[peak]
+
+
+def test_preallocated_chain_writes_outputs_into_out_buffers():
+    frequencies = rfftfreq(SAMPLES, d=1 / SAMPLE_RATE)
+    chain = (
+        nodes.Hamming("hamming", samples=SAMPLES)
+        | nodes.FastFourierTransform("fft", samples=SAMPLES, sample_delta=1 / SAMPLE_RATE)
+        | nodes.SpectralProjector(
+            "projected",
+            start_frequency=65,
+            stop_frequency=1046,
+            samples=18,
+            frequencies=frequencies,
+        )
+        | nodes.Square("square")
+    )
+    graph.preallocate(chain, shape=(SAMPLES,), dtype=np.float64)
+    data = np.random.default_rng(0).uniform(-1, 1, SAMPLES)
+
+    for node in graph.walk(chain):
+        data = _run(node, data)
+        assert node.out is not None
+        assert data is node.out
+    assert graph.fresh_outputs_per_frame(chain) == 0
+
+
+class _SlowInput:
+    samples_written = 0
+    capture_time = None
+
+    def wait_for_samples(self, position, timeout=None):
+        time.sleep(0.05)
+        return position
+
+    def get_samples(self, num_samples, out=None):
+        return np.zeros(num_samples)
+
+
+def test_audio_generator_timing_leaves_out_waiting_for_samples():
+    generator = nodes.AudioGenerator("mic", audio_input=_SlowInput(), samples=64, hop=64)
+    INSTRUMENTATION.enable(report_interval=0)
+    try:
+        generator._run(None)
+    finally:
+        INSTRUMENTATION.disable()
+
+    assert INSTRUMENTATION.histograms["mic"].percentiles()[0] < 0.01
@@ -0,0 +1,56 @@
+import wave
+
+import numpy as np
+import pytest
+
+from audioviz import config, nodes, offline, sources
+
+
+def _write_wave(path, seconds=3, sample_rate=22050):
+    times = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = 0.5 * np.sin(2 * np.pi * (200 + 100 * times) * times) * np.sin(times)
+    with wave.open(str(path), "wb") as file_:
+        file_.setnchannels(1)
+        file_.setsampwidth(2)
+        file_.setframerate(sample_rate)
+        file_.writeframes((samples * 2 ** 15).astype("<i2").tobytes())
+
+
+def _renderer(path, processes):
+    source = sources.ReplaySource(str(path), realtime=False, loop=False)
+    return offline.OfflineRenderer(
+        config.PipelineConfig.load("star.yaml"), source, chunk_frames=16, processes=processes
+    )
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_offline_render_matches_frame_by_frame_run(tmp_path, processes):
+    _write_wave(tmp_path / "song.wav")
+    renderer = _renderer(tmp_path / "song.wav", processes)
+    reference = _renderer(tmp_path / "song.wav", 1)
+
+    (frame_file,) = renderer.render(str(tmp_path / "song.frames"))
+
+    frames = offline.FrameFile.open(str(tmp_path / "song.frames")).frames
+    assert frame_file.frame_rate == pytest.approx(22050 / 1024)
+    assert frames.shape == (reference.num_frames, 36 * 8, 3)
+    expected = []
+    count = reference.num_frames
+    for frame, now in zip(reference.frames(0, count), reference.times(0, count)):
+        data = frame
+        for node in reference._parallel + reference._sequential:
+            if isinstance(node, nodes.Normalizer):
+                data = node.normalizer.normalize(data, now)
+                continue
+            node.run(data)
+            data = node._output_buffer.pop().data
+        message = reference._output.renderer.render(data)
+        expected.append(np.frombuffer(message[-frames.shape[1] * 3 :], dtype="uint8"))
+    np.testing.assert_array_equal(frames.reshape(len(frames), -1), expected)
+
+
+def test_frame_file_rejects_other_files(tmp_path):
+    (tmp_path / "song.wav").write_bytes(b"RIFF" + bytes(64))
+
+    with pytest.raises(offline.OfflineError):
+        offline.FrameFile.open(str(tmp_path / "song.wav"))
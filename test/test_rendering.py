@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from audioviz import encoding, geometry, palettes, rendering
+
+
+def _renderer():
+    return rendering.StarRenderer("127.0.0.1", 9, led_per_beam=8, beams=4)
+
+
+def test_palette_switch_recolours_in_place():
+    renderer = _renderer()
+    pixels = renderer.render_pixels(np.full(4, 0.999))
+    cyan = pixels.copy()
+
+    renderer.set_palette({"colors": [[1, 0, 0], [0, 0, 1]], "gamma": 1})
+
+    assert renderer.render_pixels(np.full(4, 0.999)) is pixels
+    np.testing.assert_array_equal(cyan[:, 1], 0)
+    np.testing.assert_array_equal(pixels[:7], [[0, 76, 0]] * 7)
+    np.testing.assert_array_equal(pixels[-7:], [[0, 0, 76]] * 7)
+    np.testing.assert_allclose(
+        palettes.get("red-blue").band_colors(3), [[1, 0, 0], [0.5, 0, 0.5], [0, 0, 1]]
+    )
+
+
+def test_inline_palette_needs_colors():
+    with pytest.raises(ValueError, match="colors"):
+        palettes.get({"brightness": 0.5})
+
+
+def test_bars_fill_up_to_level():
+    renderer = rendering.StarRenderer(
+        "127.0.0.1",
+        9,
+        led_per_beam=4,
+        beams=1,
+        palette={"colors": [[1, 1, 1]], "gamma": 1},
+    )
+
+    pixels = renderer.render_pixels(np.array([5 / 8]))
+
+    np.testing.assert_array_equal(pixels, [[76] * 3, [76] * 3, [38] * 3, [0] * 3])
+
+
+def test_colour_table_size_is_guarded(monkeypatch):
+    layout = geometry.ring(36, 8)
+    renderer = rendering.StarRenderer("127.0.0.1", 9, 8, 36, layout=layout)
+
+    assert renderer._table[2].nbytes == 16 * 36 * (8 * 16 + 1) * 3
+    monkeypatch.setattr(rendering, "MAX_TABLE_BYTES", 2 ** 16)
+    with pytest.raises(ValueError, match="colour table"):
+        renderer.set_resolution(renderer.full_resolution * 2)
+
+
+def test_brightness_selects_precomputed_step():
+    renderer = _renderer()
+    values = np.full((2, 4), 0.999)
+    renderer.brightness = 0.5
+
+    block = renderer.render_block(values, brightness=np.array([1.0, 0.0]))
+
+    np.testing.assert_array_equal(block[1], 0)
+    assert 0 < renderer.render_pixels(values[0]).max() < block[0].max()
+
+
+def test_latest_frames_returns_two_newest():
+    frames = rendering.LatestFrames(4)
+    for index in range(6):
+        frames.publish(np.full(4, index), timestamp=index * 0.1)
+    previous, latest = np.empty(4), np.empty(4)
+
+    times = frames.read(previous, latest)
+
+    np.testing.assert_allclose(times, (0.4, 0.5))
+    np.testing.assert_array_equal(previous, 4)
+    np.testing.assert_array_equal(latest, 5)
+
+
+def test_output_clock_interpolates_and_extrapolates():
+    frames = rendering.LatestFrames(4)
+    frames.publish(np.zeros(4), timestamp=1.0)
+    frames.publish(np.ones(4), timestamp=1.1)
+    interpolating = rendering.OutputClock([_renderer()], frames)
+    extrapolating = rendering.OutputClock(
+        [_renderer()], frames, mode=rendering.OutputClock.EXTRAPOLATE, max_extrapolation=0.5
+    )
+
+    np.testing.assert_allclose(interpolating.blend(1.125), 0.25)
+    np.testing.assert_allclose(interpolating.blend(2.0), 1)
+    np.testing.assert_allclose(extrapolating.blend(1.125), 1.25)
+    np.testing.assert_allclose(extrapolating.blend(2.0), 1.5)
+
+
+def test_change_filter_suppresses_until_change_or_keepalive():
+    encoder = encoding.GRBEncoder(10)
+    change_filter = encoding.ChangeFilter(encoder, threshold=2, keepalive=1)
+    rgb = np.zeros((10, 3))
+
+    assert change_filter.filter(encoder.encode(0, rgb), now=0) is not None
+    rgb[3] = 0.004
+    assert change_filter.filter(encoder.encode(1, rgb), now=0.1) is None
+    assert change_filter.filter(encoder.encode(2, rgb), now=1.0) is not None
+    rgb[3] = 1
+    assert change_filter.filter(encoder.encode(3, rgb), now=1.1) is not None
+
+    assert change_filter.frames_suppressed == 1
+    assert change_filter.bytes_saved == 38
+
+
+def test_change_filter_sends_changed_spans():
+    encoder = encoding.GRBEncoder(10)
+    change_filter = encoding.ChangeFilter(encoder, keepalive=10, spans=True)
+    rgb = np.zeros((10, 3))
+    change_filter.filter(encoder.encode(0, rgb), now=0)
+    rgb[[2, 4, 8, 9]] = 1
+
+    message = change_filter.filter(encoder.encode(1, rgb), now=1)
+
+    header = 8
+    assert message[header : header + 4] == bytes([0, 2, 0, 3])
+    assert message[header + 4 + 9 : header + 8 + 9] == bytes([0, 8, 0, 2])
+    assert len(message) == header + 4 + 9 + 4 + 6
+
+
+def _apply_spans(shown, message, header=8):
+    position = header
+    while position < len(message):
+        start, count = encoding.ChangeFilter.SPAN_HEADER.unpack_from(message, position)
+        position += 4
+        pixels = np.frombuffer(message, "uint8", 3 * count, position)
+        shown[start : start + count] = pixels.reshape((count, 3))
+        position += 3 * count
+
+
+def test_change_filter_sends_slow_ramps_once_they_add_up():
+    encoder = encoding.GRBEncoder(6)
+    change_filter = encoding.ChangeFilter(encoder, threshold=2, keepalive=100, spans=True)
+    rgb = np.zeros((6, 3))
+    change_filter.filter(encoder.encode(0, rgb), now=0)
+    shown = encoder.pixels.copy()
+
+    for frame in range(1, 40):
+        rgb[0] = frame % 2
+        rgb[4] += 0.01
+        message = change_filter.filter(encoder.encode(frame, rgb), now=frame)
+        _apply_spans(shown, message)
+        lag = np.abs(shown.astype("int") - encoder.pixels)
+        assert lag.max() <= 2
+
+    assert shown[4].max() > 2
@@ -0,0 +1,112 @@
+import multiprocessing
+import time
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from audioviz import audio_tools, shared_audio, sources
+
+
+PERIOD_SIZE = 64
+STEP = 2 ** 16
+LENGTH = 512
+WRAP = 4096
+
+
+class RampSource(sources.PacedSource):
+    def __init__(self):
+        super().__init__(sample_rate=8000, period_size=PERIOD_SIZE, realtime=False)
+        self._next = 0
+
+    def next_period(self):
+        time.sleep(0.001)
+        values = np.arange(self._next, self._next + PERIOD_SIZE)
+        self._next += PERIOD_SIZE
+        return values * STEP * audio_tools.SAMPLE_SCALE
+
+
+def test_reader_sees_latest_window_from_capture():
+    name = f"audioviz-test-{uuid.uuid4().hex[:8]}"
+    capture = shared_audio.SharedAudioInput(name, source=RampSource())
+    reader = shared_audio.SharedAudioReader(name)
+    capture.start()
+    try:
+        written = reader.wait_for_samples(10 * PERIOD_SIZE, timeout=5)
+        window = reader.get_samples(100)
+        samples, position = reader.get_samples_since(written - 10)
+    finally:
+        capture.stop()
+        capture.join()
+        reader.close()
+
+    assert reader.sample_rate == 8000
+    assert written >= 10 * PERIOD_SIZE
+    np.testing.assert_array_equal(np.diff(window), STEP * audio_tools.SAMPLE_SCALE)
+    assert len(samples) == position - written + 10
+    np.testing.assert_array_equal(np.diff(samples), STEP * audio_tools.SAMPLE_SCALE)
+
+
+def test_reads_retry_when_a_write_overlaps():
+    name = f"audioviz-test-{uuid.uuid4().hex[:8]}"
+    size = shared_audio.HEADER_FIELDS * 8 + 2 * LENGTH * 4
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    ring = shared_audio.SharedRingBuffer(shm, LENGTH)
+    ring.write(np.arange(PERIOD_SIZE))
+    attempts = []
+
+    def read(written):
+        attempts.append(written)
+        if len(attempts) == 1:
+            ring.write(np.arange(PERIOD_SIZE, 2 * PERIOD_SIZE))
+        return ring.read(PERIOD_SIZE)
+
+    try:
+        window = ring.consistent(read)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    assert attempts == [PERIOD_SIZE, 2 * PERIOD_SIZE]
+    np.testing.assert_array_equal(window, np.arange(PERIOD_SIZE, 2 * PERIOD_SIZE))
+
+
+def _write_ramps(name, periods):
+    shm = shared_memory.SharedMemory(name=name)
+    ring = shared_audio.SharedRingBuffer(shm, LENGTH)
+    for period in range(periods):
+        ring.write(np.arange(period * PERIOD_SIZE, (period + 1) * PERIOD_SIZE) % WRAP)
+        if period % 50 == 0:
+            ring.clear()
+    shm.close()
+
+
+def test_concurrent_reads_never_see_torn_windows():
+    name = f"audioviz-test-{uuid.uuid4().hex[:8]}"
+    size = shared_audio.HEADER_FIELDS * 8 + 2 * LENGTH * 4
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    ring = shared_audio.SharedRingBuffer(shm, LENGTH)
+    writer = multiprocessing.get_context("fork").Process(
+        target=_write_ramps, args=(name, 5000)
+    )
+    writer.start()
+    checked = 0
+    try:
+        while writer.is_alive() or not checked:
+            window, written = ring.consistent(
+                lambda written: (ring.read(LENGTH // 2), written)
+            )
+            if not written or not window.any():
+                continue
+            tail = window[-1]
+            assert tail == (written - 1) % WRAP
+            ramp = np.arange(tail - LENGTH // 2 + 1, tail + 1) % WRAP
+            cleared = window == 0
+            np.testing.assert_array_equal(window[~cleared], ramp[~cleared])
+            checked += 1
+    finally:
+        writer.join()
+        shm.close()
+        shm.unlink()
+    assert writer.exitcode == 0
+    assert checked
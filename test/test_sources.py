@@ -0,0 +1,70 @@
+import wave
+
+import numpy as np
+import pytest
+
+from audioviz import audio_tools, sources
+
+
+def _write_wave(path, samples, sample_rate=8000):
+    with wave.open(str(path), "wb") as file_:
+        file_.setnchannels(2)
+        file_.setsampwidth(2)
+        file_.setframerate(sample_rate)
+        file_.writeframes(np.stack([samples, samples], axis=1).astype("<i2").tobytes())
+
+
+def test_replay_source_decodes_wave_periods(tmp_path):
+    samples = np.arange(-500, 500) * 32
+    _write_wave(tmp_path / "ramp.wav", samples)
+    source = sources.ReplaySource(
+        str(tmp_path / "ramp.wav"), period_size=256, realtime=False, loop=False
+    )
+
+    length, raw_data = source.read()
+
+    assert source.sample_rate == 8000
+    assert length == 256
+    np.testing.assert_allclose(
+        audio_tools.decode_s32_le(raw_data), samples[:256] / 2 ** 15
+    )
+
+
+def test_replay_source_stops_at_end_without_loop(tmp_path):
+    _write_wave(tmp_path / "short.wav", np.full(300, 3200))
+    source = sources.ReplaySource(
+        str(tmp_path / "short.wav"), period_size=256, realtime=False, loop=False
+    )
+
+    source.read()
+    length, raw_data = source.read()
+    with pytest.raises(EOFError):
+        source.read()
+
+    tail = audio_tools.decode_s32_le(raw_data)
+    assert length == 256
+    np.testing.assert_allclose(tail[:44], 3200 / 2 ** 15)
+    np.testing.assert_array_equal(tail[44:], 0)
+
+
+def test_replay_source_returns_last_full_period(tmp_path):
+    _write_wave(tmp_path / "exact.wav", np.zeros(512))
+    source = sources.ReplaySource(
+        str(tmp_path / "exact.wav"), period_size=256, realtime=False, loop=False
+    )
+
+    assert source.read()[0] == 256
+    assert source.read()[0] == 256
+    with pytest.raises(EOFError):
+        source.read()
+
+
+@pytest.mark.parametrize("name", sorted(sources.SYNTHETIC_SOURCES))
+def test_synthetic_sources_stay_in_range(name):
+    source = sources.open_source(name, period_size=512, realtime=False)
+
+    for _ in range(20):
+        length, raw_data = source.read()
+        samples = audio_tools.decode_s32_le(raw_data)
+        assert length == len(samples) == 512
+        assert np.all(np.abs(samples) <= 1)
@@ -0,0 +1,71 @@
+import queue
+import signal
+import time
+
+import numpy as np
+import pytest
+
+from audioviz import nodes, stages
+
+
+def test_array_queue_drops_oldest_when_full():
+    array_queue = stages.ArrayQueue((2,), "float64", size=2)
+    out = np.empty(2)
+    for value in range(3):
+        array_queue.put(np.full(2, value), capture_time=value)
+
+    assert array_queue.get(out) == 1
+    np.testing.assert_array_equal(out, 1)
+    assert array_queue.get(out) == 2
+    assert array_queue.dropped == 1
+    with pytest.raises(queue.Empty):
+        array_queue.get(out, timeout=0.01)
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_split_stages_pass_frames_through(processes):
+    inbound = stages.ArrayQueue((4,), "float64", size=8, shared=processes)
+    outbound = stages.ArrayQueue((4,), "float64", size=8, shared=processes)
+    chain = (
+        stages.QueueSource("in", array_queue=inbound)
+        | nodes.Square("square")
+        | nodes.Shift("shift", minimum=1, maximum=3)
+        | stages.QueueSink("out", array_queue=outbound)
+    )
+    staged = stages.split(chain, ["square", "shift"], processes=processes)
+    for stage in staged:
+        stage.start()
+    try:
+        out = np.empty(4)
+        for value in (1.0, 2.0, 3.0):
+            inbound.put(np.full(4, value))
+            outbound.get(out, timeout=5)
+            np.testing.assert_array_equal(out, value ** 2 * 2 + 1)
+    finally:
+        for stage in staged:
+            stage.stop()
+        for stage in staged:
+            stage.join(2)
+
+    assert len(staged) == 3
+
+
+class _Stuck(nodes.PlottableNode):
+    def run(self, data):
+        time.sleep(60)
+
+
+def test_joining_a_stuck_process_stage_terminates_it():
+    inbound = stages.ArrayQueue((4,), "float64", size=2, shared=True)
+    chain = stages.QueueSource("in", array_queue=inbound) | _Stuck("stuck")
+    staged = stages.split(chain, ["stuck"], processes=True)
+    for stage in staged:
+        stage.start()
+    inbound.put(np.zeros(4))
+    time.sleep(0.2)
+    for stage in staged:
+        stage.stop()
+
+    assert staged[0].join(2)
+    assert staged[1].join(0.5)
+    assert staged[1]._worker.exitcode == -signal.SIGTERM
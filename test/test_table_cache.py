@@ -0,0 +1,40 @@
+import numpy as np
+
+from audioviz import table_cache
+
+
+def test_tables_are_computed_once_per_parameters():
+    calls = []
+
+    def compute(samples):
+        calls.append(samples)
+        return np.hamming(samples)
+
+    first = table_cache.cached("hamming", compute, samples=64)
+    second = table_cache.cached("hamming", compute, samples=64)
+    other = table_cache.cached("hamming", compute, samples=32)
+
+    assert calls == [64, 32]
+    np.testing.assert_array_equal(first, np.hamming(64))
+    np.testing.assert_array_equal(second, first)
+    assert other.shape == (32,)
+    assert not second.flags.writeable
+
+
+def test_array_parameters_are_part_of_the_key():
+    assert table_cache.key("a", frequencies=np.arange(4.0)) != table_cache.key(
+        "a", frequencies=np.arange(1.0, 5.0)
+    )
+
+
+def test_editing_the_function_is_part_of_the_key():
+    def window(samples):
+        return np.hamming(samples)
+
+    first = table_cache.key("window", window, samples=8)
+
+    def window(samples):  # noqa: F811
+        return np.hanning(samples)
+
+    assert table_cache.key("window", window, samples=8) != first
+    assert table_cache.key("window", np.hamming, samples=8) != first
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from audioviz import config, taps
+
+
+def test_recorder_appends_rows_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(taps, "BLOCK_ROWS", 4)
+    clock = taps.VirtualClock()
+    recorder = taps.TapRecorder(str(tmp_path), streams=["kept"], clock=clock)
+    for frame in range(10):
+        clock.now = frame / 10
+        recorder.send_np_array("kept", np.full(3, frame))
+        recorder.send_np_array("ignored", np.zeros(3))
+    recorder.send_np_array("kept", np.zeros(5))
+
+    times, values = taps.TapLog(str(tmp_path)).read("kept")
+    np.testing.assert_allclose(times, np.arange(10) / 10)
+    np.testing.assert_array_equal(values[:, 0], np.arange(10))
+    assert recorder.skipped == 1
+    recorder.close()
+    assert len(taps.TapLog(str(tmp_path)).read("kept")[1]) == 10
+    with pytest.raises(taps.TapError):
+        taps.TapLog(str(tmp_path)).read("ignored")
+
+
+def test_replay_is_deterministic(tmp_path):
+    pipeline_config = config.PipelineConfig.from_dict(
+        {
+            "constants": {"window_size_sec": 0.05},
+            "pipeline": [
+                {"type": "AudioGenerator", "name": "mic", "samples": "$window_samples"},
+                {"type": "Normalizer", "name": "normalized", "falloff": 2},
+                {"type": "Square", "name": "square"},
+            ],
+        }
+    )
+    clock = taps.VirtualClock()
+    recorder = taps.TapRecorder(str(tmp_path / "live"), clock=clock)
+    random = np.random.default_rng(0)
+    for frame in range(50):
+        clock.now = frame * 0.05
+        recorder.send_np_array("mic", random.uniform(-1, 1, 1102) * (50 - frame))
+    recorder.close()
+
+    first = taps.Replay(
+        pipeline_config,
+        taps.TapLog(str(tmp_path / "live")),
+        "mic",
+        record=str(tmp_path / "replayed"),
+    ).run()
+    second = taps.Replay(
+        pipeline_config, taps.TapLog(str(tmp_path / "replayed")), "mic"
+    ).run()
+
+    assert [report.name for report in first] == ["normalized", "square"]
+    assert all(report.frames == 50 for report in first)
+    assert all(report.compared == 50 for report in second)
+    assert all(report.max_difference == 0 for report in second)